@@ -1,5 +1,72 @@
-from pyb import I2C
+from pyb import I2C, Timer
+from array import array
+from time import ticks_us, ticks_ms, ticks_diff, sleep_ms
+import math
 import struct
+import micropython
+
+## Operating mode in which the IMU's settings and calibration can be changed
+CONFIG_MODE = 0x00
+
+## Fusion mode using the accelerometer and gyro only
+IMU_MODE = 0x08
+
+## Fusion mode using the accelerometer, gyro and magnetometer
+NDOF_MODE = 0x0C
+
+## Time allowed for the IMU to switch operating modes, in milliseconds
+MODE_SWITCH_MS = 20
+
+## Time allowed for the IMU to restart after a reset, in milliseconds
+RESET_MS = 700
+
+## Longest time to wait for the IMU to calibrate itself live, in milliseconds
+CALIBRATION_LIMIT_MS = 60000
+
+## Number of bytes in the IMU's calibration profile
+CALIBRATION_SIZE = 22
+
+## Default file in which the IMU's calibration profile is kept
+CALIBRATION_FILE = 'imu_cal.bin'
+
+## Field flags for BNO055.read_block(), which can be or'ed together
+GYRO = 0x01
+EULER = 0x02
+QUAT = 0x04
+LIA = 0x08
+
+## Register address and length of each field's data, in the order they sit
+#  in the IMU's register map
+FIELDS = ((GYRO, 0x14, 6), (EULER, 0x1A, 6), (QUAT, 0x20, 8), (LIA, 0x28, 6))
+
+## First register of the block which read_block() reads from
+BLOCK_START = 0x14
+
+## Number of registers from BLOCK_START to the end of the linear acceleration
+BLOCK_SIZE = 0x2E - BLOCK_START
+
+## Indices of the values in the array returned by read_block()
+GYRO_X = 0
+GYRO_Y = 1
+YAW_RATE = 2
+HEADING = 3
+ROLL = 4
+PITCH = 5
+QUAT_W = 6
+QUAT_X = 7
+QUAT_Y = 8
+QUAT_Z = 9
+LIA_X = 10
+LIA_Y = 11
+LIA_Z = 12
+UNWRAPPED_HEADING = 13
+
+## Number of values in the array returned by read_block()
+NUM_VALUES = 14
+
+## Largest tangent of half the turn between quaternion readings which is
+#  worked out with a series instead of math.atan2()
+SERIES_LIMIT = 0.1
 
 class BNO055:
     '''!@brief    A driver class for the BNO055 IMU.
@@ -14,15 +81,44 @@ class BNO055:
         '''
         self.i2c = I2C(1, I2C.CONTROLLER, baudrate = 400000)
         self.BNO055_ADDR = 0x28
+        self.block = bytearray(BLOCK_SIZE)
+        self.block_view = memoryview(self.block)
+        self.spans = {}
+        self.data = array('f', [0.0] * NUM_VALUES)
+        self.sample_timer = None
+        self.last_quat = None
+        self.unwrapped_heading = 0.0
+        self.mode = CONFIG_MODE
+        self.boot_time = 0
+        self.profile_written = False
+        self.profile_accepted = False
+        self.calibration_time = None
         
     def set_mode(self, mode):
         '''!@brief    Set the operating mode for the IMU
             @details  This method sets the operating mode for the IMU, which
                       can be one of various "fusion" modes that the 
-                      BNO055 is capable of.
+                      BNO055 is capable of. It waits long enough for the
+                      IMU to finish switching modes.
             @param    mode  Register address of chosen operating mode
         '''
         self.i2c.mem_write(mode, self.BNO055_ADDR, 0x3D)
+        self.mode = mode
+        sleep_ms(MODE_SWITCH_MS)
+
+    def switch_mode(self, mode):
+        '''!@brief    Generator which sets the operating mode without blocking.
+            @details  This does the same as set_mode(), but yields to the
+                      scheduler instead of sleeping while the IMU switches
+                      modes. It is meant to be run with @c yield @c from
+                      inside a task.
+            @param    mode  Register address of chosen operating mode
+        '''
+        self.i2c.mem_write(mode, self.BNO055_ADDR, 0x3D)
+        self.mode = mode
+        start = ticks_ms()
+        while ticks_diff(ticks_ms(), start) < MODE_SWITCH_MS:
+            yield
         
     def read_calibration_status(self):
         '''!@brief    Reads and returns calibration status of IMU sensors
@@ -49,6 +145,146 @@ class BNO055:
             @param    calib_coeff   A ByteArray with Calibration Data
         '''
         self.i2c.mem_write(calib_coeff, self.BNO055_ADDR, 0x55)
+
+    def calibrated(self):
+        '''!@brief    Checks whether the sensors used by the current mode are calibrated.
+            @details  The gyro and accelerometer must be fully calibrated, and
+                      so must the magnetometer in modes which use it.
+            @return   True if calibration is complete
+        '''
+        sys_calib, gyro_calib, accel_calib, mag_calib = self.read_calibration_status()
+        if gyro_calib < 3 or accel_calib < 3:
+            return False
+        return mag_calib == 3 or self.mode < 0x09
+
+    def save_calibration(self, filename=CALIBRATION_FILE):
+        '''!@brief    Writes the IMU's calibration profile to a file.
+            @details  The profile can only be read in CONFIG mode, so the IMU
+                      is switched there and back, which takes about 40 ms.
+            @param    filename  Name of the file to write
+        '''
+        mode = self.mode
+        self.set_mode(CONFIG_MODE)
+        profile = self.read_calibration_coefficients()
+        self.set_mode(mode)
+        with open(filename, 'wb') as file:
+            file.write(profile)
+
+    def read_profile(self, filename=CALIBRATION_FILE):
+        '''!@brief    Reads a saved calibration profile from a file.
+            @param    filename  Name of the file to read
+            @return   The profile, or None if there is no usable file
+        '''
+        try:
+            with open(filename, 'rb') as file:
+                profile = file.read()
+        except OSError:
+            return None
+        return profile if len(profile) == CALIBRATION_SIZE else None
+
+    def load_calibration(self, filename=CALIBRATION_FILE, mode=NDOF_MODE):
+        '''!@brief    Writes a saved calibration profile to the IMU, then starts fusion.
+            @details  The profile can only be written in CONFIG mode, so it
+                      is written there before switching to @c mode. Whether
+                      the IMU accepted it only shows once its calibration
+                      status comes up; see boot().
+            @param    filename  Name of the file to read
+                      mode      Fusion mode to run in afterwards
+            @return   True if a profile was written, False if there is no
+                      usable file, in which case the mode is still set
+        '''
+        profile = self.read_profile(filename)
+        self.set_mode(CONFIG_MODE)
+        if profile is not None:
+            self.write_calibration_coefficients(profile)
+        self.set_mode(mode)
+        return profile is not None
+
+    def boot(self, mode=NDOF_MODE, filename=CALIBRATION_FILE):
+        '''!@brief    Generator which starts fusion from a saved calibration if there is one.
+            @details  This is meant to be run with @c yield @c from inside a
+                      task. The saved profile is written in CONFIG mode and
+                      then fusion mode is entered, yielding while the IMU
+                      switches modes, so it takes about two MODE_SWITCH_MS.
+                      Readings can be taken as soon as it returns, while
+                      calibrate() follows the calibration in the background.
+            @param    mode      Fusion mode to run in
+                      filename  Name of the calibration profile file
+            @return   True if a saved profile was written
+        '''
+        self.boot_time = ticks_ms()
+        self.profile_accepted = False
+        self.calibration_time = None
+        profile = self.read_profile(filename)
+        yield from self.switch_mode(CONFIG_MODE)
+        if profile is not None:
+            self.write_calibration_coefficients(profile)
+        yield from self.switch_mode(mode)
+        self.profile_written = profile is not None
+        return self.profile_written
+
+    def calibrate(self, filename=CALIBRATION_FILE, timeout=1000, limit=CALIBRATION_LIMIT_MS):
+        '''!@brief    Generator which follows the IMU's calibration after boot().
+            @details  Each step reads the calibration status once, so this can
+                      be stepped from a task's loop while readings go on. If
+                      boot() wrote a profile and the IMU shows itself fully
+                      calibrated within @c timeout milliseconds, the profile
+                      is taken as accepted. Otherwise the IMU is reset to
+                      clear the bad profile, with timed sampling paused until
+                      it's back in fusion mode, and it calibrates itself live,
+                      which needs the robot to be moved around. That is
+                      waited for for at most @c limit milliseconds; once it's
+                      done the new profile is saved for next time, again with
+                      sampling paused while the IMU is in CONFIG mode.
+
+                      The time from the start of boot() to full calibration
+                      is kept in @c calibration_time, which stays None if
+                      the limit is reached, and whether the saved profile was
+                      used in @c profile_accepted.
+            @param    filename  Name of the calibration profile file
+                      timeout   Time to wait for a saved profile to be
+                                accepted, in milliseconds
+                      limit     Time to wait for live calibration, in
+                                milliseconds
+            @return   The time taken to calibrate in milliseconds, or None
+        '''
+        mode = self.mode
+        start = ticks_ms()
+        if self.profile_written:
+            while ticks_diff(ticks_ms(), start) < timeout:
+                if self.calibrated():
+                    self.profile_accepted = True
+                    break
+                yield
+            if not self.profile_accepted:
+                # Reset the IMU to clear the rejected profile, then start
+                # calibrating from scratch
+                yield from self.pause_sampling()
+                self.i2c.mem_write(0x20, self.BNO055_ADDR, 0x3F)
+                self.mode = CONFIG_MODE
+                reset_time = ticks_ms()
+                while ticks_diff(ticks_ms(), reset_time) < RESET_MS:
+                    yield
+                yield from self.switch_mode(mode)
+                self.resume_sampling()
+                start = ticks_ms()
+
+        if not self.profile_accepted:
+            while not self.calibrated():
+                if ticks_diff(ticks_ms(), start) >= limit:
+                    return None
+                yield
+        self.calibration_time = ticks_diff(ticks_ms(), self.boot_time)
+        if not self.profile_accepted:
+            # The profile can only be read in CONFIG mode
+            yield from self.pause_sampling()
+            yield from self.switch_mode(CONFIG_MODE)
+            profile = self.read_calibration_coefficients()
+            yield from self.switch_mode(mode)
+            self.resume_sampling()
+            with open(filename, 'wb') as file:
+                file.write(profile)
+        return self.calibration_time
         
     def read_euler_angles(self):
         '''!@brief    Reads Euler angles (heading, roll, pitch) from the IMU.
@@ -81,4 +317,260 @@ class BNO055:
         '''
         yaw_rate = self.i2c.mem_read(2, self.BNO055_ADDR, 0x18)
         (omega_z,) = struct.unpack('<h', yaw_rate)
-        return omega_z/900.0
\ No newline at end of file
+        return omega_z/900.0
+
+    def read_quaternion(self):
+        '''!@brief Reads the orientation quaternion from the IMU.
+            @return A tuple containing the w, x, y and z components of the
+                    unit quaternion.
+        '''
+        quat = self.i2c.mem_read(8, self.BNO055_ADDR, 0x20)
+        w, x, y, z = struct.unpack('<hhhh', quat)
+        return w/16384.0, x/16384.0, y/16384.0, z/16384.0
+
+    def unwrap(self, w, x, y, z):
+        '''!@brief    Updates the unwrapped heading from a new quaternion reading.
+            @details  The heading is kept in degrees clockwise like the Euler
+                      heading, but carries on past 360 and below 0 instead of
+                      jumping, so it can be used directly as a feedback signal.
+                      The first reading sets it from the quaternion with one
+                      call to math.atan2(). After that, the turn about the
+                      vertical since the previous reading is found from the
+                      quaternion which takes one to the other,
+                      @code
+                          q * conj(q_last) = (dw, ..., ..., dz),  turn = 2 * atan(dz / dw)
+                      @endcode
+                      and for the small turns between readings the arctangent
+                      is worked out with a short series, so no trig is needed.
+                      The turn is counterclockwise, so it's taken off the
+                      heading. Since consecutive turns are differences of the
+                      same readings, rounding in the readings doesn't build up.
+            @param    w, x, y, z  Components of the unit quaternion
+            @return   The unwrapped heading in degrees
+        '''
+        last = self.last_quat
+        if last is None:
+            self.last_quat = array('f', (w, x, y, z))
+            self.unwrapped_heading = -math.degrees(2 * math.atan2(z, w)) % 360
+            return self.unwrapped_heading
+        lw = last[0]
+        lx = last[1]
+        ly = last[2]
+        lz = last[3]
+        dw = w * lw + x * lx + y * ly + z * lz
+        dz = z * lw - w * lz - x * ly + y * lx
+        if dw < 0:
+            # q and -q are the same orientation
+            dw = -dw
+            dz = -dz
+        if -SERIES_LIMIT * dw < dz < SERIES_LIMIT * dw:
+            t = dz / dw
+            t2 = t * t
+            turn = 2 * t * (1 - t2 * (0.3333333 - 0.2 * t2))
+        else:
+            turn = 2 * math.atan2(dz, dw)
+        last[0] = w
+        last[1] = x
+        last[2] = y
+        last[3] = z
+        self.unwrapped_heading -= turn * 57.29578
+        return self.unwrapped_heading
+
+    def read_block(self, fields=GYRO | EULER):
+        '''!@brief    Reads several kinds of data from the IMU in one transfer.
+            @details  The registers from the first to the last requested field
+                      are read in a single I2C transaction into a buffer which
+                      is kept from one call to the next, then each requested
+                      field is decoded into the array returned. Values of
+                      fields which weren't requested are left as they were.
+                      The array holds, at the indices given by the constants
+                      in this module, the angular velocity in rad/s, the
+                      heading, roll and pitch in degrees, the unit quaternion,
+                      the linear acceleration in m/s^2 and, when the
+                      quaternion is read, the unwrapped heading kept by
+                      unwrap().
+            @param    fields  GYRO, EULER, QUAT and LIA flags or'ed together
+            @return   The array of values, which is reused by every call
+        '''
+        span = self.spans.get(fields)
+        if span is None:
+            # Work out the registers to read the first time these fields are asked for
+            wanted = [field for field in FIELDS if field[0] & fields]
+            first = wanted[0][1] - BLOCK_START
+            last = wanted[-1][1] + wanted[-1][2] - BLOCK_START
+            span = (self.block_view[first:last], first + BLOCK_START)
+            self.spans[fields] = span
+        self.i2c.mem_read(span[0], self.BNO055_ADDR, span[1])
+
+        block = self.block
+        data = self.data
+        if fields & GYRO:
+            data[0], data[1], data[2] = struct.unpack_from('<hhh', block, 0x14 - BLOCK_START)
+            for i in range(0, 3):
+                data[i] /= 900.0
+        if fields & EULER:
+            data[3], data[4], data[5] = struct.unpack_from('<hhh', block, 0x1A - BLOCK_START)
+            for i in range(3, 6):
+                data[i] /= 16.0
+        if fields & QUAT:
+            data[6], data[7], data[8], data[9] = struct.unpack_from('<hhhh', block, 0x20 - BLOCK_START)
+            for i in range(6, 10):
+                data[i] /= 16384.0
+            data[13] = self.unwrap(data[6], data[7], data[8], data[9])
+        if fields & LIA:
+            data[10], data[11], data[12] = struct.unpack_from('<hhh', block, 0x28 - BLOCK_START)
+            for i in range(10, 13):
+                data[i] /= 100.0
+        return data
+
+    def start_sampling(self, timer=7, freq=100, size=16, fields=GYRO | EULER):
+        '''!@brief    Starts reading the IMU at a fixed rate from a timer.
+            @details  I2C transfers can't be made inside an interrupt, so the
+                      timer's interrupt only schedules a read with
+                      micropython.schedule(), which runs it as soon as the
+                      interrupted code reaches a safe point. Each read stores
+                      its values and a ticks_us() timestamp in a ring buffer
+                      of @c size samples. @c data always holds the freshest
+                      sample, and older ones can be taken from the ring with
+                      get_sample() without blocking.
+
+                      When the ring is full the oldest unread sample is
+                      overwritten and @c overflows is counted up. If a read
+                      is still waiting to run when the timer fires again, that
+                      tick is skipped and counted in @c missed.
+            @param    timer   Number of the timer which paces the reads
+                      freq    Number of reads per second
+                      size    Number of samples kept in the ring buffer
+                      fields  GYRO, EULER, QUAT and LIA flags or'ed together
+        '''
+        self.stop_sampling()
+        self.sample_fields = fields
+        self.sample_size = size
+        self.sample_times = array('L', [0] * size)
+        self.samples = array('f', [0.0] * (size * NUM_VALUES))
+        self.sample_time = 0
+        self.written = 0
+        self.taken = 0
+        self.overflows = 0
+        self.missed = 0
+        self.pending = False
+        # Bound methods are made once here, as the interrupt can't allocate them
+        self.sample_ref = self.sample
+        self.sample_timer = Timer(timer, freq=freq)
+        self.sample_timer.callback(self.tick)
+
+    def stop_sampling(self):
+        '''!@brief    Stops the timed reads started by start_sampling().'''
+        if self.sample_timer is not None:
+            self.sample_timer.callback(None)
+            self.sample_timer = None
+
+    def pause_sampling(self):
+        '''!@brief    Generator which holds off the timed reads.
+            @details  The timer's interrupt is turned off, then this yields
+                      until any read which was already scheduled has run, so
+                      the IMU can be reset or put in CONFIG mode without a
+                      read being made meanwhile.
+        '''
+        if self.sample_timer is not None:
+            self.sample_timer.callback(None)
+            while self.pending:
+                yield
+
+    def resume_sampling(self):
+        '''!@brief    Starts the timed reads again after pause_sampling().'''
+        if self.sample_timer is not None:
+            self.sample_timer.callback(self.tick)
+
+    def tick(self, timer):
+        '''!@brief    Timer interrupt handler which schedules a read.'''
+        if self.pending:
+            self.missed += 1
+            return
+        self.pending = True
+        try:
+            micropython.schedule(self.sample_ref, 0)
+        except RuntimeError:
+            # The schedule queue is full
+            self.pending = False
+            self.missed += 1
+
+    def sample(self, arg):
+        '''!@brief    Reads the IMU and stores the sample in the ring buffer.'''
+        stamp = ticks_us()
+        data = self.read_block(self.sample_fields)
+        written = self.written
+        slot = written % self.sample_size
+        base = slot * NUM_VALUES
+        samples = self.samples
+        for i in range(NUM_VALUES):
+            samples[base + i] = data[i]
+        self.sample_times[slot] = stamp
+        self.sample_time = stamp
+        if written - self.taken >= self.sample_size:
+            self.overflows += 1
+        self.written = written + 1
+        self.pending = False
+
+    def available(self):
+        '''!@brief    Counts the samples in the ring buffer which haven't been taken.
+            @return   The number of unread samples
+        '''
+        return min(self.written - self.taken, self.sample_size)
+
+    def get_sample(self, out):
+        '''!@brief    Takes the oldest unread sample from the ring buffer.
+            @details  Reads don't disable interrupts. If a new sample is
+                      written over the one being copied while it's being
+                      copied, the copy is thrown away and made again from the
+                      oldest sample left.
+            @param    out  An array of at least NUM_VALUES floats which
+                           receives the sample's values
+            @return   The ticks_us() time of the sample, or None if there are
+                      no unread samples
+        '''
+        size = self.sample_size
+        samples = self.samples
+        while True:
+            written = self.written
+            taken = self.taken
+            if written == taken:
+                return None
+            if written - taken > size:
+                taken = written - size
+            slot = taken % size
+            base = slot * NUM_VALUES
+            for i in range(NUM_VALUES):
+                out[i] = samples[base + i]
+            stamp = self.sample_times[slot]
+            if self.written - taken <= size:
+                self.taken = taken + 1
+                return stamp
+
+    def latest(self, out):
+        '''!@brief    Copies the newest sample from the ring buffer in one piece.
+            @details  @c data is filled in field by field as each read is
+                      decoded, so values read from it one at a time may come
+                      from two different samples. This copies every value of
+                      the newest complete sample instead, making the copy
+                      again if a read was stored over it meanwhile. Samples
+                      aren't taken from the ring, so get_sample() still sees
+                      them.
+            @param    out  An array of at least NUM_VALUES floats which
+                           receives the sample's values
+            @return   The ticks_us() time of the sample, or None if no sample
+                      has been read yet
+        '''
+        size = self.sample_size
+        samples = self.samples
+        while True:
+            written = self.written
+            if written == 0:
+                return None
+            slot = (written - 1) % size
+            base = slot * NUM_VALUES
+            for i in range(NUM_VALUES):
+                out[i] = samples[base + i]
+            stamp = self.sample_times[slot]
+            if self.written - written < size:
+                return stamp
\ No newline at end of file
@@ -1,5 +1,32 @@
 # QTR-MD-6A
-from pyb import Pin, ADC
+from pyb import Pin, ADC, Timer
+from array import array
+from time import ticks_us, ticks_ms, ticks_diff, sleep_ms
+import micropython
+
+## Full scale of the normalized readings kept by QTRArray, standing for 1.0
+NORM_SCALE = 1024
+
+## Oversampling filter which averages the burst of samples from each sensor
+MEAN = 0
+
+## Oversampling filter which takes the median of each sensor's burst of samples
+MEDIAN = 1
+
+## Number of fractional bits in the per-sensor scale factors used by QTRArray
+SCALE_BITS = 16
+
+## Default file in which QTRArray keeps its calibration
+CALIBRATION_FILE = 'qtr_cal.bin'
+
+## Centroid mode which averages the positions of sensors above the threshold
+BINARY = 0
+
+## Centroid mode which weights every sensor's position by its normalized reading
+ANALOG = 1
+
+## Centroid mode which fits a parabola through the darkest sensor and its neighbors
+PARABOLIC = 2
 
 sensor_pins = [
     Pin(Pin.cpu.A4),
@@ -60,4 +87,299 @@ def compute_centroid(values):
         return None  # No line detected
 
     # Return the centroid position
-    return sum_product / sum_values
\ No newline at end of file
+    return sum_product / sum_values
+
+class QTRArray:
+    '''!@brief    A line sensor array read without allocating memory.
+        @details  The ADC objects are created once, raw readings go into a
+                  preallocated array, and normalization, thresholding and the
+                  centroid are computed in place using integers, with the
+                  sensor positions worked out ahead of time. Only the returned
+                  centroid is a new object. Normalized readings are scaled so
+                  that NORM_SCALE stands for 1.0.
+
+                  With @c oversample greater than 1, each read takes a timed
+                  burst of that many samples from every sensor in one call to
+                  ADC.read_timed_multi() and filters each sensor's burst down
+                  to one reading. This costs about @c oversample divided by
+                  @c sample_freq seconds per read; the time taken by the latest
+                  read is kept in @c latency_us.
+
+                  The centroid can be found in one of three modes. @c BINARY
+                  averages the positions of the sensors above the threshold,
+                  which gives only a few distinct positions. @c ANALOG weights
+                  each sensor's position by how far its reading is above
+                  @c floor, and @c PARABOLIC interpolates between the darkest
+                  sensor and its neighbors; both resolve positions between
+                  sensors. They work best once set_calibration() has given
+                  each sensor its own white and black levels; until then
+                  each frame is normalized against its own minimum and maximum.
+    '''
+    def __init__(self, pins=sensor_pins, threshold=0.85, spacing=0.315,
+                 oversample=1, sample_freq=20000, filter=MEAN, timer=6,
+                 mode=BINARY, floor=0.2):
+        '''!@brief    Sets up the ADCs and buffers for a line sensor array.
+            @param    pins         The pins of the sensors, in order across the array
+                      threshold    Normalized reading above which a sensor sees the line
+                      spacing      Distance between adjacent sensors in inches
+                      oversample   Number of samples taken from each sensor per read
+                      sample_freq  Rate in Hz at which burst samples are taken
+                      filter       MEAN or MEDIAN, how each burst is reduced
+                      timer        Number of the timer which paces the bursts
+                      mode         BINARY, ANALOG or PARABOLIC centroid
+                      floor        Normalized reading below which a sensor is
+                                   ignored by the ANALOG centroid
+        '''
+        num_sensors = len(pins)
+        self.num_sensors = num_sensors
+        self.adcs = [ADC(pin) for pin in pins]
+        self.raw = array('H', [0] * num_sensors)
+        self.oversample = oversample
+        self.filter = filter
+        self.latency_us = 0
+        if oversample > 1:
+            self.burst_adcs = tuple(self.adcs)
+            self.bursts = tuple(array('H', [0] * oversample) for _ in range(num_sensors))
+            self.burst_timer = Timer(timer, freq=sample_freq)
+        self.values = array('H', [0] * num_sensors)
+        # Positions in units of half the sensor spacing, which are whole numbers
+        self.weights = array('h', [2 * i - (num_sensors - 1) for i in range(num_sensors)])
+        self.half_spacing = spacing / 2
+        self.mode = mode
+        self.floor = int(floor * NORM_SCALE)
+        self.white = array('H', [0] * num_sensors)
+        self.black = array('H', [0] * num_sensors)
+        self.scale = array('L', [0] * num_sensors)
+        self.calibrated = False
+        self.set_threshold(threshold)
+
+    def set_calibration(self, white, black):
+        '''!@brief    Sets the raw reading of each sensor over white and over black.
+            @details  Once set, each sensor is normalized against its own levels
+                      rather than against the other sensors in the same frame.
+            @param    white  Sequence of raw readings over the background
+                      black  Sequence of raw readings over the line
+        '''
+        for i in range(self.num_sensors):
+            self.white[i] = white[i]
+            self.black[i] = max(black[i], white[i] + 1)
+        self._update_scale()
+
+    def _update_scale(self):
+        '''!@brief    Precomputes the factor which normalizes each sensor's reading.'''
+        for i in range(self.num_sensors):
+            self.scale[i] = (NORM_SCALE << SCALE_BITS) // (self.black[i] - self.white[i])
+        self.calibrated = True
+
+    def calibrate(self, duration=5000, period=10):
+        '''!@brief    Records each sensor's white and black levels.
+            @details  While this runs the array should be swept back and forth
+                      over the line, by hand or by turning the robot, so every
+                      sensor sees both the line and the background. This method
+                      blocks, so it is meant to be run before the scheduler starts.
+            @param    duration  How long to record for, in milliseconds
+                      period    Time between samples, in milliseconds
+        '''
+        for i in range(self.num_sensors):
+            self.white[i] = 0xFFFF
+            self.black[i] = 0
+        start = ticks_ms()
+        while ticks_diff(ticks_ms(), start) < duration:
+            self.read_raw()
+            for i in range(self.num_sensors):
+                if self.raw[i] < self.white[i]:
+                    self.white[i] = self.raw[i]
+                if self.raw[i] > self.black[i]:
+                    self.black[i] = self.raw[i]
+            sleep_ms(period)
+        for i in range(self.num_sensors):
+            if self.black[i] <= self.white[i]:
+                self.black[i] = self.white[i] + 1
+        self._update_scale()
+
+    def save_calibration(self, filename=CALIBRATION_FILE):
+        '''!@brief    Saves the white and black levels to a file in flash.
+            @param    filename  Name of the file
+        '''
+        with open(filename, 'wb') as file:
+            file.write(self.white)
+            file.write(self.black)
+
+    def load_calibration(self, filename=CALIBRATION_FILE):
+        '''!@brief    Loads white and black levels saved by save_calibration().
+            @details  The file is checked before any levels are replaced. If it
+                      is missing, the wrong size or holds a black level which
+                      isn't above its white level, the existing calibration, or
+                      lack of one, is left as it was.
+            @param    filename  Name of the file
+            @return   True if the calibration was loaded, False if not
+        '''
+        size = 2 * self.num_sensors
+        white = array('H', [0] * self.num_sensors)
+        black = array('H', [0] * self.num_sensors)
+        try:
+            with open(filename, 'rb') as file:
+                if file.readinto(white) != size or file.readinto(black) != size:
+                    return False
+        except OSError:
+            return False
+        for i in range(self.num_sensors):
+            if black[i] <= white[i]:
+                return False
+        for i in range(self.num_sensors):
+            self.white[i] = white[i]
+            self.black[i] = black[i]
+        self._update_scale()
+        return True
+
+    def set_threshold(self, threshold):
+        '''!@brief    Sets the normalized reading above which a sensor sees the line.
+            @param    threshold  Threshold from 0 to 1
+        '''
+        self.threshold = int(threshold * NORM_SCALE)
+
+    @micropython.native
+    def read(self):
+        '''!@brief    Reads and normalizes every sensor into preallocated arrays.
+            @return   The array of normalized values (0 to NORM_SCALE).
+        '''
+        self.read_raw()
+        return self.normalize()
+
+    @micropython.native
+    def read_raw(self):
+        '''!@brief    Reads every sensor into the preallocated @c raw array.'''
+        raw = self.raw
+        start = ticks_us()
+        if self.oversample > 1:
+            self.read_burst()
+        else:
+            adcs = self.adcs
+            for i in range(self.num_sensors):
+                raw[i] = adcs[i].read()
+        self.latency_us = ticks_diff(ticks_us(), start)
+
+    @micropython.native
+    def normalize(self):
+        '''!@brief    Normalizes the readings in @c raw into @c values.
+            @return   The array of normalized values (0 to NORM_SCALE).
+        '''
+        raw = self.raw
+        values = self.values
+        if self.calibrated:
+            # One multiply per sensor using the precomputed scale factors
+            white = self.white
+            black = self.black
+            scale = self.scale
+            for i in range(self.num_sensors):
+                if raw[i] <= white[i]:
+                    values[i] = 0
+                elif raw[i] >= black[i]:
+                    values[i] = NORM_SCALE
+                else:
+                    values[i] = ((raw[i] - white[i]) * scale[i]) >> SCALE_BITS
+            return values
+
+        max_val = raw[0]
+        min_val = raw[0]
+        for i in range(1, self.num_sensors):
+            if raw[i] > max_val:
+                max_val = raw[i]
+            elif raw[i] < min_val:
+                min_val = raw[i]
+
+        span = max_val - min_val
+        for i in range(self.num_sensors):
+            if span == 0:
+                values[i] = NORM_SCALE // 2  # Neutral value if all readings are identical
+            else:
+                values[i] = (raw[i] - min_val) * NORM_SCALE // span
+        return values
+
+    @micropython.native
+    def read_burst(self):
+        '''!@brief    Takes a burst of samples from every sensor and filters them.
+            @details  The filtered reading from each sensor is put in @c raw.
+                      Median filtering sorts each burst buffer in place.
+        '''
+        ADC.read_timed_multi(self.burst_adcs, self.bursts, self.burst_timer)
+        raw = self.raw
+        count = self.oversample
+        for i in range(self.num_sensors):
+            burst = self.bursts[i]
+            if self.filter == MEDIAN:
+                # Insertion sort, which is quick for a handful of samples
+                for j in range(1, count):
+                    sample = burst[j]
+                    k = j - 1
+                    while k >= 0 and burst[k] > sample:
+                        burst[k + 1] = burst[k]
+                        k -= 1
+                    burst[k + 1] = sample
+                raw[i] = burst[count // 2]
+            else:
+                total = 0
+                for j in range(count):
+                    total += burst[j]
+                raw[i] = total // count
+
+    @micropython.native
+    def centroid(self):
+        '''!@brief    Computes the position of the line using the chosen mode.
+            @details  Works on the values from the most recent call to read().
+                      In every mode, no line is detected unless at least one
+                      sensor is above the threshold.
+            @return   The centroid position in inches or None if no line is detected.
+        '''
+        values = self.values
+        weights = self.weights
+        threshold = self.threshold
+        num_sensors = self.num_sensors
+        sum_product = 0
+        sum_values = 0
+        peak = 0
+        for i in range(num_sensors):
+            if values[i] > values[peak]:
+                peak = i
+            if values[i] > threshold:
+                sum_product += weights[i]
+                sum_values += 1
+
+        if sum_values == 0:
+            return None  # No line detected
+
+        if self.mode == ANALOG:
+            floor = self.floor
+            analog_product = 0
+            analog_values = 0
+            for i in range(num_sensors):
+                if values[i] > floor:
+                    analog_product += weights[i] * (values[i] - floor)
+                    analog_values += values[i] - floor
+            # If the floor is at or above the threshold, every sensor which
+            # sees the line may be below the floor; keep the binary centroid
+            if analog_values > 0:
+                sum_product = analog_product
+                sum_values = analog_values
+
+        elif self.mode == PARABOLIC and 0 < peak < num_sensors - 1:
+            # Vertex of the parabola through the peak and its two neighbors,
+            # in units of half the sensor spacing
+            left = values[peak - 1]
+            right = values[peak + 1]
+            curvature = left - 2 * values[peak] + right
+            if curvature < 0:
+                return (weights[peak] + (left - right) / curvature) * self.half_spacing
+            return weights[peak] * self.half_spacing
+
+        elif self.mode == PARABOLIC:
+            return weights[peak] * self.half_spacing
+
+        return sum_product * self.half_spacing / sum_values
+
+    def read_centroid(self):
+        '''!@brief    Reads the sensors and returns the centroid of the line.
+            @return   The centroid position in inches or None if no line is detected.
+        '''
+        self.read()
+        return self.centroid()
@@ -1,4 +1,21 @@
-from time import ticks_ms, ticks_diff
+from time import ticks_us, ticks_diff
+import micropython
+
+## Number of fractional bits in the scaled integers used by FixedClosedLoop
+FRAC_BITS = 8
+
+## Factor by which real values are multiplied to make FixedClosedLoop integers
+SCALE = 1 << FRAC_BITS
+
+## Number of fractional bits in the gains of FixedClosedLoop
+GAIN_BITS = 12
+
+## Longest time step, in microseconds, which FixedClosedLoop integrates over
+MAX_DT_US = 65535
+
+## Number of bits of microseconds in the ticks over which FixedClosedLoop
+#  integrates, so each tick is 64 us and one second is 15625 ticks
+TICK_BITS = 6
 
 class ClosedLoop:
     '''!@brief A driver class for closed-loop control of Romi's Velocity.
@@ -18,21 +35,24 @@ class ClosedLoop:
         self.kd = kd
         self.integral = 0
         self.last_error = 0
-        self.last_time = ticks_ms()
+        self.last_time = ticks_us()
         self.max_integral = max_integral
         self.pwm_min = pwm_min
         self.pwm_max = pwm_max
 
-    def feedback(self, specified_velo, actual_velo):
+    def feedback(self, specified_velo, actual_velo, current_time=None):
         '''!@brief Computes the PID output based on specified and actual velocities.
             @param specified_velo Desired velocity for the motor.
             @param actual_velo Current velocity from the encoder.
+            @param current_time Time from ticks_us() at which the velocity was
+                   measured, or None to read the clock here.
             @return PWM signal for motor control (clamped within pwm_min and pwm_max).
         '''
         # Calculate error
         error = specified_velo - actual_velo
-        current_time = ticks_ms()
-        dt = ticks_diff(current_time, self.last_time) / 1000  # Convert ms to seconds
+        if current_time is None:
+            current_time = ticks_us()
+        dt = ticks_diff(current_time, self.last_time) / 1000000  # Convert us to seconds
         self.last_time = current_time
 
         # Compute proportional term
@@ -59,4 +79,110 @@ class ClosedLoop:
         '''!@brief Resets the integral term, last error, and timestamp.'''
         self.integral = 0
         self.last_error = 0
-        self.last_time = ticks_ms()
+        self.last_time = ticks_us()
+
+class FixedClosedLoop:
+    '''!@brief A PID controller for Romi's velocity using only integer arithmetic.
+        @details Works like ClosedLoop, but keeps its state as integers scaled
+                 by SCALE and its gains as integers scaled by 2**GAIN_BITS, so
+                 that a control step done through feedback_scaled() creates no
+                 floats and so allocates no heap memory. The integral is kept in
+                 scaled rad/s times 64 us ticks and the leftover microseconds of
+                 each step are carried to the next one, so no time is lost to
+                 rounding. Velocities should stay within about 50 rad/s and gains
+                 below about 10 so intermediate products fit in a small int.
+    '''
+    def __init__(self, kp, ki, kd, max_integral=100, pwm_min=-100, pwm_max=100):
+        '''!@brief Initializes the PID controller with specified gains and limits.
+            @param kp Proportional gain.
+            @param ki Integral gain.
+            @param kd Derivative gain.
+            @param max_integral Maximum allowable value for the integral term.
+            @param pwm_min Minimum PWM output.
+            @param pwm_max Maximum PWM output.
+        '''
+        self.kp = round(kp * (1 << GAIN_BITS))
+        self.ki = round(ki * (1 << GAIN_BITS))
+        self.kd = round(kd * (1 << GAIN_BITS))
+        self.integral = 0
+        self.last_error = 0
+        self.carry_us = 0
+        self.last_time = ticks_us()
+        self.max_integral = int(max_integral * SCALE * (1000000 >> TICK_BITS))
+        self.pwm_min = int(pwm_min * SCALE)
+        self.pwm_max = int(pwm_max * SCALE)
+
+    @micropython.native
+    def feedback_scaled(self, specified_velo, actual_velo, current_time):
+        '''!@brief Computes the PID output from scaled integer velocities.
+            @param specified_velo Desired velocity times SCALE, as an integer.
+            @param actual_velo Current velocity times SCALE, as an integer.
+            @param current_time Time from ticks_us() at which the velocity was measured.
+            @return PWM signal times SCALE, clamped within pwm_min and pwm_max.
+        '''
+        # Calculate error
+        error = specified_velo - actual_velo
+        dt_us = ticks_diff(current_time, self.last_time)
+        self.last_time = current_time
+        if dt_us > MAX_DT_US:
+            dt_us = MAX_DT_US
+
+        # Compute proportional term
+        PWM = (self.kp * error) >> GAIN_BITS
+
+        if dt_us > 0:
+            # Integrate over whole ticks with saturation
+            total_us = self.carry_us + dt_us
+            dt_ticks = total_us >> TICK_BITS
+            self.carry_us = total_us - (dt_ticks << TICK_BITS)
+            integral = self.integral + error * dt_ticks
+            if integral > self.max_integral:
+                integral = self.max_integral
+            elif integral < -self.max_integral:
+                integral = -self.max_integral
+            self.integral = integral
+
+            # Compute derivative term, splitting 1000000 / dt_us into whole and
+            # fractional parts so the division is exact without a big product
+            change = error - self.last_error
+            per_second = 1000000 // dt_us
+            derivative = (change * per_second
+                          + (change * (1000000 - per_second * dt_us)) // dt_us)
+            PWM += (self.kd * derivative) >> GAIN_BITS
+
+        # Compute integral term, dividing by 2**GAIN_BITS before multiplying
+        # so that the product stays a small int
+        PWM += (self.ki * (self.integral >> GAIN_BITS)) // (1000000 >> TICK_BITS)
+        self.last_error = error
+
+        # Apply PWM limits
+        if PWM > self.pwm_max:
+            PWM = self.pwm_max
+        elif PWM < self.pwm_min:
+            PWM = self.pwm_min
+
+        return PWM
+
+    def feedback(self, specified_velo, actual_velo, current_time=None):
+        '''!@brief Computes the PID output based on specified and actual velocities.
+            @details Same as ClosedLoop.feedback(); converting to and from scaled
+                     integers here does allocate, so allocation-free callers
+                     should use feedback_scaled() directly.
+            @param specified_velo Desired velocity for the motor.
+            @param actual_velo Current velocity from the encoder.
+            @param current_time Time from ticks_us() at which the velocity was
+                   measured, or None to read the clock here.
+            @return PWM signal for motor control (clamped within pwm_min and pwm_max).
+        '''
+        if current_time is None:
+            current_time = ticks_us()
+        PWM = self.feedback_scaled(round(specified_velo * SCALE),
+                                   round(actual_velo * SCALE), current_time)
+        return PWM / SCALE
+
+    def reset(self):
+        '''!@brief Resets the integral term, last error, and timestamp.'''
+        self.integral = 0
+        self.last_error = 0
+        self.carry_us = 0
+        self.last_time = ticks_us()
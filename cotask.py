@@ -32,6 +32,20 @@ import utime                           # Micropython version of time library
 import micropython                     # This shuts up incorrect warnings
 
 
+## Overrun policy under which a task which has fallen behind runs once for
+#  every period it missed, as many times back-to-back as needed to catch up.
+#  The number of catch-up runs can be limited with @c max_catch_up.
+CATCH_UP = 0
+
+## Overrun policy under which a task which has fallen behind runs once, then
+#  skips the periods it missed and stays in phase with its original schedule.
+SKIP = 1
+
+## Overrun policy under which a task which has fallen behind runs once, then
+#  starts a new schedule one full period after the time at which it ran.
+REPHASE = 2
+
+
 ## Implements multitasking with scheduling and some performance logging.
 #
 #  This class implements behavior common to tasks in a cooperative 
@@ -85,8 +99,15 @@ class Task:
     #         states. @b Note: This slows things down and allocates memory.
     #  @param shares A list or tuple of shares and queues used by this task.
     #         If no list is given, no shares are passed to the task
+    #  @param overrun What to do when the task falls more than one period
+    #         behind schedule: @c CATCH_UP (the default), @c SKIP or 
+    #         @c REPHASE
+    #  @param max_catch_up The largest number of missed periods which are
+    #         made up under the @c CATCH_UP policy, or @c None for no limit.
+    #         Missed periods beyond this number are skipped
     def __init__(self, run_fun, name="NoName", priority=0, period=None,
-                 profile=False, trace=False, shares=()):
+                 profile=False, trace=False, shares=(), overrun=CATCH_UP,
+                 max_catch_up=None):
         # The function which is run to implement this task's code. Since it 
         # is a generator, we "run" it here, which doesn't actually run it but
         # gets it going as a generator which is ready to yield values
@@ -114,6 +135,12 @@ class Task:
             self.period = period
             self._next_run = None
 
+        # How the task recovers after falling behind, and a count of the 
+        # periods in which the task was not run because of that policy
+        self._overrun = overrun
+        self._max_catch_up = max_catch_up
+        self._skipped = 0
+
         # Flag which causes the task to be profiled, in which the execution
         #  time of the @c run() method is measured and basic statistics kept. 
         self._prof = profile
@@ -133,6 +160,14 @@ class Task:
         #  scheduler
         self.go_flag = False
 
+        # Number of runs which started after the task's following run was
+        # already due, that is, runs which missed their deadline
+        self._misses = 0
+
+        # The task list to which this task has been appended, which is told
+        # when the task's period changes or when it's triggered by go()
+        self._task_list = None
+
 
     ## This method is called by the scheduler; it attempts to run this task.
     #  If the task is not yet ready to run, this method returns @c False
@@ -201,8 +236,32 @@ class Task:
             late = utime.ticks_diff(utime.ticks_us(), self._next_run)
             if late > 0:
                 self.go_flag = True
-                self._next_run = utime.ticks_diff(self.period, 
-                                                  -self._next_run)
+
+                # A run which starts more than a period late has missed its
+                # deadline, as the next run should already have begun. The 
+                # overrun policy decides how many of the runs which are
+                # already due will be skipped rather than run back-to-back
+                missed = (late - 1) // self.period
+                if missed > 0:
+                    self._misses += 1
+                    if self._overrun == REPHASE:
+                        self._skipped += missed
+                        self._next_run = utime.ticks_add(utime.ticks_us(),
+                                                         self.period)
+                    else:
+                        if self._overrun == SKIP:
+                            skip = missed
+                        elif self._max_catch_up is not None \
+                                and missed > self._max_catch_up:
+                            skip = missed - self._max_catch_up
+                        else:
+                            skip = 0
+                        self._skipped += skip
+                        self._next_run = utime.ticks_add(self._next_run,
+                            (skip + 1) * self.period)
+                else:
+                    self._next_run = utime.ticks_add(self._next_run,
+                                                     self.period)
 
                 # If keeping a latency profile, record the data
                 if self._prof:
@@ -216,13 +275,21 @@ class Task:
 
     ## This method sets the period between runs of the task to the given
     #  number of milliseconds, or @c None if the task is triggered by calls
-    #  to @c go() rather than time.
+    #  to @c go() rather than time. A task which had no period is first run
+    #  one new period from now. The task list which holds the task is told
+    #  so that its deadline scheduler can move the task between its timed
+    #  and untimed tasks.
     #  @param new_period The new period in milliseconds between task runs
     def set_period(self, new_period):
         if new_period is None:
             self.period = None
         else:
+            if self.period is None:
+                self._next_run = utime.ticks_add(utime.ticks_us(),
+                                                 int(new_period) * 1000)
             self.period = int(new_period) * 1000
+        if self._task_list is not None:
+            self._task_list._reschedule(self)
 
 
     ## This method resets the variables used for execution time profiling.
@@ -260,6 +327,8 @@ class Task:
     #  another task which has data that this task needs to process soon.
     def go(self):
         self.go_flag = True
+        if self._task_list is not None:
+            self._task_list.go_pending = True
 
 
     ## This method converts the task to a string for diagnostic use.
@@ -272,7 +341,7 @@ class Task:
             rst += f"{(self.period / 1000.0): 10.1f}"
         except TypeError:
             rst += '         -'
-        rst += f"{self._runs: 8d}"
+        rst += f"{self._runs: 8d}{self._misses: 8d}{self._skipped: 8d}"
 
         if self._prof and self._runs > 0:
             avg_dur = (self._run_sum / self._runs) / 1000.0
@@ -295,7 +364,8 @@ class Task:
 #  The task list is sorted by priority so that the scheduler can efficiently
 #  look through the list to find the highest priority task which is ready to
 #  run at any given time. Tasks can also be scheduled in a simpler
-#  "round-robin" fashion.
+#  "round-robin" fashion, or in earliest-deadline-first order using a heap
+#  of the timer-driven tasks.
 class TaskList:
 
     ## Initialize the task list. This creates the list of priorities in
@@ -308,10 +378,22 @@ class TaskList:
         #  that priority. 
         self.pri_list = []
 
+        ## A binary min-heap of the timer-driven tasks, ordered by the time at
+        #  which each task is next due to run. It is used by @c edf_sched().
+        self.heap = []
+
+        ## The tasks which are run by calls to @c go() rather than by a timer.
+        self.untimed = []
+
+        ## Flag which is set when any task in the list has had @c go() called,
+        #  telling @c edf_sched() to look for tasks with their go flags set.
+        self.go_pending = False
+
 
     ## Append a task to the task list. The list will be sorted by task 
     #  priorities so that the scheduler can quickly find the highest priority
-    #  task which is ready to run at any given time. 
+    #  task which is ready to run at any given time. A task should only be
+    #  appended to one task list.
     #  @param task The task to be appended to the list
     def append(self, task):
         # See if there's a tasklist with the given priority in the main list
@@ -333,6 +415,36 @@ class TaskList:
         # Make sure the main list (of lists at each priority) is sorted
         self.pri_list.sort(key=lambda pri: pri[0], reverse=True)
 
+        # Also keep the task in the structures used by the deadline scheduler
+        task._task_list = self
+        if task.period is None:
+            self.untimed.append(task)
+        else:
+            self.heap.append(task)
+            self._sift_up(len(self.heap) - 1)
+        if task.go_flag:
+            self.go_pending = True
+
+
+    ## Move a task between the heap and the untimed tasks after its period
+    #  has been changed by @c Task.set_period(). A task which stays timed
+    #  keeps its place, as its next run time hasn't changed.
+    #  @param task The task whose period has changed
+    def _reschedule(self, task):
+        if task.period is None:
+            if task in self.heap:
+                idx = self.heap.index(task)
+                last = self.heap.pop()
+                if idx < len(self.heap):
+                    self.heap[idx] = last
+                    self._sift_down(idx)
+                    self._sift_up(idx)
+                self.untimed.append(task)
+        elif task in self.untimed:
+            self.untimed.remove(task)
+            self.heap.append(task)
+            self._sift_up(len(self.heap) - 1)
+
 
     ## Run tasks in order, ignoring the tasks' priorities.
     #
@@ -375,10 +487,82 @@ class TaskList:
                     return
 
 
+    ## Run tasks in earliest-deadline-first order, ignoring priorities.
+    #
+    #  This scheduler keeps the timer-driven tasks in a min-heap ordered by
+    #  the time at which each is next due, so finding the task to run costs
+    #  O(1) and putting it back costs O(log n) rather than asking every task
+    #  in the list whether it's ready. Each call runs at most one task: first
+    #  any task which has been triggered by @c go(), timed or not, then the
+    #  timed task with the earliest due time if that time has passed. The
+    #  tasks are only searched for go flags after @c go() has been called.
+    #  Times are compared with @c ticks_diff() so the heap keeps working when
+    #  the timer wraps around.
+    @micropython.native
+    def edf_sched(self):
+        heap = self.heap
+        if self.go_pending:
+            # Clear the flag first so a go() from an interrupt isn't lost; it
+            # is set again after a run in case more tasks are waiting
+            self.go_pending = False
+            for task in self.untimed:
+                if task.go_flag:
+                    self.go_pending = True
+                    task.schedule()
+                    return
+            for idx in range(len(heap)):
+                if heap[idx].go_flag:
+                    self.go_pending = True
+                    heap[idx].schedule()
+                    self._sift_down(idx)
+                    return
+
+        if heap and utime.ticks_diff(utime.ticks_us(), heap[0]._next_run) > 0:
+            heap[0].schedule()
+            self._sift_down(0)
+
+
+    ## Move the task at the given heap index up toward the root until its
+    #  parent is due no later than it is.
+    #  @param idx The index in the heap of the task to be moved
+    def _sift_up(self, idx):
+        heap = self.heap
+        task = heap[idx]
+        while idx > 0:
+            parent = (idx - 1) >> 1
+            if utime.ticks_diff(task._next_run, heap[parent]._next_run) >= 0:
+                break
+            heap[idx] = heap[parent]
+            idx = parent
+        heap[idx] = task
+
+
+    ## Move the task at the given heap index down toward the leaves until
+    #  neither of its children is due before it is.
+    #  @param idx The index in the heap of the task to be moved
+    @micropython.native
+    def _sift_down(self, idx):
+        heap = self.heap
+        length = len(heap)
+        task = heap[idx]
+        while True:
+            child = 2 * idx + 1
+            if child >= length:
+                break
+            if child + 1 < length and utime.ticks_diff(
+                    heap[child + 1]._next_run, heap[child]._next_run) < 0:
+                child += 1
+            if utime.ticks_diff(heap[child]._next_run, task._next_run) >= 0:
+                break
+            heap[idx] = heap[child]
+            idx = child
+        heap[idx] = task
+
+
     ## Create some diagnostic text showing the tasks in the task list.
     def __repr__(self):
-        ret_str = 'TASK             PRI    PERIOD    RUNS   AVG DUR   MAX ' \
-            'DUR  AVG LATE  MAX LATE\n'
+        ret_str = 'TASK             PRI    PERIOD    RUNS  MISSES SKIPPED ' \
+            '  AVG DUR   MAX DUR  AVG LATE  MAX LATE\n'
         for pri in self.pri_list:
             for task in pri[2:]:
                 ret_str += str(task) + '\n'
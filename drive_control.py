@@ -0,0 +1,94 @@
+from time import ticks_us
+
+class DiffDrive:
+    '''!@brief    Closed-loop velocity control of both Romi wheels in one task.
+        @details  Objects of this class sample both encoders back-to-back,
+                  compute both wheels' velocities and PID outputs from a single
+                  timestamp, then publish the results together. Running both
+                  wheels from one task halves the scheduler overhead of the
+                  control loop and keeps the two wheels from being sampled at
+                  different instants.
+    '''
+    def __init__(self, enc_A, enc_B, mot_A, mot_B, control_A, control_B,
+                 setpoint_A, setpoint_B, position_A, velocity_A,
+                 position_B, velocity_B, hold=None, record=None):
+        '''!@brief    Initializes the fused motor control task.
+            @param    enc_A, enc_B            Encoder drivers for each wheel
+                      mot_A, mot_B            Romi motor drivers for each wheel
+                      control_A, control_B    ClosedLoop controllers for each wheel
+                      setpoint_A, setpoint_B  Shares holding the desired wheel
+                                              velocities in rad/s
+                      position_A, velocity_A  Shares which receive wheel A's
+                                              position (rad) and velocity (rad/s)
+                      position_B, velocity_B  The same for wheel B
+                      hold                    A function which returns True while
+                                              the motors are being driven by
+                                              something else, or None
+                      record                  A task_share.Record with format
+                                              '<lffff' which receives the time in
+                                              us and both wheels' positions and
+                                              velocities together, or None
+        '''
+        self.enc_A = enc_A
+        self.enc_B = enc_B
+        self.mot_A = mot_A
+        self.mot_B = mot_B
+        self.control_A = control_A
+        self.control_B = control_B
+        self.setpoint_A = setpoint_A
+        self.setpoint_B = setpoint_B
+        self.position_A = position_A
+        self.velocity_A = velocity_A
+        self.position_B = position_B
+        self.velocity_B = velocity_B
+        self.hold = hold
+        self.record = record
+
+    def run(self):
+        '''!@brief    Generator which runs one control cycle for both wheels.
+            @details  The encoders are always updated so that positions and
+                      velocities stay current, but while @c hold() returns True
+                      the controllers leave the motors alone and the setpoints
+                      are cleared. The velocities come from the encoders,
+                      which time their own samples in microseconds and switch
+                      to timing edges at low speed.
+        '''
+        self.mot_A.enable()
+        self.mot_B.enable()
+        try:
+            while True:
+                # Sample both wheels as close together as possible
+                current_time = ticks_us()
+                self.enc_A.update()
+                self.enc_B.update()
+                velocity_A = self.enc_A.get_velocity()
+                velocity_B = self.enc_B.get_velocity()
+
+                if self.hold is not None and self.hold():
+                    self.setpoint_A.put(0)
+                    self.setpoint_B.put(0)
+                else:
+                    PWM_A = self.control_A.feedback(self.setpoint_A.get(),
+                                                    velocity_A, current_time)
+                    PWM_B = self.control_B.feedback(self.setpoint_B.get(),
+                                                    velocity_B, current_time)
+                    self.mot_A.set_duty(PWM_A)
+                    self.mot_B.set_duty(PWM_B)
+
+                # Publish both wheels' results together
+                position_A = self.enc_A.get_position_radians()
+                position_B = self.enc_B.get_position_radians()
+                self.position_A.put(position_A)
+                self.velocity_A.put(velocity_A)
+                self.position_B.put(position_B)
+                self.velocity_B.put(velocity_B)
+                if self.record is not None:
+                    self.record.put(current_time, position_A, velocity_A,
+                                    position_B, velocity_B)
+
+                yield 0
+        finally:
+            self.mot_A.set_duty(0)
+            self.mot_B.set_duty(0)
+            self.mot_A.disable()
+            self.mot_B.disable()
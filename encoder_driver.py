@@ -1,40 +1,203 @@
-from pyb import Timer
+from pyb import Timer, disable_irq, enable_irq
+from time import ticks_us, ticks_diff
+import array
+import task_share
 AR = 65535
 PS = 0
+
+## Half the range of the encoder counter; a larger change between samples is
+#  taken to be a wrap the other way
+HALF_RANGE = (AR + 1) // 2
+
+## Encoder counts between rising edges of channel A
+COUNTS_PER_EDGE = 4
+
+## Counts per update at or above which velocity is found from the count
+#  change rather than from edge periods; about 8 rad/s at the 17.5 ms motor
+#  period, above the line following speed
+SWITCH_COUNTS = 32
+
+## Time without an edge after which the wheel is taken to be stopped, in us
+STOP_US = 250000
+
 class Encoder:
     '''!@brief    Interface with quadrature encoders
         @details  Objects of this class can be used to record the output of a quadrature
                   encoder attached to a DC motor.
+
+                  The velocity is worked out on each update. At speed it is the
+                  change in count over the time since the last update, but at
+                  low speed there are only a handful of counts per update and
+                  that estimate is coarse. If channel A of the encoder is also
+                  wired to an input capture channel of a free-running timer,
+                  each rising edge of it is timed by the hardware, and below
+                  @c SWITCH_COUNTS counts per update the velocity is instead
+                  found from the number of edges over the exact time between
+                  the first and last of them. The switch is made on every
+                  update, so the velocity is accurate over the whole speed range.
+
+                  The counter can instead be sampled by an EncoderSampler
+                  from a timer interrupt, in which case update() takes the
+                  position and time of the latest sample rather than reading
+                  the counter itself.
     '''
-    def __init__(self, ENC_tim, CH_A_PIN, CH_B_PIN):
+    def __init__(self, ENC_tim, CH_A_PIN, CH_B_PIN, CAP_tim=None, CAP_CH=1,
+                 CAP_PIN=None, cap_freq=1000000):
         '''!@brief    Initializes objects associated with a quadrature motor encoder.
             @details  This method configures the encoder channels for each motor. It
                       then sets up the timer, and variables to be referenced later.
             @param    ENC_tim   A timer to be configured as the encoder
                       CH_A_PIN  The channel 1 pin associated with the timer chosen for ENC_tim
                       CH_B_PIN  The channel 2 pin associated with the timer chosen for ENC_tim
+                      CAP_tim   A free-running timer used to time edges of channel
+                                A, or None to find velocity from counts alone
+                      CAP_CH    The channel of CAP_tim to use for input capture
+                      CAP_PIN   The pin of that channel, wired to channel A
+                      cap_freq  The rate at which CAP_tim counts, in Hz
         '''
         self.EN1 = ENC_tim.channel(1, pin=CH_A_PIN, mode=Timer.ENC_AB)
         self.EN2 = ENC_tim.channel(2, pin=CH_B_PIN, mode=Timer.ENC_AB)
         self.counter = ENC_tim.counter
         self.oldcount = 0
         self.position = 0
+        self.delta = 0
+        self.velocity = 0.0
+        self.last_time = ticks_us()
+        self.last_position = 0
+        self.sample_time = self.last_time
+        self.sampled = False
 
-    def update(self):
-        '''!@brief    Updates encoder position and delta
-            @details  This method is called on periodically to track the change
-                      in the encoder's position, and record it. If the counter
-                      resets, this method accounts for that and only records the
-                      true change.
+        # Written by the edge interrupt
+        self.edges = 0
+        self.edge_capture = 0
+        self.edge_time = 0
+        # Edge the last period was measured up to, and the mean period then
+        self.last_edges = 0
+        self.last_capture = 0
+        self.last_edge_time = None
+        self.period_us = 0.0
+        self.direction = 1
+
+        self.capture_channel = None
+        if CAP_tim is not None:
+            self.cap_period = CAP_tim.period() + 1
+            self.us_per_tick = 1000000 / cap_freq
+            # Captures further apart than half the timer's range are ambiguous
+            self.cap_span_us = int(self.cap_period * self.us_per_tick) // 2
+            self.capture_channel = CAP_tim.channel(CAP_CH, pin=CAP_PIN, mode=Timer.IC,
+                                                   polarity=Timer.RISING)
+            self.capture = self.capture_channel.capture
+            self.capture_channel.callback(self.edge)
+
+    def edge(self, tim):
+        '''!@brief    Records a rising edge of channel A
+            @details  This is the input capture interrupt. It only stores small
+                      integers, so it doesn't allocate memory.
+            @param    tim  The capture timer, passed in by the interrupt
+        '''
+        self.edge_capture = self.capture()
+        self.edge_time = ticks_us()
+        self.edges += 1
+
+    def sample(self, now):
+        '''!@brief    Reads the counter and adds its change to the position
+            @details  If the counter resets, this method accounts for that and
+                      only records the true change, as long as the counter
+                      has moved less than half its range since the last
+                      sample. It only does integer arithmetic, so it can be
+                      called from an interrupt without allocating memory.
+            @param    now  The time of the sample from ticks_us()
+            @return   The change in count since the last sample
         '''
         self.newcount = -1 * self.counter()
-        self.delta = self.newcount - self.oldcount
+        delta = self.newcount - self.oldcount
         self.oldcount = self.newcount
-        if self.delta > (AR + 1) / 2:
-            self.delta -= AR + 1
-        elif self.delta < -(AR + 1) / 2:
-            self.delta += AR + 1
-        self.position += self.delta
+        if delta > HALF_RANGE:
+            delta -= AR + 1
+        elif delta < -HALF_RANGE:
+            delta += AR + 1
+        self.position += delta
+        self.sample_time = now
+        return delta
+
+    def update(self):
+        '''!@brief    Updates encoder position, delta and velocity
+            @details  This method is called on periodically to track the change
+                      in the encoder's position, and record it. The delta is
+                      the change since the last update. If no time has passed
+                      since the last update the previous velocity is kept.
+        '''
+        if self.sampled:
+            state = disable_irq()
+            position = self.position
+            now = self.sample_time
+            enable_irq(state)
+        else:
+            now = ticks_us()
+            self.sample(now)
+            position = self.position
+        self.delta = position - self.last_position
+        self.last_position = position
+        if self.delta > 0:
+            self.direction = 1
+        elif self.delta < 0:
+            self.direction = -1
+
+        delta_time = ticks_diff(now, self.last_time)
+        if delta_time > 0:
+            self.last_time = now
+            velocity = None
+            if self.capture_channel is not None:
+                # Always called, so the edge reference stays current at speed
+                velocity = self.edge_velocity(now)
+            if velocity is None or abs(self.delta) >= SWITCH_COUNTS:
+                velocity = (self.delta * 6.28) / (1440 * delta_time / 1000000)
+            self.velocity = velocity
+
+    def edge_velocity(self, now):
+        '''!@brief    Finds the velocity from the edges captured since the last call
+            @details  The mean period of the edges since the last call is the
+                      time from the last edge before it to the last edge now,
+                      over the number of edges. Long gaps which the capture
+                      timer can't span are timed with ticks_us() instead. With
+                      no new edge, the velocity can be no more than one edge
+                      over the time since the last one.
+            @param    now  The time of the update from ticks_us()
+            @return   The velocity in rad/s, or None if there is no recent edge
+                      to measure from
+        '''
+        state = disable_irq()
+        edges = self.edges
+        capture = self.edge_capture
+        edge_time = self.edge_time
+        enable_irq(state)
+
+        count = edges - self.last_edges
+        last_edge_time = self.last_edge_time
+        if count:
+            self.last_edges = edges
+            ticks = (capture - self.last_capture) % self.cap_period
+            self.last_capture = capture
+            self.last_edge_time = edge_time
+            if last_edge_time is None:
+                return None
+            gap = ticks_diff(edge_time, last_edge_time)
+            if gap > STOP_US:
+                # Starting off after a stop, so there's no period to measure yet
+                self.period_us = 0.0
+                return None
+            if gap < self.cap_span_us:
+                gap = ticks * self.us_per_tick
+            self.period_us = gap / count
+        elif last_edge_time is None or not self.period_us:
+            return None
+
+        since = ticks_diff(now, self.last_edge_time)
+        if since > STOP_US:
+            return 0.0
+        # When slowing down, the next edge is at least this far off
+        period = since if since > self.period_us else self.period_us
+        return self.direction * (COUNTS_PER_EDGE * 6.28 * 1000000) / (1440 * period)
 
     def get_delta(self):
         '''!@brief    Gets the most recent encoder delta
@@ -44,6 +207,14 @@ class Encoder:
         '''
         return self.delta
 
+    def get_velocity(self):
+        '''!@brief    Gets the most recent encoder velocity
+            @details
+            @return   self.velocity  The wheel's velocity in rad/s from the last
+                                     update
+        '''
+        return self.velocity
+
     def get_position_radians(self):
         '''!@brief    Gets the most recent encoder position in radians
             @details
@@ -56,4 +227,87 @@ class Encoder:
         '''!@brief    Resets the encoder position to zero
             @details
         '''
-        self.position = 0
\ No newline at end of file
+        state = disable_irq()
+        self.position = 0
+        self.last_position = 0
+        enable_irq(state)
+
+
+class EncoderSampler:
+    '''!@brief    Samples encoders at a fixed rate from a timer interrupt
+        @details  The motor tasks only update the encoders when they are run,
+                  so if the scheduler is held up long enough for a counter to
+                  move half its range the wrap correction miscounts, and the
+                  time between velocity samples moves with task latency. An
+                  object of this class samples each encoder's counter from a
+                  hardware timer interrupt instead, so no counts are lost
+                  however late the tasks are, and the encoders' update()
+                  methods work from the time of the latest sample.
+
+                  The interrupt also puts the sample time and each encoder's
+                  position and its change over the last sample period into
+                  one MultiShare, with in_ISR set. Tasks read all of them at
+                  once with snapshot(), which copies them into a preallocated
+                  array with interrupts disabled, so the values always come
+                  from the same sample. The interrupt only handles small
+                  integers, so it doesn't allocate memory.
+    '''
+    def __init__(self, encoders, timer=16, freq=200):
+        '''!@brief    Initializes a sampler for a set of encoders
+            @param    encoders  A tuple of Encoder objects to sample
+                      timer     Number of the hardware timer to sample from
+                      freq      Samples per second; the counters must move
+                                less than half their range between samples
+        '''
+        self.encoders = encoders
+        self.timer_num = timer
+        self.freq = freq
+        self.timer = None
+        # Sample time, then each encoder's position and delta
+        size = 1 + 2 * len(encoders)
+        self.share = task_share.MultiShare('l', size, name="Encoder_Samples")
+        self.staged = array.array('l', [0] * size)
+        self.values = array.array('l', [0] * size)
+        # Bound once here, as binding in the interrupt would allocate
+        self.sample_ref = self.sample
+
+    def start(self):
+        '''!@brief    Takes a first sample and starts sampling from the timer
+            @details  From here on the encoders' update() methods no longer read
+                      the counters themselves.
+        '''
+        self.sample(None)
+        for enc in self.encoders:
+            enc.sampled = True
+        self.timer = Timer(self.timer_num, freq=self.freq)
+        self.timer.callback(self.sample_ref)
+
+    def stop(self):
+        '''!@brief    Stops sampling and hands the counters back to update()'''
+        if self.timer is not None:
+            self.timer.callback(None)
+            self.timer = None
+        for enc in self.encoders:
+            enc.sampled = False
+
+    def sample(self, tim):
+        '''!@brief    Samples every encoder and publishes the results
+            @details  This is the timer interrupt.
+            @param    tim  The timer, passed in by the interrupt
+        '''
+        now = ticks_us()
+        staged = self.staged
+        staged[0] = now
+        for i in range(len(self.encoders)):
+            enc = self.encoders[i]
+            staged[2 + 2 * i] = enc.sample(now)
+            staged[1 + 2 * i] = enc.position
+        self.share.put(staged, True)
+
+    def snapshot(self):
+        '''!@brief    Reads the latest sample of every encoder at once
+            @return   An array holding the sample time from ticks_us(), then
+                      each encoder's position and delta in counts; it is
+                      overwritten by the next call
+        '''
+        return self.share.get_into(self.values)
@@ -0,0 +1,177 @@
+'''!@file     gain_sweep.py
+    @brief    Host-side batch evaluation of ClosedLoop gains using NumPy.
+    @details  Runs many copies of the motor velocity PID controller, each with
+              its own gains, against the same setpoint trace and a simple
+              first-order model of a Romi gearmotor. All gain sets are stepped
+              together as NumPy arrays, so sweeping thousands of gain
+              combinations takes seconds instead of thousands of robot runs.
+              This file runs on a PC, not on the robot.
+
+              The model's gain and time constant are estimates for a Romi
+              gearmotor on a 7.2 V pack; with them, the motor gains used in
+              main.py take a few seconds to settle, so runs default to 10 s.
+
+              @b Example:
+              @code
+                  import numpy as np
+                  import gain_sweep
+                  kp, ki, kd = gain_sweep.grid(np.linspace(0.5, 8, 100),
+                                               np.linspace(0, 30, 100), [0.0])
+                  results = gain_sweep.sweep(kp, ki, kd, setpoint=4.4)
+                  best = np.nanargmin(results['rise_time'] + results['overshoot'])
+              @endcode
+'''
+import numpy as np
+
+## Steady-state wheel speed per percent PWM of the model motor, in rad/s
+MOTOR_GAIN = 0.15
+
+## Time constant of the model motor, in seconds
+MOTOR_TAU = 0.08
+
+## Control period used by the motor task in main.py, in seconds
+PERIOD = 0.0175
+
+class BatchClosedLoop:
+    '''!@brief    N independent ClosedLoop controllers evaluated at once.
+        @details  Behaves like closed_loop_driver.ClosedLoop, including the
+                  integral and PWM clamps, except that the gains, state and
+                  outputs are arrays with one element per gain set and the
+                  time step is given by the caller.
+    '''
+    def __init__(self, kp, ki, kd, max_integral=100, pwm_min=-100, pwm_max=100):
+        '''!@brief    Initializes the batch of PID controllers.
+            @param    kp, ki, kd    Arrays (or scalars) of gains, one per set
+                      max_integral  Maximum allowable value for the integral term
+                      pwm_min       Minimum PWM output
+                      pwm_max       Maximum PWM output
+        '''
+        self.kp, self.ki, self.kd = np.broadcast_arrays(
+            np.asarray(kp, dtype=float), np.asarray(ki, dtype=float),
+            np.asarray(kd, dtype=float))
+        self.max_integral = max_integral
+        self.pwm_min = pwm_min
+        self.pwm_max = pwm_max
+        self.integral = np.zeros(self.kp.shape)
+        self.last_error = np.zeros(self.kp.shape)
+
+    def feedback(self, specified_velo, actual_velo, dt):
+        '''!@brief    Computes the PID outputs for every gain set.
+            @param    specified_velo  Desired velocity, scalar or array
+                      actual_velo     Measured velocities, one per gain set
+                      dt              Time step in seconds
+            @return   Array of PWM signals clamped within pwm_min and pwm_max
+        '''
+        error = specified_velo - actual_velo
+        self.integral += error * dt
+        np.clip(self.integral, -self.max_integral, self.max_integral,
+                out=self.integral)
+        derivative = (error - self.last_error) / dt
+        self.last_error = error
+        PWM = self.kp * error + self.ki * self.integral + self.kd * derivative
+        return np.clip(PWM, self.pwm_min, self.pwm_max)
+
+def grid(kp_values, ki_values, kd_values):
+    '''!@brief    Builds every combination of the given gain values.
+        @return   A tuple of flat arrays (kp, ki, kd) of equal length
+    '''
+    kp, ki, kd = np.meshgrid(kp_values, ki_values, kd_values, indexing='ij')
+    return kp.ravel(), ki.ravel(), kd.ravel()
+
+def simulate(kp, ki, kd, setpoint, duration=10.0, dt=PERIOD, gain=MOTOR_GAIN,
+             tau=MOTOR_TAU, counts_per_rev=1440):
+    '''!@brief    Simulates the wheel velocity loop for every gain set.
+        @details  The motor is modelled as a first-order lag from PWM to speed,
+                  integrated exactly over each control period. Measured
+                  velocities are quantized to whole encoder counts per period,
+                  as in the motor task, unless @c counts_per_rev is None.
+        @param    kp, ki, kd      Arrays of gains, one element per gain set
+                  setpoint        A constant setpoint in rad/s, or an array
+                                  holding the setpoint for each control period,
+                                  for example one recorded from the robot
+                  duration        Length of a constant-setpoint run in seconds
+                  dt              Control period in seconds
+                  gain            Motor speed per percent PWM in rad/s
+                  tau             Motor time constant in seconds
+                  counts_per_rev  Encoder counts per wheel revolution, or None
+        @return   A tuple (time, setpoints, velocity) where @c velocity has one
+                  row per control period and one column per gain set
+    '''
+    if np.ndim(setpoint) == 0:
+        setpoints = np.full(int(round(duration / dt)), float(setpoint))
+    else:
+        setpoints = np.asarray(setpoint, dtype=float)
+    control = BatchClosedLoop(kp, ki, kd)
+    decay = np.exp(-dt / tau)
+    velocity = np.zeros(control.kp.shape)
+    position = np.zeros(control.kp.shape)
+    measured = np.zeros(control.kp.shape)
+    counts = np.zeros(control.kp.shape)
+    history = np.empty((len(setpoints),) + control.kp.shape)
+
+    for step, specified in enumerate(setpoints):
+        PWM = control.feedback(specified, measured, dt)
+        # Exact response of the first-order lag to a PWM held for one period
+        target = gain * PWM
+        position += target * dt + (velocity - target) * tau * (1 - decay)
+        velocity = target + (velocity - target) * decay
+        if counts_per_rev is None:
+            measured = velocity.copy()
+        else:
+            new_counts = np.floor(position * counts_per_rev / (2 * np.pi))
+            measured = (new_counts - counts) * 2 * np.pi / (counts_per_rev * dt)
+            counts = new_counts
+        history[step] = velocity
+
+    return (np.arange(len(setpoints)) + 1) * dt, setpoints, history
+
+def step_metrics(time, setpoints, velocity, settle_fraction=0.1):
+    '''!@brief    Computes step response figures of merit for each gain set.
+        @details  The step measured is the last change of setpoint, or the
+                  step from rest to a constant setpoint. Steps up and down are
+                  treated alike, so the step may end at zero or below it.
+        @param    time             Array of sample times in seconds
+                  setpoints        Array of setpoints; the final value is used
+                  velocity         Array of responses, one column per gain set
+                  settle_fraction  Fraction of the run at the end over which the
+                                   steady-state error is averaged
+        @return   A dictionary of arrays with one element per gain set:
+                  @c rise_time from 10% to 90% of the step in seconds (NaN if
+                  never reached), @c overshoot past the final setpoint in
+                  percent of the step, and @c ss_error, the mean absolute error
+                  at the end. Without a step, rise time and overshoot are NaN.
+    '''
+    tail = max(1, int(len(time) * settle_fraction))
+    ss_error = np.abs(velocity[-tail:] - setpoints[-tail:, None]).mean(axis=0)
+
+    final = setpoints[-1]
+    changes = np.flatnonzero(setpoints[1:] != setpoints[:-1])
+    start = changes[-1] + 1 if len(changes) else 0
+    initial = setpoints[start - 1] if start else 0.0
+    if final == initial:
+        nan = np.full(ss_error.shape, np.nan)
+        return {'rise_time': nan, 'overshoot': nan.copy(), 'ss_error': ss_error}
+
+    # Progress through the step, from 0 at its start to 1 at the final setpoint
+    progress = (velocity[start:] - initial) / (final - initial)
+    above_10 = progress >= 0.1
+    above_90 = progress >= 0.9
+    step_time = time[start:]
+    t_10 = np.where(above_10.any(axis=0), step_time[above_10.argmax(axis=0)], np.nan)
+    t_90 = np.where(above_90.any(axis=0), step_time[above_90.argmax(axis=0)], np.nan)
+    overshoot = np.maximum(progress.max(axis=0) - 1, 0) * 100
+    return {'rise_time': t_90 - t_10, 'overshoot': overshoot,
+            'ss_error': ss_error}
+
+def sweep(kp, ki, kd, setpoint=4.4, **kwargs):
+    '''!@brief    Simulates and scores a set of gain combinations.
+        @param    kp, ki, kd  Arrays of gains, one element per gain set
+                  setpoint    Constant or recorded setpoint in rad/s
+                  kwargs      Further arguments passed to @c simulate()
+        @return   The dictionary from @c step_metrics() with the gains added
+                  under the keys @c kp, @c ki and @c kd
+    '''
+    time, setpoints, velocity = simulate(kp, ki, kd, setpoint, **kwargs)
+    results = step_metrics(time, setpoints, velocity)
+    results['kp'], results['ki'], results['kd'] = np.broadcast_arrays(kp, ki, kd)
+    return results
@@ -0,0 +1,116 @@
+'''!@file     line_tracker.py
+    @brief    Kalman filter which tracks the line under the line sensor.
+    @details  The line sensor only says where the line is while it can see
+              it. Between dashes, and for a moment on sharp corners, the
+              centroid is None and the line following task is left guessing.
+              The tracker in this file keeps an estimate of where the line is
+              from how the robot has moved since it was last seen, so the
+              line following task can keep steering through the gap.
+'''
+
+class LineTracker:
+    '''!@brief    Tracks the line's position and direction relative to the robot.
+        @details  The state is the line's position across the sensor array in
+                  inches, positive to the robot's left as for the centroid,
+                  and the line's direction relative to the robot's heading in
+                  radians, positive counterclockwise. For a straight line and
+                  small angles, with the robot moving forward at speed @c v
+                  and turning counterclockwise at @c w, these change as
+                  @code
+                      d(position)/dt = v * angle - offset * w
+                      d(angle)/dt    = -w
+                  @endcode
+                  where @c offset is the distance from the axle to the sensor.
+                  Curves in the line are treated as noise on the angle, in
+                  proportion to the distance driven. Each centroid reading
+                  corrects the position directly and the angle through the
+                  correlation built up between them.
+
+                  The covariance is symmetric, so only three of its terms
+                  are kept. One update is about 30 floating point operations
+                  and makes no calls, so it runs in well under a millisecond
+                  on the Nucleo.
+    '''
+    def __init__(self, offset=3.0, noise=0.08, turn=0.05, drift=0.02, lost=0.1):
+        '''!@brief    Initializes a tracker which hasn't seen the line yet.
+            @param    offset  Distance of the line sensor ahead of the axle in inches
+                      noise   Standard deviation of the centroid reading in inches
+                      turn    Standard deviation of the line's curvature in 1/in
+                      drift   Position noise in in/sqrt(s), for wheel slip and
+                              bumps which the model doesn't cover
+                      lost    Position variance in square inches above which
+                              the estimate is no longer trusted
+        '''
+        self.offset = offset
+        self.noise_var = noise * noise
+        self.turn_var = turn * turn
+        self.drift_var = drift * drift
+        self.lost_var = lost
+        self.reset()
+
+    def reset(self, position=None):
+        '''!@brief    Starts tracking over, either from a reading or not at all.
+            @param    position  A centroid reading in inches to start from, or
+                                None to wait for the next reading
+        '''
+        self.position = 0.0 if position is None else position
+        self.angle = 0.0
+        # Covariance terms: position, position-angle and angle
+        self.p_pp = self.noise_var if position is not None else 1e6
+        self.p_pa = 0.0
+        self.p_aa = 0.04
+
+    def predict(self, speed, yaw_rate, dt):
+        '''!@brief    Moves the estimate forward by one time step.
+            @param    speed     Forward speed of the robot in in/s
+                      yaw_rate  Counterclockwise yaw rate of the robot in rad/s
+                      dt        Length of the time step in seconds
+        '''
+        b = speed * dt
+        self.position += b * self.angle - self.offset * yaw_rate * dt
+        self.angle -= yaw_rate * dt
+        p_pa = self.p_pa
+        p_aa = self.p_aa
+        self.p_pp += b * (2 * p_pa + b * p_aa) + self.drift_var * dt
+        self.p_pa = p_pa + b * p_aa
+        self.p_aa = p_aa + self.turn_var * b * abs(speed)
+
+    def correct(self, measured):
+        '''!@brief    Corrects the estimate with a centroid reading.
+            @param    measured  The line position read by the sensor in inches
+        '''
+        p_pp = self.p_pp
+        p_pa = self.p_pa
+        if p_pp >= 1e6:
+            # Nothing to blend with, so start from this reading
+            self.reset(measured)
+            return
+        total = p_pp + self.noise_var
+        gain_p = p_pp / total
+        gain_a = p_pa / total
+        innovation = measured - self.position
+        self.position += gain_p * innovation
+        self.angle += gain_a * innovation
+        self.p_aa -= gain_a * p_pa
+        self.p_pa = p_pa - gain_p * p_pa
+        self.p_pp = p_pp - gain_p * p_pp
+
+    def update(self, measured, speed, yaw_rate, dt):
+        '''!@brief    Runs one predict and correct step of the filter.
+            @param    measured  The centroid reading in inches, or None if the
+                                sensor can't see the line
+                      speed     Forward speed of the robot in in/s
+                      yaw_rate  Counterclockwise yaw rate of the robot in rad/s
+                      dt        Time since the last update in seconds
+            @return   The estimated line position in inches
+        '''
+        self.predict(speed, yaw_rate, dt)
+        if measured is not None:
+            self.correct(measured)
+        return self.position
+
+    def lost(self):
+        '''!@brief    Checks whether the estimate has become too uncertain to use.
+            @return   True if the position variance is above the limit
+        '''
+        return self.p_pp > self.lost_var
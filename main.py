@@ -1,8 +1,10 @@
 # Importing Necessary Modules 
 import pyb
+import math
+from array import array
 from pyb import Pin, Timer, UART, ExtInt
 from time import ticks_ms, ticks_diff
-import encoder_driver, romi_driver, IMU_driver, closed_loop_driver, cotask, task_share, QTR_driver
+import encoder_driver, romi_driver, IMU_driver, closed_loop_driver, cotask, task_share, QTR_driver, maneuver, drive_control, line_tracker, odometry, telemetry
 
 # Bluetooth Initialization
 BT_ser = UART(1, 115200)
@@ -16,33 +18,43 @@ Ki_motor = 2.75
 Kd_motor = 0.00
 track_width = 5.86  # in
 wheel_radius = 1.42  # in
+line_oversample = 4  # Line sensor samples per read, about 0.2 ms
+sensor_offset = 3.0  # in, line sensor ahead of the axle
+stream_telemetry = False  # Send binary motor frames over Bluetooth in place of the printed table
+
+# Timers which pace interrupts and timed reads; each needs its own, as setting
+# one up again changes the rate of whatever else is using it
+line_burst_timer = 6  # Line sensor burst samples at 20 kHz
+imu_sample_timer = 7  # IMU reads at 100 Hz
+encoder_sample_timer = 16  # Encoder samples at 200 Hz
 
 # Bump Sensing Logic
 bump_flag = False
 
-def obstacle_nav(left_pwm, right_pwm, time):
-    '''!@brief Directly set motor PWM for obstacle navigation.
-        @param left_pwm PWM value for the left motor (-100 to 100).
-        @param right_pwm PWM value for the right motor (-100 to 100).
-        @param time Duration to apply the PWM values (in milliseconds).
-    '''
-    mot_A.set_duty(left_pwm)
-    mot_B.set_duty(right_pwm)
-    start_time = ticks_ms()
-    while ticks_diff(ticks_ms(), start_time) < time:
-        pass  # Wait for the specified time
-    mot_A.set_duty(0)
-    mot_B.set_duty(0)
-    share_adjusted_velocity_A.put(0)
-    share_adjusted_velocity_B.put(0)
-    mot_A.set_duty(0)
-    mot_B.set_duty(0)
-    mot_A_control.reset()  # Reset feedback controller for Motor A
-    mot_B_control.reset()  # Reset feedback controller for Motor B
-    
+# Closed-loop segments used to drive around the obstacle after a bump, using
+# the IMU heading and the encoders. The distances are those the open-loop
+# segments used to cover at 20% PWM.
+BUMP_MANEUVER = (
+    maneuver.drive(-1.0),  # Reverse
+    maneuver.turn(90),     # Turn 90 degrees right
+    maneuver.drive(6.5),   # Go straight
+    maneuver.turn(-90),    # Turn 90 degrees left
+    maneuver.drive(10.5),  # Go straight
+    maneuver.turn(-90),    # Turn 90 degrees left
+    maneuver.drive(6.0),   # Go straight
+    maneuver.turn(90),     # Turn 90 degrees right to return to original direction
+)
+
 # Return Logic
 return_flag = False
 first_time = ticks_ms()
+finish_point = None  # (x, y) of the finish in inches from the start, or None to stop after course_time
+finish_radius = 4.0  # in, how close to finish_point counts as finishing
+course_time = 60000  # ms, time the course takes when finish_point isn't set
+
+# Set by the IMU task once it has published its first heading, which the
+# odometry then takes as the robot's starting heading
+imu_ready = False
 
 def handle_bump(line):
     global bump_flag
@@ -53,10 +65,16 @@ tim_N = Timer(3, period=65535, prescaler=0)
 tim_M = Timer(2, period=65535, prescaler=0)
 tim_A = Timer(1, freq=20000)
 tim_B = Timer(4, freq=20000)
+# Free-running 1 MHz timer which times the encoder edges at low speed; channel A
+# of each encoder is also wired to one of its input capture pins
+tim_C = Timer(15, period=65535, prescaler=79)
 
 # Encoder Initializations
-enc_A = encoder_driver.Encoder(tim_N, Pin.cpu.B4, Pin.cpu.B5)
-enc_B = encoder_driver.Encoder(tim_M, Pin.cpu.A0, Pin.cpu.A1)
+enc_A = encoder_driver.Encoder(tim_N, Pin.cpu.B4, Pin.cpu.B5, tim_C, 1, Pin.cpu.B14)
+enc_B = encoder_driver.Encoder(tim_M, Pin.cpu.A0, Pin.cpu.A1, tim_C, 2, Pin.cpu.B15)
+# Both counters are sampled from a timer so that no counts are lost if the
+# scheduler is held up
+enc_sampler = encoder_driver.EncoderSampler((enc_A, enc_B), timer=encoder_sample_timer, freq=200)
 
 # Motor Initializations
 mot_A = romi_driver.Romi(tim_A, Pin.cpu.B3, Pin.cpu.A7, Pin.cpu.A8)
@@ -75,6 +93,78 @@ share_adjusted_velocity_A = task_share.Share('f', thread_protect=False, name="Ad
 share_adjusted_velocity_B = task_share.Share('f', thread_protect=False, name="Adjusted_Velocity_B")
 share_heading = task_share.Share('f', thread_protect=False, name="Heading")
 share_yaw = task_share.Share('f', thread_protect=False, name = "Yaw")
+share_unwrapped_heading = task_share.Share('f', thread_protect=False, name="Unwrapped_Heading")
+share_maneuver = task_share.Share('h', thread_protect=False, name="Maneuver")
+share_x = task_share.Share('f', thread_protect=False, name="X")
+share_y = task_share.Share('f', thread_protect=False, name="Y")
+share_theta = task_share.Share('f', thread_protect=False, name="Theta")
+# Time (us) and both wheels' positions and velocities from the same motor cycle
+motor_record = task_share.Record(telemetry.MOTOR_FORMAT, name="Motors")
+
+# Binary frames of every motor cycle, decoded on a PC by telemetry_decode.py
+motor_telemetry = telemetry.Telemetry(BT_ser, motor_record)
+
+# Non-blocking executor for the obstacle and return maneuvers
+nav = maneuver.Maneuver(mot_A, mot_B, share_maneuver, share_unwrapped_heading,
+                        share_position_A, share_position_B, wheel_radius)
+
+def motors_held():
+    '''!@brief Checks whether the motors are being driven open-loop.
+        @return True during bump handling or while a maneuver is running.
+    '''
+    return bump_flag or nav.busy()
+
+# Fused closed-loop velocity control of both wheels
+drive = drive_control.DiffDrive(enc_A, enc_B, mot_A, mot_B,
+                                mot_A_control, mot_B_control,
+                                share_adjusted_velocity_A, share_adjusted_velocity_B,
+                                share_position_A, share_velocity_A,
+                                share_position_B, share_velocity_B,
+                                hold=motors_held, record=motor_record)
+
+# Pose of the robot relative to where it started, from the wheels and the IMU
+odo = odometry.Odometry(share_position_A, share_position_B, share_unwrapped_heading,
+                        share_x, share_y, share_theta, wheel_radius, track_width,
+                        ready=lambda: imu_ready)
+
+def course_finished(been_away):
+    '''!@brief Checks whether the robot has reached the end of the course.
+        @details With @c finish_point set, the course is finished when the pose
+                 comes within @c finish_radius of it, once the robot has first
+                 been well away from it. Otherwise it's finished after
+                 @c course_time.
+        @param been_away True once the robot has been well away from the finish.
+        @return A tuple of whether the course is finished and the new value
+                of @c been_away.
+    '''
+    if finish_point is None:
+        return ticks_diff(ticks_ms(), first_time) > course_time, been_away
+    distance = math.sqrt((share_x.get() - finish_point[0]) ** 2
+                         + (share_y.get() - finish_point[1]) ** 2)
+    if distance > 3 * finish_radius:
+        been_away = True
+    return been_away and distance < finish_radius, been_away
+
+def return_maneuver():
+    '''!@brief Makes the segments which take the robot from its pose back to the start.
+        @details The robot turns to face the start, drives straight there, then
+                 turns to face the way it started.
+        @return A tuple of maneuver segments.
+    '''
+    x = share_x.get()
+    y = share_y.get()
+    bearing = math.atan2(-y, -x)
+    distance = math.sqrt(x * x + y * y)
+    # Maneuver turns are clockwise in degrees; the pose is counterclockwise
+    face_start = (math.degrees(share_theta.get() - bearing) + 180) % 360 - 180
+    face_forward = (math.degrees(bearing) + 180) % 360 - 180
+    return (maneuver.turn(face_start),
+            maneuver.drive(distance, timeout=int(2000 + 500 * distance)),
+            maneuver.turn(face_forward))
+
+# Estimate of where the line is, kept up through gaps in the line; its
+# position and covariance can be read by any task
+tracker = line_tracker.LineTracker(offset=sensor_offset)
         
 def task_line_following():
     global return_flag
@@ -88,6 +178,9 @@ def task_line_following():
     centroid_set = 0.0
     max_integral = 10.0  # Clamp for integral term
 
+    qtr = QTR_driver.QTRArray(threshold=threshold, oversample=line_oversample, timer=line_burst_timer)
+    qtr.load_calibration()  # Saved per-sensor levels, if calibrate_line_sensor() has been run
+
     # Variables
     integral_line = 0.0
     last_time = ticks_ms()
@@ -95,6 +188,8 @@ def task_line_following():
     last_error = 0.0
     last_left_velocity = 0.0
     last_right_velocity = 0.0    
+    returning = False
+    been_away = False
     sense_time = ticks_ms()
     while ticks_diff(ticks_ms(), sense_time) < 2000:
         # Keep the motors spinning with default velocities during the delay
@@ -104,23 +199,28 @@ def task_line_following():
         yield 0  # Allow other tasks to run
         
     while True:
-        if ticks_diff(ticks_ms(),first_time) > 60000:
+        finished, been_away = course_finished(been_away)
+        if finished:
             return_flag = True
         if return_flag == 0:
             # Step 1: Read the line position
-            sensor_data = QTR_driver.read_and_normalize_data()
-            binary_data = QTR_driver.apply_threshold(sensor_data, threshold)
-            centroid_offset = QTR_driver.compute_centroid(binary_data)
+            centroid_offset = qtr.read_centroid()
+            current_time = ticks_ms()
+            dt = ticks_diff(current_time, last_time) / 1000  # Time step in seconds
+            last_time = current_time
+
+            # Update the line estimate from the reading and how the robot has moved
+            speed = (share_velocity_A.get() + share_velocity_B.get()) * wheel_radius / 2  # [in/s]
+            estimate = tracker.update(centroid_offset, speed, share_yaw.get(), dt)
+            if centroid_offset is not None:
+                last_line_time = current_time
+            else:
+                # Steer along the estimate through gaps until it gets too uncertain
+                centroid_offset = None if tracker.lost() else estimate
     
             if centroid_offset is not None:
-                # Step 2: Compute error and reset the no-line timer
+                # Step 2 and 3: Compute error and calculate correction factor
                 error = -(centroid_set - centroid_offset)  # Negative because we want 0 at the center
-                last_line_time = ticks_ms()
-    
-                # Step 3: Calculate correction factor
-                current_time = ticks_ms()
-                dt = ticks_diff(current_time, last_time) / 1000  # Time step in seconds
-                last_time = current_time
     
                 # Step 4: Detect sharp turn and cap velocity
                 if abs(error) > 0.6:  # Threshold for sharp turn detection
@@ -151,8 +251,7 @@ def task_line_following():
                 last_left_velocity = left_angular_velocity
                 last_right_velocity = right_angular_velocity
             else:
-                # No line detected
-                current_time = ticks_ms()
+                # No line detected and the estimate is lost
                 if ticks_diff(current_time, last_line_time) < no_line_timeout:
                     # Force balanced movement
                     reduced_velocity = 0.5 * linear_velocity  # Safe reduced velocity
@@ -170,10 +269,10 @@ def task_line_following():
                     # Reset last velocities to avoid propagating old values
                     last_left_velocity = 0
                     last_right_velocity = 0
-        else:
-            obstacle_nav(20, 20, 1000)
-            obstacle_nav(-20, -20, 6000)
-            obstacle_nav(-20, 20, 1200)
+        elif not returning:
+            nav.start(return_maneuver())
+            returning = True
+        elif not nav.busy():
             mot_A.set_duty(0)
             mot_B.set_duty(0)
             mot_A.disable()
@@ -184,114 +283,26 @@ def task_line_following():
 
 def task_bump_handling():
     global bump_flag
+    state = 0
     while True:    
-        if bump_flag:
-            # Reverse
-            obstacle_nav(-20, -22, 200)  # Reverse with 50% PWM for 1 second
-            # Turn 90 degrees
-            obstacle_nav(20, -22, 600)   # Turn right with differential PWM
-            # Go straight
-            obstacle_nav(20, 22, 1500)  # Go straight with 50% PWM for 1 second
-            # Turn -90 degrees
-            obstacle_nav(-20, 22, 500)  # Turn left with differential PWM
-            # Go straight
-            obstacle_nav(20, 22, 2500)  # Go straight with 50% PWM for 1 second
-            # Turn -90 degrees
-            obstacle_nav(-20, 22, 500)  # Turn left with differential PWM
-            # Go straight
-            obstacle_nav(20, 22, 1350)  # Go straight with 50% PWM for 1 second
-            # Turn 90 degrees to return to original direction
-            obstacle_nav(20, -22, 500)  # Turn right with differential PWM
-            obstacle_nav(20, 20, 10)
-
-            # Ensure motors and shared variables are reset
-            share_adjusted_velocity_A.put(0)
-            share_adjusted_velocity_B.put(0)
-            mot_A.set_duty(0)
-            mot_B.set_duty(0)
-            mot_A_control.reset()  # Reset feedback controller for Motor A
-            mot_B_control.reset()  # Reset feedback controller for Motor B
-            # Reset bump flag
-            bump_flag = False
-        yield 0
-    
-# Generator Function to control Motor A and log encoder data
-def task_motor_A():
-    '''!@brief Controls Motor A using adjusted velocity from yaw rate feedback.
-        @details This task reads the adjusted velocity for Motor A and applies
-                 closed-loop control.
-    '''
-    mot_A.enable()
-    last_time = ticks_ms()
-    try:
-        while True:
-            if bump_flag:
-                mot_B.set_duty(0)  # Ensure motor stops during bump handling
-                share_adjusted_velocity_B.put(0)
-                yield 0
-                continue
-            current_time = ticks_ms()
-            delta_time = ticks_diff(current_time, last_time) / 1000
-            last_time = current_time
-            enc_A.update()
-            position_A = enc_A.get_position_radians() 
-
-            if delta_time == 0:
-                delta_time = 0.001
-
-            actual_velocity_A = (enc_A.get_delta() * 6.28) / (1440 * delta_time)
-            adjusted_velocity_A = share_adjusted_velocity_A.get()
-            PWM_A = mot_A_control.feedback(adjusted_velocity_A, actual_velocity_A)
-            mot_A.set_duty(PWM_A)
-            
-            # Update shared variables
-            share_position_A.put(position_A)
-            share_velocity_A.put(actual_velocity_A)
-            
-            yield 0
-    finally:
-        mot_A.set_duty(0)
-        mot_A.disable()
-
-# Generator Function to control Motor B and log encoder data
-def task_motor_B():
-    '''!@brief   Controls Motor B using adjusted velocity from yaw rate feedback.
-        @details This task reads the adjusted velocity for Motor B and applies '
-                 closed-loop control.
-    '''
-    mot_B.enable()
-    last_time = ticks_ms()
-    try:
-        while True:
-            current_time = ticks_ms()
-            delta_time = ticks_diff(current_time, last_time) / 1000
-            last_time = current_time
+        if state == 0:
+            # Wait for a bump, then start driving around the obstacle
             if bump_flag:
-                mot_B.set_duty(0)  # Ensure motor stops during bump handling
+                nav.start(BUMP_MANEUVER)
+                state = 1
+        elif state == 1:
+            # Wait for the maneuver to finish
+            if not nav.busy():
+                # Ensure motors and shared variables are reset
+                share_adjusted_velocity_A.put(0)
                 share_adjusted_velocity_B.put(0)
-                yield 0
-                continue
-            
-            enc_B.update()
-            position_B = enc_B.get_position_radians()
-
-            if delta_time == 0:
-                delta_time = 0.001
-
-            actual_velocity_B = (enc_B.get_delta() * 6.28) / (1440 * delta_time)
-            adjusted_velocity_B = share_adjusted_velocity_B.get()
-            PWM_B = mot_B_control.feedback(adjusted_velocity_B, actual_velocity_B)
-            mot_B.set_duty(PWM_B)
-            
-            # Update shared variables
-            share_position_B.put(position_B)
-            share_velocity_B.put(actual_velocity_B)
-            
-            yield 0
-    finally:
-        mot_B.set_duty(0)
-        mot_B.disable()
-
+                mot_A_control.reset()  # Reset feedback controller for Motor A
+                mot_B_control.reset()  # Reset feedback controller for Motor B
+                # Reset bump flag
+                bump_flag = False
+                state = 0
+        yield state
+    
 # Generator Function to read IMU Data
 def task_read_IMU():
     '''!@brief   Reads data from the IMU, including yaw rate and heading, 
@@ -299,15 +310,42 @@ def task_read_IMU():
         @details This task reads IMU data (yaw rate and heading) and computes
                  a correction for yaw rate using feedback control.
     '''
+    global imu_ready
     imu = IMU_driver.BNO055()
-    imu.set_mode(0x0C)  # Set IMU to operation mode (e.g., IMU mode)
+
+    # Start in NDOF fusion mode from the saved calibration profile, if there
+    # is one; other tasks keep running while the IMU switches modes
+    yield from imu.boot(IMU_driver.NDOF_MODE)
+
+    # Read the gyro, Euler angle and quaternion registers at 100 Hz from a
+    # timer, so the shares get the freshest sample whenever this task runs
+    imu.start_sampling(timer=imu_sample_timer, freq=100, fields=IMU_driver.GYRO | IMU_driver.EULER | IMU_driver.QUAT)
+    # Readings are published straight away while the calibration, and live
+    # calibration if the saved profile is rejected, is followed a step per run
+    calibration = imu.calibrate()
+    # A read can be stored between two puts, so each set of shares is
+    # published from a copy of one whole sample
+    sample = array('f', [0.0] * IMU_driver.NUM_VALUES)
 
     while True:
-        # Read IMU data
-        yaw_rate = imu.read_yaw()  # rad/s
-        heading = imu.read_heading()
-        share_yaw.put(yaw_rate)  # Share current yaw rate
-        share_heading.put(heading)  # Share current heading
+        if calibration is not None:
+            try:
+                next(calibration)
+            except StopIteration:
+                calibration = None
+                # Text would land among the binary frames on the same UART
+                if not stream_telemetry:
+                    if imu.calibration_time is None:
+                        print("IMU not calibrated; carrying on uncalibrated")
+                    else:
+                        source = "saved profile" if imu.profile_accepted else "live calibration"
+                        print(f"IMU calibrated in {imu.calibration_time} ms from {source}")
+
+        if imu.latest(sample) is not None:
+            share_yaw.put(sample[IMU_driver.YAW_RATE])  # Share current yaw rate, rad/s
+            share_heading.put(sample[IMU_driver.HEADING])  # Share current heading
+            share_unwrapped_heading.put(sample[IMU_driver.UNWRAPPED_HEADING])  # Heading without the jump at 360
+            imu_ready = True
 
         yield 0
 
@@ -315,8 +353,9 @@ def task_read_IMU():
 # Data formatting code taken from ChatGPT
 def task_printing():
     '''!@brief   Prints motor velocities and total linear velocity in PuTTY.
-        @details This task reads motor velocities from shared variables and calculates
-                 the total linear velocity based on wheel velocities and dimensions.
+        @details This task reads motor velocities from the motor record, so both
+                 come from the same control cycle, and calculates the total
+                 linear velocity based on wheel velocities and dimensions.
     '''
     start_time = ticks_ms()
     print("Time(s) | Motor A Vel (rad/s) | Motor B Vel (rad/s) | Total Linear Vel (in/s)")
@@ -326,8 +365,7 @@ def task_printing():
         elapsed_time = ticks_diff(ticks_ms(), start_time) / 1000
 
         # Retrieve shared values
-        velocity_A = share_velocity_A.get()
-        velocity_B = share_velocity_B.get()
+        _, _, velocity_A, _, velocity_B = motor_record.get()
 
         # Calculate the total linear velocity (average of both wheels)
         total_linear_velocity = (velocity_A + velocity_B) * wheel_radius / 2  # [in/s]
@@ -338,37 +376,67 @@ def task_printing():
         yield 0
 
 
+def calibrate_line_sensor(duration=5000):
+    '''!@brief Records and saves the line sensor's white and black levels.
+        @details Run this from the REPL and sweep the sensor array back and forth
+                 over the line until it finishes. The saved levels are loaded by
+                 the line following task each time the program starts.
+        @param duration How long to record for, in milliseconds.
+    '''
+    # Sample the same way as the line following task so the levels match
+    qtr = QTR_driver.QTRArray(oversample=line_oversample, timer=line_burst_timer)
+    qtr.calibrate(duration)
+    qtr.save_calibration()
+    if not stream_telemetry:
+        print("White:", list(qtr.white), "Black:", list(qtr.black))
+
+# Bump switch interrupts, kept here so they aren't garbage collected
+bump_interrupts = []
+
+def create_tasks():
+    '''!@brief   Sets up the bump interrupts and adds every task to the scheduler.
+        @details This is kept apart from the main program so that the same set of
+                 tasks can be run by the host simulator in romi_sim.py.
+    '''
+    for pin in (Pin.cpu.C6, Pin.cpu.C8, Pin.cpu.C9):
+        bump_interrupts.append(ExtInt(pin, ExtInt.IRQ_RISING, Pin.PULL_DOWN, handle_bump))
+    enc_sampler.start()
+
+    # Create tasks
+    task1 = cotask.Task(drive.run, "Task 1", period=17.5, priority=1, overrun=cotask.SKIP)
+    task2 = cotask.Task(odo.run, "Task 2", period=17.5, priority=1, overrun=cotask.SKIP)
+    task3 = cotask.Task(task_line_following, "Task 3", period=30.0, priority=1, overrun=cotask.SKIP)
+    task4 = cotask.Task(task_read_IMU, "Task 4", period = 20.0, priority=2, overrun=cotask.SKIP)
+    if stream_telemetry:
+        task5 = cotask.Task(motor_telemetry.run, "Task 5", period=10.0, priority=2, overrun=cotask.SKIP)
+    else:
+        task5 = cotask.Task(task_printing, "Task 5", period=250.0, priority=2, overrun=cotask.REPHASE)
+    task6 = cotask.Task(task_bump_handling, "Task 6", period=10.0, priority=1)
+    task7 = cotask.Task(nav.run, "Task 7", period=10.0, priority=2, overrun=cotask.SKIP)
+
+    # Append tasks to task list
+    cotask.task_list.append(task1)
+    cotask.task_list.append(task2)
+    cotask.task_list.append(task3)
+    cotask.task_list.append(task4)
+    cotask.task_list.append(task5)
+    cotask.task_list.append(task6)
+    cotask.task_list.append(task7)
+
 # Main Program to be Executed
 if __name__ == "__main__":
     # Start scheduler
     try:
-        ExtInt_A = ExtInt(Pin.cpu.C6, ExtInt.IRQ_RISING, Pin.PULL_DOWN, handle_bump)
-        ExtInt_B = ExtInt(Pin.cpu.C8, ExtInt.IRQ_RISING, Pin.PULL_DOWN, handle_bump)
-        ExtInt_C = ExtInt(Pin.cpu.C9, ExtInt.IRQ_RISING, Pin.PULL_DOWN, handle_bump)
-        
-        # Create tasks
-        task1 = cotask.Task(task_motor_A, "Task 1", period=17.5, priority=1)
-        task2 = cotask.Task(task_motor_B, "Task 2", period=17.5, priority=1)
-        task3 = cotask.Task(task_line_following, "Task 3", period=30.0, priority=1)
-        task4 = cotask.Task(task_read_IMU, "Task 4", period = 20.0, priority=2)
-        task5 = cotask.Task(task_printing, "Task 5", period=250.0, priority=2)
-        task6 = cotask.Task(task_bump_handling, "Task 6", period=10.0, priority=1)
-
-        # Append tasks to task list
-        cotask.task_list.append(task1)
-        cotask.task_list.append(task2)
-        cotask.task_list.append(task3)
-        cotask.task_list.append(task4)
-        cotask.task_list.append(task5)
-        cotask.task_list.append(task6)
+        create_tasks()
         while True:
             cotask.task_list.pri_sched()  # Continuously run the scheduler
     except KeyboardInterrupt:
         pass
     finally:
+        enc_sampler.stop()
         mot_A.set_duty(0)
         mot_B.set_duty(0)
         mot_A.disable()
         mot_B.disable()
         mot_A_control.reset()
-        mot_B_control.reset()
\ No newline at end of file
+        mot_B_control.reset()
@@ -0,0 +1,240 @@
+from time import ticks_ms, ticks_diff, ticks_add
+
+## Value held in the progress share when no maneuver is being executed
+IDLE = -1
+
+## Marks a closed-loop turn segment, made by turn()
+TURN = 'turn'
+
+## Marks a closed-loop straight drive segment, made by drive()
+DRIVE = 'drive'
+
+def turn(angle, pwm=25, tolerance=2.0, timeout=3000):
+    '''!@brief    Makes a segment which turns in place by an angle.
+        @details  The angle is added to the heading the maneuver is holding,
+                  not to wherever the robot happens to be pointing, so errors
+                  don't build up over a sequence of turns.
+        @param    angle      Angle to turn in degrees, positive clockwise
+                  pwm        Largest PWM percent applied to either motor
+                  tolerance  Heading error in degrees at which the turn is done
+                  timeout    Time after which the turn is abandoned, in ms
+        @return   The segment tuple
+    '''
+    return (TURN, angle, pwm, tolerance, timeout)
+
+def drive(distance, pwm=25, tolerance=0.25, timeout=5000):
+    '''!@brief    Makes a segment which drives straight for a distance.
+        @details  The robot holds the maneuver's heading while it drives.
+        @param    distance   Distance to drive in inches, negative to reverse
+                  pwm        Largest PWM percent applied to either motor
+                  tolerance  Distance error in inches at which the drive is done
+                  timeout    Time after which the drive is abandoned, in ms
+        @return   The segment tuple
+    '''
+    return (DRIVE, distance, pwm, tolerance, timeout)
+
+
+class Maneuver:
+    '''!@brief    Runs sequences of motor segments without blocking.
+        @details  A maneuver is a list of segments, each of which drives both
+                  motors until the segment is complete. Four kinds of segment
+                  are supported:
+                  - @c (left_pwm, right_pwm, duration) runs for @c duration
+                    milliseconds
+                  - @c (left_pwm, right_pwm, timeout, heading, tolerance) runs
+                    until the IMU heading is within @c tolerance degrees of
+                    @c heading, or until @c timeout milliseconds have passed
+                  - turn() segments turn in place to a heading, with the PWM
+                    proportional to the heading error
+                  - drive() segments drive a distance measured by the wheel
+                    encoders, with the PWM proportional to the distance left
+                    and steered to hold the heading
+                  The @c run() generator is run as a cotask task; each time it
+                  is scheduled it checks the current segment and moves on to
+                  the next one if it's done, so other tasks keep running while
+                  a maneuver is in progress. The index of the segment being
+                  executed, or @c IDLE when finished, is written to a share.
+
+                  Each turn() and drive() segment which finishes adds a tuple
+                  of its index, the time it took in milliseconds and its
+                  error when it finished (degrees or inches) to @c results,
+                  so the speeds and gains can be pushed up while checking
+                  that accuracy holds.
+    '''
+    def __init__(self, mot_A, mot_B, progress, heading=None, position_A=None,
+                 position_B=None, wheel_radius=1.42, kp_turn=0.6, kp_drive=6.0,
+                 kp_hold=1.0, min_pwm=8):
+        '''!@brief    Initializes a maneuver executor for a pair of motors.
+            @param    mot_A         The Romi motor driver for the left motor
+                      mot_B         The Romi motor driver for the right motor
+                      progress      A share which receives the index of the segment
+                                    being run, or @c IDLE when no maneuver is running
+                      heading       A share holding the IMU heading in degrees,
+                                    needed only for heading, turn and drive
+                                    segments; for turns past 180 degrees it
+                                    should be the unwrapped heading
+                      position_A    A share holding the left wheel position in
+                                    radians, needed only for drive segments
+                      position_B    The same for the right wheel
+                      wheel_radius  Wheel radius in inches
+                      kp_turn       PWM percent per degree of heading error
+                      kp_drive      PWM percent per inch of distance left
+                      kp_hold       PWM percent per degree of heading error
+                                    added to steer while driving
+                      min_pwm       Smallest PWM percent used while a closed
+                                    loop segment is short of its target, to
+                                    get past friction
+        '''
+        self.mot_A = mot_A
+        self.mot_B = mot_B
+        self.progress = progress
+        self.heading = heading
+        self.position_A = position_A
+        self.position_B = position_B
+        self.wheel_radius = wheel_radius
+        self.kp_turn = kp_turn
+        self.kp_drive = kp_drive
+        self.kp_hold = kp_hold
+        self.min_pwm = min_pwm
+        self.segments = ()
+        self.index = IDLE
+        self.start_time = None
+        self.target_heading = None
+        self.start_distance = 0.0
+        self.error = 0.0
+        self.results = []
+        self.progress.put(IDLE)
+
+    def start(self, segments):
+        '''!@brief    Begins executing a list of segments.
+            @details  Any maneuver already in progress is abandoned. The first
+                      segment is applied the next time the task runs, and the
+                      heading then becomes the one which turns are made from.
+            @param    segments  A list or tuple of segment tuples
+        '''
+        self.segments = segments
+        self.start_time = None
+        self.target_heading = None
+        self.results = []
+        self.index = 0 if segments else IDLE
+        self.progress.put(self.index)
+
+    def stop(self):
+        '''!@brief    Abandons any maneuver in progress and stops both motors.'''
+        self.index = IDLE
+        self.progress.put(IDLE)
+        self.mot_A.set_duty(0)
+        self.mot_B.set_duty(0)
+
+    def busy(self):
+        '''!@brief    Checks whether a maneuver is being executed.
+            @return   True if a maneuver is in progress, False if not
+        '''
+        return self.index != IDLE
+
+    def _distance(self):
+        '''!@brief    Finds how far the robot has driven, from the wheel positions.
+            @return   The average distance driven by the two wheels in inches
+        '''
+        return (self.position_A.get() + self.position_B.get()) * self.wheel_radius / 2
+
+    def _error(self, segment):
+        '''!@brief    Finds how far a closed-loop segment is from its target.
+            @return   Degrees left to turn, clockwise positive, for a turn, or
+                      inches left to drive for a drive
+        '''
+        if segment[0] == TURN:
+            return self.target_heading - self.heading.get()
+        return self.start_distance + segment[1] - self._distance()
+
+    def _limit(self, pwm, segment):
+        '''!@brief    Clamps a closed-loop PWM between the minimum and the segment's maximum.'''
+        if pwm > 0:
+            return min(max(pwm, self.min_pwm), segment[2])
+        if pwm < 0:
+            return max(min(pwm, -self.min_pwm), -segment[2])
+        return 0
+
+    def _steer(self, segment):
+        '''!@brief    Sets the motors for a closed-loop segment from its error.'''
+        error = self._error(segment)
+        self.error = error
+        if segment[0] == TURN:
+            pwm = self._limit(self.kp_turn * error, segment)
+            self.mot_A.set_duty(pwm)
+            self.mot_B.set_duty(-pwm)
+        else:
+            pwm = self._limit(self.kp_drive * error, segment)
+            correction = self.kp_hold * (self.target_heading - self.heading.get())
+            self.mot_A.set_duty(pwm + correction)
+            self.mot_B.set_duty(pwm - correction)
+
+    def _apply(self, segment):
+        '''!@brief    Starts a segment, setting up its target and driving the motors.'''
+        kind = segment[0]
+        if kind == TURN or kind == DRIVE:
+            if self.target_heading is None:
+                self.target_heading = self.heading.get()
+            if kind == TURN:
+                self.target_heading += segment[1]
+            else:
+                self.start_distance = self._distance()
+            self._steer(segment)
+        else:
+            self.mot_A.set_duty(segment[0])
+            self.mot_B.set_duty(segment[1])
+
+    def _segment_done(self, segment, now):
+        '''!@brief    Checks whether the current segment has finished.
+            @param    segment  The segment being executed
+                      now      The current time in milliseconds
+            @return   True if the segment's end condition has been met
+        '''
+        if segment[0] == TURN or segment[0] == DRIVE:
+            error = self._error(segment)
+            self.error = error
+            return (abs(error) <= segment[3]
+                    or ticks_diff(now, self.start_time) >= segment[4])
+        if ticks_diff(now, self.start_time) >= segment[2]:
+            return True
+        if len(segment) > 3:
+            error = (segment[3] - self.heading.get() + 180) % 360 - 180
+            return abs(error) <= segment[4]
+        return False
+
+    def run(self):
+        '''!@brief    Generator which advances the maneuver by one step per run.
+            @details  Timed segments are chained from the scheduled end of the
+                      previous segment rather than the time at which the task
+                      noticed it had ended, so lateness doesn't accumulate
+                      along a sequence. Other segments start when entered.
+                      Closed-loop segments update the motors on every run.
+        '''
+        while True:
+            if self.index != IDLE:
+                segment = self.segments[self.index]
+                now = ticks_ms()
+                if self.start_time is None:
+                    self.start_time = now
+                    self._apply(segment)
+                elif self._segment_done(segment, now):
+                    if segment[0] == TURN or segment[0] == DRIVE:
+                        self.results.append((self.index,
+                                             ticks_diff(now, self.start_time),
+                                             self.error))
+                        self.start_time = now
+                    elif len(segment) > 3:
+                        self.start_time = now
+                    else:
+                        self.start_time = ticks_add(self.start_time, segment[2])
+                    self.index += 1
+                    if self.index < len(self.segments):
+                        self._apply(self.segments[self.index])
+                    else:
+                        self.index = IDLE
+                        self.mot_A.set_duty(0)
+                        self.mot_B.set_duty(0)
+                    self.progress.put(self.index)
+                elif segment[0] == TURN or segment[0] == DRIVE:
+                    self._steer(segment)
+            yield self.index
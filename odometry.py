@@ -0,0 +1,96 @@
+from math import cos, sin, radians
+
+class Odometry:
+    '''!@brief    Dead reckoning of the robot's pose from the wheels and the IMU.
+        @details  Objects of this class track the robot's position (x, y) in
+                  inches and its heading theta in radians, counterclockwise
+                  from the direction it faced when tracking started. Each
+                  update takes the distance each wheel has turned since the
+                  last one, from the wheel position shares published by the
+                  motor task, so no counts are lost or counted twice if this
+                  task runs at a different moment from the motor task.
+
+                  The heading is a complementary filter of the two sources:
+                  the turn worked out from the wheels is trusted from one
+                  update to the next, while the IMU heading, which doesn't
+                  drift when the wheels slip, pulls it back over a time
+                  constant of several updates. Until the IMU is ready the
+                  wheels are used alone. The position is moved along the
+                  average of the old and new headings.
+
+                  The pose is published to three shares on every update.
+    '''
+    def __init__(self, position_A, position_B, heading, x, y, theta,
+                 wheel_radius=1.42, track_width=5.86, alpha=0.98, ready=None):
+        '''!@brief    Initializes pose tracking from the wheel and IMU shares.
+            @param    position_A, position_B  Shares holding each wheel's
+                                              position in radians
+                      heading                 Share holding the unwrapped IMU
+                                              heading in degrees, clockwise
+                      x, y, theta             Shares which receive the pose, in
+                                              inches and radians
+                      wheel_radius            Wheel radius in inches
+                      track_width             Distance between the wheels in inches
+                      alpha                   Weight given to the wheels' heading
+                                              on each update, between 0 and 1
+                      ready                   A function which returns True once
+                                              the IMU heading can be used, or
+                                              None if it always can
+        '''
+        self.position_A = position_A
+        self.position_B = position_B
+        self.heading = heading
+        self.x_share = x
+        self.y_share = y
+        self.theta_share = theta
+        self.wheel_radius = wheel_radius
+        self.track_width = track_width
+        self.alpha = alpha
+        self.ready = ready
+        self.reset()
+
+    def reset(self):
+        '''!@brief    Makes the robot's current pose the origin, facing along +x.'''
+        self.x = 0.0
+        self.y = 0.0
+        self.theta = 0.0
+        self.last_A = self.position_A.get()
+        self.last_B = self.position_B.get()
+        self.heading_offset = None
+        self.publish()
+
+    def publish(self):
+        '''!@brief    Puts the pose into the shares.'''
+        self.x_share.put(self.x)
+        self.y_share.put(self.y)
+        self.theta_share.put(self.theta)
+
+    def update(self):
+        '''!@brief    Moves the pose on by the wheel travel since the last update.'''
+        position_A = self.position_A.get()
+        position_B = self.position_B.get()
+        left = (position_A - self.last_A) * self.wheel_radius
+        right = (position_B - self.last_B) * self.wheel_radius
+        self.last_A = position_A
+        self.last_B = position_B
+
+        theta = self.theta + (right - left) / self.track_width
+        if self.ready is None or self.ready():
+            # The IMU heading is clockwise in degrees, from wherever it started
+            imu_theta = -radians(self.heading.get())
+            if self.heading_offset is None:
+                self.heading_offset = imu_theta - theta
+            theta = self.alpha * theta + (1 - self.alpha) * (imu_theta - self.heading_offset)
+
+        middle = (self.theta + theta) / 2
+        distance = (left + right) / 2
+        self.x += distance * cos(middle)
+        self.y += distance * sin(middle)
+        self.theta = theta
+        self.publish()
+
+    def run(self):
+        '''!@brief    Generator which updates the pose once per run.'''
+        while True:
+            self.update()
+            yield 0
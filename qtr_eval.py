@@ -0,0 +1,142 @@
+'''!@file     qtr_eval.py
+    @brief    Offline comparison of the QTRArray centroid modes.
+    @details  Replays frames of raw line sensor readings through QTRArray in
+              each centroid mode and reports how finely and how steadily each
+              mode resolves the position of the line. Frames are read from a
+              CSV file with one frame per row: six raw readings, optionally
+              followed by the true line position in inches. Without a file,
+              frames are made by sweeping the simulated sensor array of
+              romi_sim.py across a straight line.
+
+              This file runs on a PC, not on the robot.
+
+              @b Example:
+              @code
+                  python qtr_eval.py                 # simulated sweep
+                  python qtr_eval.py frames.csv      # recorded frames
+              @endcode
+'''
+import csv
+import math
+import sys
+
+import romi_sim
+
+romi_sim.install()
+
+import QTR_driver
+
+## The centroid modes compared, with the names used in the report
+MODES = (('binary', QTR_driver.BINARY), ('analog', QTR_driver.ANALOG),
+         ('parabolic', QTR_driver.PARABOLIC))
+
+def load_frames(path):
+    '''!@brief    Reads recorded frames from a CSV file.
+        @param    path  Name of the file
+        @return   A list of (raw readings, true position or None) tuples
+    '''
+    frames = []
+    with open(path, newline='') as file:
+        for row in csv.reader(file):
+            try:
+                numbers = [float(item) for item in row if item.strip()]
+            except ValueError:
+                continue        # Skip a header row
+            raw = [int(value) for value in numbers[:6]]
+            frames.append((raw, numbers[6] if len(numbers) > 6 else None))
+    return frames
+
+def simulate_frames(span=0.8, step=0.005, repeats=20, noise=20):
+    '''!@brief    Makes frames by moving a straight line across the sensors.
+        @param    span     Frames cover line positions from -span to +span inches
+                  step     Distance the line moves between positions in inches
+                  repeats  Number of noisy frames taken at each position
+                  noise    Standard deviation of the ADC noise in counts
+        @return   A list of (raw readings, true position) tuples
+    '''
+    line = romi_sim.LineMap([(-100.0, 0.0), (100.0, 0.0)], closed=False)
+    sim = romi_sim.Simulator(line=line, noise=noise)
+    frames = []
+    for n in range(int(round(2 * span / step)) + 1):
+        position = -span + n * step
+        # Sensors to the robot's left see positive positions
+        sim.y = -position
+        levels = [sim.sensor_level(i) for i in range(6)]
+        for _ in range(repeats):
+            raw = [sim.sensor_reading(i, levels[i]) for i in range(6)]
+            frames.append((raw, position))
+    return frames
+
+def calibration(frames):
+    '''!@brief    Finds each sensor's white and black levels from a set of frames.
+        @return   Tuple of the lists of lowest and highest reading of each sensor
+    '''
+    white = [min(raw[i] for raw, _ in frames) for i in range(6)]
+    black = [max(raw[i] for raw, _ in frames) for i in range(6)]
+    return white, black
+
+def evaluate(frames, mode, calibrate=True):
+    '''!@brief    Finds the line position for every frame in one centroid mode.
+        @param    frames     A list of (raw readings, true position) tuples
+                  mode       The QTR_driver centroid mode
+                  calibrate  True to normalize with per-sensor levels taken from
+                             the frames, False to normalize each frame alone
+        @return   A list of positions in inches, with None where no line was found
+    '''
+    qtr = QTR_driver.QTRArray(mode=mode)
+    if calibrate:
+        qtr.set_calibration(*calibration(frames))
+    positions = []
+    for raw, _ in frames:
+        for i in range(6):
+            qtr.raw[i] = raw[i]
+        qtr.normalize()
+        positions.append(qtr.centroid())
+    return positions
+
+def summarize(frames, positions):
+    '''!@brief    Computes figures of merit for one mode's positions.
+        @return   A dictionary holding the fraction of frames in which a line
+                  was detected, the number of distinct positions reported, the
+                  typical step between them, and, when the true positions are
+                  known, the noise (standard deviation at each true position)
+                  and the RMS error
+    '''
+    found = [(p, true) for p, (_, true) in zip(positions, frames) if p is not None]
+    distinct = sorted(set(round(p, 6) for p, _ in found))
+    steps = sorted(b - a for a, b in zip(distinct, distinct[1:]))
+    result = {'detected': len(found) / len(frames) if frames else 0.0,
+              'distinct': len(distinct),
+              'resolution': steps[len(steps) // 2] if steps else math.nan,
+              'noise': math.nan, 'rms_error': math.nan}
+
+    known = [(p, true) for p, true in found if true is not None]
+    if known:
+        groups = {}
+        for p, true in known:
+            groups.setdefault(true, []).append(p)
+        variances = []
+        for group in groups.values():
+            mean = sum(group) / len(group)
+            variances.append(sum((p - mean) ** 2 for p in group) / len(group))
+        result['noise'] = math.sqrt(sum(variances) / len(variances))
+        result['rms_error'] = math.sqrt(sum((p - true) ** 2 for p, true in known)
+                                        / len(known))
+    return result
+
+def report(frames, calibrate=True):
+    '''!@brief    Prints a table comparing the centroid modes on a set of frames.'''
+    print(f'{len(frames)} frames, '
+          f'{"per-sensor calibration" if calibrate else "per-frame normalization"}')
+    print('MODE        DETECTED  DISTINCT  RESOLUTION(in)  NOISE(in)  RMS ERROR(in)')
+    for name, mode in MODES:
+        stats = summarize(frames, evaluate(frames, mode, calibrate))
+        print(f'{name:<10s}{stats["detected"]:10.3f}{stats["distinct"]:10d}'
+              f'{stats["resolution"]:16.4f}{stats["noise"]:11.4f}'
+              f'{stats["rms_error"]:15.4f}')
+
+if __name__ == '__main__':
+    frames = load_frames(sys.argv[1]) if len(sys.argv) > 1 else simulate_frames()
+    report(frames, calibrate=True)
+    print()
+    report(frames, calibrate=False)
@@ -0,0 +1,895 @@
+'''!@file     romi_sim.py
+    @brief    Host-side simulator which runs the robot's code without a Nucleo.
+    @details  This module provides stand-ins for the MicroPython modules used by
+              the robot (@c pyb, @c utime, @c micropython and the tick functions
+              of @c time) which are backed by a virtual clock and a model of
+              the Romi: two DC gearmotors with a first-order response, 1440
+              count per revolution quadrature encoders, differential-drive
+              kinematics, a BNO055 which reports the simulated heading and yaw
+              rate, and a QTR array looking down at a map of the line. Time
+              only passes when the simulator advances it, so the tasks in
+              @c main.py run unmodified and much faster than real time.
+
+              This file runs on a PC, not on the robot.
+
+              @b Example:
+              @code
+                  import romi_sim
+                  sim = romi_sim.install()
+                  import main
+                  main.create_tasks()
+                  sim.run(30.0)
+                  print(sim.x, sim.y, sim.theta)
+              @endcode
+              or from a shell, to run @c main.py for 30 simulated seconds:
+              @code
+                  python romi_sim.py 30
+              @endcode
+'''
+import math
+import random
+import sys
+import time
+import types
+
+## Period of the MicroPython tick counters; tick values wrap at this number
+TICKS_PERIOD = 1 << 30
+
+## Steady-state wheel speed per percent PWM of the model motors, in rad/s
+MOTOR_GAIN = 0.15
+
+## Time constant of the model motors, in seconds
+MOTOR_TAU = 0.08
+
+## Encoder counts per wheel revolution
+COUNTS_PER_REV = 1440
+
+## Encoder counts per radian the wheel turns
+COUNTS_PER_RADIAN = COUNTS_PER_REV / (2 * math.pi)
+
+## Wheel radius in inches, as in main.py
+WHEEL_RADIUS = 1.42
+
+## Distance between the wheels in inches, as in main.py
+TRACK_WIDTH = 5.86
+
+## Distance of the line sensor array ahead of the axle, in inches
+SENSOR_OFFSET = 3.0
+
+## Spacing between adjacent line sensors, in inches
+SENSOR_SPACING = 0.315
+
+## Radius of the spot of floor seen by each line sensor, in inches
+SENSOR_SPOT = 0.15
+
+## Distance of the bump switches ahead of the axle, in inches
+BUMPER_OFFSET = 3.5
+
+## Longest step over which the model is integrated, in microseconds
+PHYSICS_STEP_US = 2000
+
+## Size of the square cells used to look up nearby parts of the line, in inches
+LINE_CELL = 2.0
+
+## ADC readings of a line sensor over the white background and the black line
+ADC_WHITE = 250
+ADC_BLACK = 3500
+
+## Pins used by each wheel's motor driver: PWM pin, direction pin, enable pin
+MOTOR_PINS = (('A8', 'A7', 'B3'), ('B6', 'B10', 'C7'))
+
+## Pins on which each wheel's encoder channel A is connected
+ENCODER_PINS = ('B4', 'A0')
+
+## Input capture pins to which each wheel's encoder channel A is also wired
+CAPTURE_PINS = ('B14', 'B15')
+
+## Clock of the Nucleo's timers before the prescaler, in Hz
+TIMER_CLOCK = 80000000
+
+## Encoder counts between rising edges of channel A
+COUNTS_PER_EDGE = 4
+
+## Pins of the line sensors, in the order used by QTR_driver
+QTR_PINS = ('A4', 'C4', 'A6', 'B0', 'C5', 'B1')
+
+## Pins of the bump switches
+BUMP_PINS = ('C6', 'C8', 'C9')
+
+## Time the simulated BNO055 takes to settle after a good calibration profile
+#  is written to it, in microseconds
+IMU_PROFILE_SETTLE_US = 150000
+
+## Time the simulated BNO055 takes to restart after a reset, in microseconds
+IMU_RESET_US = 650000
+
+
+def ticks_diff(new, old):
+    '''!@brief    Signed difference between two tick values, as in MicroPython.'''
+    diff = (new - old) & (TICKS_PERIOD - 1)
+    return diff - TICKS_PERIOD if diff >= TICKS_PERIOD // 2 else diff
+
+def ticks_add(ticks, delta):
+    '''!@brief    Adds a number of ticks to a tick value, as in MicroPython.'''
+    return (ticks + delta) & (TICKS_PERIOD - 1)
+
+# The tick and sleep functions handed to the robot's code look up the current
+# simulator each time, so modules which imported them keep working after
+# install() has been called again with a new simulator
+
+def ticks_ms():
+    return _sim.ticks_ms()
+
+def ticks_us():
+    return _sim.ticks_us()
+
+def ticks_cpu():
+    return _sim.ticks_cpu()
+
+def sleep_ms(ms):
+    _sim.sleep_ms(ms)
+
+def sleep_us(us):
+    _sim.sleep_us(us)
+
+
+class LineMap:
+    '''!@brief    A black line on a white floor, made of straight segments.'''
+    def __init__(self, points, width=0.75, closed=True):
+        '''!@brief    Creates a line through a list of points.
+            @param    points  List of (x, y) points in inches
+                      width   Width of the line in inches
+                      closed  True to join the last point back to the first
+        '''
+        self.segments = []
+        ends = points[1:] + points[:1] if closed else points[1:]
+        for (x0, y0), (x1, y1) in zip(points, ends):
+            dx = x1 - x0
+            dy = y1 - y0
+            length_sq = dx * dx + dy * dy
+            self.segments.append((x0, y0, dx, dy,
+                                  1.0 / length_sq if length_sq else 0.0))
+        self.half_width = width / 2
+        self.cells = {}
+
+    def distance_sq(self, x, y, stop=0.0, segments=None):
+        '''!@brief    Finds the squared distance from a point to the line.
+            @param    x, y      The point, in inches
+                      stop      Stop searching once a squared distance this
+                                small has been found
+                      segments  The segments to search, by default all of them
+        '''
+        best = math.inf
+        for x0, y0, dx, dy, inv_length_sq in segments or self.segments:
+            px = x - x0
+            py = y - y0
+            t = (px * dx + py * dy) * inv_length_sq
+            if t < 0.0:
+                t = 0.0
+            elif t > 1.0:
+                t = 1.0
+            px -= t * dx
+            py -= t * dy
+            dist_sq = px * px + py * py
+            if dist_sq < best:
+                best = dist_sq
+                if best <= stop:
+                    break
+        return best
+
+    def distance(self, x, y):
+        '''!@brief    Finds the distance from a point to the nearest part of the line.'''
+        return math.sqrt(self.distance_sq(x, y))
+
+    def darkness(self, x, y):
+        '''!@brief    Returns how much of a sensor's spot at a point is covered by line.
+            @details  The result goes from 0.0 over the background to 1.0 over
+                      the line, ramping across the edge of the line over the
+                      width of the sensor's spot. The floor is divided into
+                      square cells, each of which remembers the few segments
+                      close enough to matter, so only those need to be checked.
+        '''
+        cell = (math.floor(x / LINE_CELL), math.floor(y / LINE_CELL))
+        nearby = self.cells.get(cell)
+        if nearby is None:
+            reach = self.half_width + SENSOR_SPOT + LINE_CELL * 0.7072
+            cx = (cell[0] + 0.5) * LINE_CELL
+            cy = (cell[1] + 0.5) * LINE_CELL
+            nearby = [segment for segment in self.segments
+                      if self.distance_sq(cx, cy, segments=(segment,)) <= reach * reach]
+            self.cells[cell] = nearby
+        if not nearby:
+            return 0.0
+        inner = max(0.0, self.half_width - SENSOR_SPOT)
+        dist_sq = self.distance_sq(x, y, inner * inner, nearby)
+        if dist_sq <= inner * inner:
+            return 1.0
+        coverage = (self.half_width + SENSOR_SPOT - math.sqrt(dist_sq)) / (2 * SENSOR_SPOT)
+        return max(0.0, min(1.0, coverage))
+
+    @classmethod
+    def oval(cls, straight=36.0, radius=12.0, points_per_end=24):
+        '''!@brief    Makes an oval track starting under the robot's sensors.
+            @details  The robot starts at the origin facing along +x, on the
+                      bottom straight, and the track turns to the left.
+        '''
+        points = [(0.0, 0.0), (straight, 0.0)]
+        for i in range(1, points_per_end):
+            a = -math.pi / 2 + math.pi * i / points_per_end
+            points.append((straight + radius * math.cos(a), radius + radius * math.sin(a)))
+        points += [(straight, 2 * radius), (0.0, 2 * radius)]
+        for i in range(1, points_per_end):
+            a = math.pi / 2 + math.pi * i / points_per_end
+            points.append((radius * math.cos(a), radius + radius * math.sin(a)))
+        return cls([(x - SENSOR_OFFSET, y) for x, y in points])
+
+
+class Simulator:
+    '''!@brief    The virtual clock and the model of the robot and its world.'''
+    def __init__(self, line=None, noise=20, seed=0, capture=False):
+        '''!@brief    Creates a simulated robot at the origin facing along +x.
+            @details  Firing the input capture interrupt for every encoder
+                      edge costs about as much host time as the rest of the
+                      model, so it's only done when @c capture is set. Without
+                      it the capture channels never see an edge, and encoders
+                      which time edges find velocity from counts alone.
+            @param    line     A LineMap, or None for an oval track
+                      noise    Standard deviation of line sensor ADC noise in counts
+                      seed     Seed for the random noise
+                      capture  True to fire the encoder input capture interrupts
+        '''
+        self.now_us = 0
+        self.capture = capture
+        self.line = LineMap.oval() if line is None else line
+        self.noise = noise
+        self.random = random.Random(seed)
+        self.x = 0.0
+        self.y = 0.0
+        self.theta = 0.0
+        self.omega = [0.0, 0.0]
+        self.counts = [0.0, 0.0]
+        self.pins = {}
+        self.pwm = {}
+        # Counts writes to the pins and PWM, so the motor targets are only
+        # worked out again after code has changed them
+        self.writes = 0
+        self._target_writes = None
+        self._targets = (0.0, 0.0)
+        self.timer_callbacks = []
+        # Settings each hardware timer was last given, by timer number
+        self.timer_settings = {}
+        self.capture_channels = []
+        self.bump_callbacks = {}
+        self.obstacles = []
+        self.touching = False
+        # Time the IMU takes to calibrate itself from scratch, and the profile
+        # it ends up with; 0 means it is calibrated as soon as it powers up
+        self.imu_calibration_us = 0
+        self.imu_profile = bytes(range(1, 23))
+        self._decay_dt = None
+        self._decay = 1.0
+
+    # --- Time ---------------------------------------------------------------
+
+    def ticks_us(self):
+        return self.now_us & (TICKS_PERIOD - 1)
+
+    def ticks_ms(self):
+        return (self.now_us // 1000) & (TICKS_PERIOD - 1)
+
+    def ticks_cpu(self):
+        return self.ticks_us()
+
+    def sleep_ms(self, ms):
+        self.advance(int(ms * 1000))
+
+    def sleep_us(self, us):
+        self.advance(int(us))
+
+    def advance(self, us):
+        '''!@brief    Moves time forward, updating the model and firing timers.
+            @param    us  Number of microseconds to advance
+        '''
+        end = self.now_us + us
+        timers = self.timer_callbacks
+        counts = self.counts
+        targets = self._motor_targets()
+        while self.now_us < end:
+            # Step to the next timer tick, or by the longest physics step
+            now = self.now_us
+            stop = now + PHYSICS_STEP_US
+            if stop > end:
+                stop = end
+            for timer in timers:
+                if timer.next_us < stop:
+                    stop = timer.next_us if timer.next_us > now else now + 1
+            step = stop - now
+            if self.capture and self.capture_channels:
+                before_0 = counts[0]
+                before_1 = counts[1]
+                self._integrate(step / 1000000, targets)
+                self._capture_edges(before_0, before_1, step)
+            else:
+                self._integrate(step / 1000000, targets)
+            self.now_us = stop
+            for timer in timers:
+                if timer.next_us <= stop:
+                    timer.next_us += timer.period_us
+                    timer.fire()
+            if self.writes != self._target_writes:
+                targets = self._motor_targets()
+
+    # --- Robot model --------------------------------------------------------
+
+    def _motor_targets(self):
+        '''!@brief    Finds the steady-state speed of each wheel for the applied PWM.
+            @details  Motor commands only change when code writes to the pins
+                      or PWM, so the targets are kept until it does.
+        '''
+        if self.writes != self._target_writes:
+            self._target_writes = self.writes
+            self._targets = (MOTOR_GAIN * self._effort(0), MOTOR_GAIN * self._effort(1))
+        return self._targets
+
+    def _effort(self, wheel):
+        '''!@brief    Finds the signed PWM percent applied to a wheel's motor.'''
+        pwm_pin, dir_pin, en_pin = MOTOR_PINS[wheel]
+        if not self.pins.get(en_pin, 0):
+            return 0.0
+        duty = self.pwm.get(pwm_pin, 0.0)
+        return -duty if self.pins.get(dir_pin, 0) else duty
+
+    def _integrate(self, dt, targets):
+        '''!@brief    Integrates the motors and the robot's motion over a step.
+            @param    dt       Length of the step in seconds
+                      targets  Steady-state speed of each wheel for the applied PWM
+        '''
+        if dt != self._decay_dt:
+            self._decay_dt = dt
+            self._decay = math.exp(-dt / MOTOR_TAU)
+        decay = self._decay
+        lag = MOTOR_TAU * (1 - decay)
+        omega = self.omega
+        counts = self.counts
+        target_0, target_1 = targets
+        start_0, start_1 = omega
+        omega[0] = target_0 + (start_0 - target_0) * decay
+        omega[1] = target_1 + (start_1 - target_1) * decay
+        counts[0] += (target_0 * dt + (start_0 - target_0) * lag) * COUNTS_PER_RADIAN
+        counts[1] += (target_1 * dt + (start_1 - target_1) * lag) * COUNTS_PER_RADIAN
+        speed = WHEEL_RADIUS * (omega[0] + omega[1]) / 2
+        self.theta += WHEEL_RADIUS * (omega[1] - omega[0]) / TRACK_WIDTH * dt
+        self.x += speed * math.cos(self.theta) * dt
+        self.y += speed * math.sin(self.theta) * dt
+        if self.obstacles:
+            self._check_bumpers()
+
+    def _capture_edges(self, before_0, before_1, step):
+        '''!@brief    Fires the input capture interrupts for the encoder edges in a step.
+            @details  Each rising edge of channel A is placed at the time the
+                      wheel passed it, assuming the wheel turned at a steady
+                      rate through the step, and the clock reads that time
+                      while the interrupt runs.
+            @param    before_0, before_1  The encoder counts at the start of
+                                          the step
+                      step                Length of the step in microseconds
+        '''
+        start = self.now_us
+        for channel in self.capture_channels:
+            if channel.wheel:
+                old = before_1
+            else:
+                old = before_0
+            new = self.counts[channel.wheel]
+            first = math.floor(old / COUNTS_PER_EDGE)
+            last = math.floor(new / COUNTS_PER_EDGE)
+            if first == last:
+                continue
+            if last > first:
+                edges = range(first + 1, last + 1)
+            else:
+                edges = range(first, last, -1)
+            for edge in edges:
+                fraction = (edge * COUNTS_PER_EDGE - old) / (new - old)
+                self.now_us = start + int(fraction * step)
+                channel.fire()
+        self.now_us = start
+
+    def yaw_rate(self):
+        '''!@brief    Returns the robot's counterclockwise yaw rate in rad/s.'''
+        return WHEEL_RADIUS * (self.omega[1] - self.omega[0]) / TRACK_WIDTH
+
+    def heading(self):
+        '''!@brief    Returns the compass heading (clockwise degrees) the IMU reports.'''
+        return (-math.degrees(self.theta)) % 360
+
+    def encoder_counter(self, wheel):
+        '''!@brief    Returns a wheel's 16-bit encoder timer count.
+            @details  The timer counts down when the wheel turns forward, as
+                      the encoder driver negates the count.
+        '''
+        return int(-math.floor(self.counts[wheel])) & 0xFFFF
+
+    def sensor_level(self, index):
+        '''!@brief    Returns the noise-free ADC reading of one line sensor.'''
+        lateral = (index - 2.5) * SENSOR_SPACING
+        c = math.cos(self.theta)
+        s = math.sin(self.theta)
+        x = self.x + SENSOR_OFFSET * c - lateral * s
+        y = self.y + SENSOR_OFFSET * s + lateral * c
+        return ADC_WHITE + (ADC_BLACK - ADC_WHITE) * self.line.darkness(x, y)
+
+    def sensor_reading(self, index, level=None):
+        '''!@brief    Returns a noisy raw ADC reading of one line sensor.
+            @param    index  The number of the sensor, 0 to 5
+                      level  A noise-free reading from sensor_level(), or None
+                             to look it up at the robot's current position
+        '''
+        if level is None:
+            level = self.sensor_level(index)
+        reading = level + self.random.gauss(0, self.noise)
+        return max(0, min(4095, int(reading)))
+
+    def add_obstacle(self, x0, y0, x1, y1):
+        '''!@brief    Adds a rectangular obstacle which triggers the bump switches.'''
+        self.obstacles.append((min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)))
+
+    def _check_bumpers(self):
+        x = self.x + BUMPER_OFFSET * math.cos(self.theta)
+        y = self.y + BUMPER_OFFSET * math.sin(self.theta)
+        touching = any(x0 <= x <= x1 and y0 <= y <= y1
+                       for x0, y0, x1, y1 in self.obstacles)
+        if touching and not self.touching:
+            self.bump()
+        self.touching = touching
+
+    def bump(self, pin=BUMP_PINS[0]):
+        '''!@brief    Presses a bump switch, calling its interrupt handler.'''
+        callback = self.bump_callbacks.get(pin)
+        if callback is not None:
+            callback(BUMP_PINS.index(pin))
+
+    # --- Scheduling ---------------------------------------------------------
+
+    def run(self, seconds, task_list=None):
+        '''!@brief    Runs the cotask scheduler for a span of simulated time.
+            @details  Whenever no task is ready, the clock jumps straight to the
+                      time at which the next one is due instead of spinning.
+            @param    seconds    Simulated time to run for
+                      task_list  The cotask task list, by default cotask.task_list
+        '''
+        if task_list is None:
+            import cotask
+            task_list = cotask.task_list
+        tasks = [task for pri in task_list.pri_list for task in pri[2:]]
+        end = self.now_us + int(seconds * 1000000)
+        mask = TICKS_PERIOD - 1
+        half = TICKS_PERIOD // 2
+        while self.now_us < end:
+            now = self.now_us & mask
+            wait = None
+            for task in tasks:
+                if task.go_flag or task.period is None:
+                    wait = 0
+                    break
+                # ticks_diff(now, task._next_run), written out
+                late = (now - task._next_run) & mask
+                if late >= half:
+                    late -= TICKS_PERIOD
+                if late > 0:
+                    wait = 0
+                    break
+                if wait is None or 1 - late < wait:
+                    wait = 1 - late
+            if wait:
+                self.advance(min(wait, end - self.now_us))
+            else:
+                task_list.pri_sched()
+
+
+class Pin:
+    '''!@brief    Stand-in for pyb.Pin which records output levels.'''
+    IN = 0
+    OUT_PP = 1
+    OUT_OD = 2
+    ALT = 3
+    ALT_OPEN_DRAIN = 4
+    ANALOG = 5
+    PULL_NONE = 0
+    PULL_UP = 1
+    PULL_DOWN = 2
+
+    class cpu:
+        pass
+
+    class board:
+        pass
+
+    def __init__(self, name, mode=IN, pull=PULL_NONE, alt=-1, value=None):
+        self._name = str(name)
+        if value is not None:
+            _sim.pins[self._name] = value
+            _sim.writes += 1
+
+    def init(self, *args, **kwargs):
+        pass
+
+    def name(self):
+        return self._name
+
+    def high(self):
+        _sim.pins[self._name] = 1
+        _sim.writes += 1
+
+    def low(self):
+        _sim.pins[self._name] = 0
+        _sim.writes += 1
+
+    def value(self, level=None):
+        if level is None:
+            return _sim.pins.get(self._name, 0)
+        _sim.pins[self._name] = 1 if level else 0
+        _sim.writes += 1
+
+    def __str__(self):
+        return 'Pin(Pin.cpu.' + self._name + ')'
+
+for _port in 'ABCDEFGH':
+    for _num in range(16):
+        setattr(Pin.cpu, _port + str(_num), _port + str(_num))
+        setattr(Pin.board, 'P' + _port + str(_num), _port + str(_num))
+
+
+class TimerChannel:
+    '''!@brief    Stand-in for a pyb.TimerChannel in PWM, encoder or input
+                  capture mode.
+    '''
+    def __init__(self, timer, channel, mode, pin):
+        self.timer = timer
+        self.channel_num = channel
+        self.mode = mode
+        self.pin = None if pin is None else str(pin)
+        self._percent = 0.0
+        self._capture = 0
+        self._callback = None
+        self.wheel = None
+        if mode == Timer.IC and self.pin in CAPTURE_PINS:
+            self.wheel = CAPTURE_PINS.index(self.pin)
+
+    def pulse_width_percent(self, value=None):
+        if value is None:
+            return self._percent
+        self._percent = value
+        _sim.pwm[self.pin] = value
+        _sim.writes += 1
+
+    def capture(self):
+        return self._capture
+
+    def callback(self, fun):
+        if self in _sim.capture_channels:
+            _sim.capture_channels.remove(self)
+        self._callback = fun
+        if fun is not None and self.wheel is not None:
+            _sim.capture_channels.append(self)
+
+    def fire(self):
+        self._capture = self.timer.counter()
+        self._callback(self.timer)
+
+
+class Timer:
+    '''!@brief    Stand-in for pyb.Timer with PWM, encoder, capture and callback support.
+        @details  Each object made for a timer number sets up the same
+                  hardware timer, as on the Nucleo. Setting up a timer whose
+                  callback is running with different settings, or giving it a
+                  second callback, would stop or speed up that callback on the
+                  robot, so both raise ValueError here. A timed ADC read on a
+                  timer which has since been set up differently does too.
+    '''
+    PWM = 0
+    PWM_INVERTED = 1
+    OC_TIMING = 2
+    OC_ACTIVE = 3
+    OC_INACTIVE = 4
+    OC_TOGGLE = 5
+    OC_FORCED_ACTIVE = 6
+    OC_FORCED_INACTIVE = 7
+    IC = 8
+    ENC_A = 9
+    ENC_B = 10
+    ENC_AB = 11
+    HIGH = 0
+    LOW = 1
+    RISING = 0
+    FALLING = 1
+    BOTH = 2
+    UP = 0
+    DOWN = 1
+    CENTER = 2
+
+    def __init__(self, id, freq=None, prescaler=0, period=0xFFFF, **kwargs):
+        self.id = id
+        self._callback = None
+        self.period_us = None
+        self.next_us = 0
+        self._wheel = None
+        self._configure(freq, prescaler, period)
+
+    def _configure(self, freq, prescaler, period):
+        settings = (freq, prescaler, period)
+        for timer in _sim.timer_callbacks:
+            if timer.id == self.id and timer is not self and timer._settings != settings:
+                raise ValueError(f'Timer {self.id} is already running a callback '
+                                 f'at {timer._freq} Hz')
+        self._freq = freq
+        self._prescaler = prescaler
+        self._period = period
+        self._settings = settings
+        _sim.timer_settings[self.id] = settings
+
+    def init(self, freq=None, prescaler=0, period=0xFFFF, **kwargs):
+        self._configure(freq, prescaler, period)
+
+    def freq(self):
+        return self._freq
+
+    def period(self):
+        return self._period
+
+    def prescaler(self):
+        return self._prescaler
+
+    def channel(self, channel, mode=PWM, pin=None, **kwargs):
+        if mode == Timer.ENC_AB and str(pin) in ENCODER_PINS:
+            self._wheel = ENCODER_PINS.index(str(pin))
+        return TimerChannel(self, channel, mode, pin)
+
+    def counter(self, value=None):
+        if self._wheel is None:
+            ticks = _sim.now_us * TIMER_CLOCK // (1000000 * (self._prescaler + 1))
+            return ticks % (self._period + 1)
+        return _sim.encoder_counter(self._wheel)
+
+    def callback(self, fun):
+        if self in _sim.timer_callbacks:
+            _sim.timer_callbacks.remove(self)
+        if fun is not None:
+            for timer in _sim.timer_callbacks:
+                if timer.id == self.id:
+                    raise ValueError(f'Timer {self.id} already has a callback')
+        self._callback = fun
+        if fun is not None and self._freq:
+            self.period_us = max(1, int(round(1000000 / self._freq)))
+            self.next_us = _sim.now_us + self.period_us
+            _sim.timer_callbacks.append(self)
+
+    def deinit(self):
+        self.callback(None)
+
+    def fire(self):
+        self._callback(self)
+
+
+class ADC:
+    '''!@brief    Stand-in for pyb.ADC which reads the simulated line sensors.'''
+    def __init__(self, pin):
+        name = pin.name() if isinstance(pin, Pin) else str(pin)
+        self._index = QTR_PINS.index(name) if name in QTR_PINS else None
+
+    def read(self):
+        if self._index is None:
+            return 0
+        return _sim.sensor_reading(self._index)
+
+    @staticmethod
+    def read_timed_multi(adcs, bufs, timer):
+        '''!@brief    Fills each buffer with samples taken at the timer's rate.'''
+        if _sim.timer_settings.get(timer.id) != timer._settings:
+            raise ValueError(f'Timer {timer.id} has been set up again since')
+        count = len(bufs[0])
+        for adc, buf in zip(adcs, bufs):
+            # The robot barely moves during a burst, so only the noise changes
+            if adc._index is None:
+                continue
+            level = _sim.sensor_level(adc._index)
+            gauss = _sim.random.gauss
+            noise = _sim.noise
+            for n in range(count):
+                # As sensor_reading(), without a call per sample
+                reading = int(level + gauss(0, noise))
+                buf[n] = 0 if reading < 0 else 4095 if reading > 4095 else reading
+        _sim.advance(int(count * 1000000 / timer.freq()))
+        return True
+
+
+class I2C:
+    '''!@brief    Stand-in for pyb.I2C with a BNO055 IMU on the bus.
+        @details  Every memory read or write counts as one transaction, and
+                  the number of data bytes moved each way is counted too, so
+                  tests can compare the bus traffic of different ways of
+                  reading the IMU.
+
+                  The IMU calibrates itself @c imu_calibration_us after it
+                  powers up or is reset, ending up with the simulator's
+                  @c imu_profile. If that profile is written to it in CONFIG
+                  mode, it is calibrated IMU_PROFILE_SETTLE_US after the next
+                  switch to a fusion mode instead. Any other profile is
+                  rejected: the IMU then never reports being calibrated
+                  until it's reset.
+    '''
+    CONTROLLER = 0
+    MASTER = 0
+    PERIPHERAL = 1
+    SLAVE = 1
+
+    def __init__(self, bus, mode=CONTROLLER, baudrate=400000, **kwargs):
+        self.registers = bytearray(0x80)
+        self.calibrated_us = _sim.now_us + _sim.imu_calibration_us
+        self.profile_written = None
+        self.transactions = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def _update_registers(self):
+        regs = self.registers
+        calibrated = _sim.now_us >= self.calibrated_us
+        regs[0x35] = 0xFF if calibrated else 0x00
+        if calibrated and self.profile_written is None:
+            regs[0x55:0x6B] = _sim.imu_profile
+        gyro_z = int(round(_sim.yaw_rate() * 900))
+        regs[0x18:0x1A] = (gyro_z & 0xFFFF).to_bytes(2, 'little')
+        heading = int(round(_sim.heading() * 16)) % (360 * 16)
+        regs[0x1A:0x1C] = heading.to_bytes(2, 'little')
+        half = _sim.theta / 2
+        quat_w = int(round(math.cos(half) * 16384))
+        quat_z = int(round(math.sin(half) * 16384))
+        regs[0x20:0x22] = (quat_w & 0xFFFF).to_bytes(2, 'little')
+        regs[0x26:0x28] = (quat_z & 0xFFFF).to_bytes(2, 'little')
+
+    def mem_read(self, data, addr, memaddr, **kwargs):
+        self._update_registers()
+        self.transactions += 1
+        if isinstance(data, int):
+            self.bytes_read += data
+            return bytes(self.registers[memaddr:memaddr + data])
+        self.bytes_read += len(data)
+        data[:] = self.registers[memaddr:memaddr + len(data)]
+        return data
+
+    def mem_write(self, data, addr, memaddr, **kwargs):
+        if isinstance(data, int):
+            data = bytes((data,))
+        self.transactions += 1
+        self.bytes_written += len(data)
+        regs = self.registers
+        if memaddr == 0x3F and data[0] & 0x20:
+            # Reset, which clears the calibration
+            regs[:] = bytes(len(regs))
+            self.profile_written = None
+            self.calibrated_us = _sim.now_us + IMU_RESET_US + _sim.imu_calibration_us
+            return
+        if memaddr == 0x55 and regs[0x3D] == 0:
+            self.profile_written = bytes(data)
+        elif memaddr == 0x3D and data[0] and not regs[0x3D] and self.profile_written:
+            if self.profile_written == _sim.imu_profile:
+                self.calibrated_us = min(self.calibrated_us,
+                                         _sim.now_us + IMU_PROFILE_SETTLE_US)
+            else:
+                self.calibrated_us = math.inf
+        regs[memaddr:memaddr + len(data)] = data
+
+
+class ExtInt:
+    '''!@brief    Stand-in for pyb.ExtInt; the simulator calls the handlers.'''
+    IRQ_RISING = 0
+    IRQ_FALLING = 1
+    IRQ_RISING_FALLING = 2
+
+    def __init__(self, pin, mode, pull, callback):
+        _sim.bump_callbacks[str(pin)] = callback
+
+    def enable(self):
+        pass
+
+    def disable(self):
+        pass
+
+
+class UART:
+    '''!@brief    Stand-in for pyb.UART which collects whatever is written.'''
+    def __init__(self, bus, baudrate=9600, **kwargs):
+        self.written = bytearray()
+
+    def init(self, *args, **kwargs):
+        pass
+
+    def write(self, buf):
+        self.written += buf
+        return len(buf)
+
+    def any(self):
+        return 0
+
+    def read(self, nbytes=None):
+        return None
+
+
+def _native(fun):
+    return fun
+
+## The simulator which the fake modules talk to; replaced by @c install()
+_sim = Simulator()
+
+def install(sim=None):
+    '''!@brief    Installs the fake MicroPython modules backed by a simulator.
+        @details  This must be called before importing any of the robot's
+                  modules. The tick functions are added to the standard @c time
+                  module, as @c main.py imports them from there. It may be
+                  called again to start over with a new simulator; modules
+                  which have already been imported then use the new one.
+        @param    sim  A Simulator, or None to create one with an oval track
+        @return   The simulator in use
+    '''
+    global _sim
+    _sim = Simulator() if sim is None else sim
+
+    pyb = types.ModuleType('pyb')
+    pyb.Pin = Pin
+    pyb.Timer = Timer
+    pyb.ADC = ADC
+    pyb.I2C = I2C
+    pyb.ExtInt = ExtInt
+    pyb.UART = UART
+    pyb.repl_uart = lambda uart=None: None
+    pyb.disable_irq = lambda: True
+    pyb.enable_irq = lambda state=True: None
+    pyb.delay = sleep_ms
+    pyb.udelay = sleep_us
+    pyb.millis = ticks_ms
+    pyb.micros = ticks_us
+    pyb.elapsed_millis = lambda start: ticks_diff(ticks_ms(), start)
+    pyb.elapsed_micros = lambda start: ticks_diff(ticks_us(), start)
+
+    utime = types.ModuleType('utime')
+    for mod in (utime, time):
+        mod.ticks_ms = ticks_ms
+        mod.ticks_us = ticks_us
+        mod.ticks_cpu = ticks_cpu
+        mod.ticks_diff = ticks_diff
+        mod.ticks_add = ticks_add
+        mod.sleep_ms = sleep_ms
+        mod.sleep_us = sleep_us
+
+    micropython = types.ModuleType('micropython')
+    micropython.native = _native
+    micropython.viper = _native
+    micropython.const = lambda value: value
+    micropython.schedule = lambda fun, arg: fun(arg)
+    micropython.alloc_emergency_exception_buf = lambda size: None
+
+    sys.modules['pyb'] = pyb
+    sys.modules['utime'] = utime
+    sys.modules['micropython'] = micropython
+    return _sim
+
+
+if __name__ == '__main__':
+    import io
+    from contextlib import redirect_stdout
+
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 30.0
+    sim = install()
+    output = io.StringIO()
+    with redirect_stdout(output):
+        import main
+        main.create_tasks()
+        start = time.perf_counter()
+        sim.run(seconds)
+        elapsed = time.perf_counter() - start
+    print(output.getvalue())
+    print(main.cotask.task_list)
+    print(f'Simulated {seconds:.1f} s in {elapsed:.2f} s '
+          f'({seconds / elapsed:.0f}x real time)')
+    print(f'Final pose: x = {sim.x:.2f} in, y = {sim.y:.2f} in, '
+          f'heading = {sim.heading():.1f} deg')
@@ -25,6 +25,8 @@ import array
 import gc
 import pyb
 import micropython
+import struct
+from time import ticks_ms, ticks_diff
 
 
 ## This is a system-wide list of all the queues and shared variables. It is
@@ -87,6 +89,21 @@ class BaseShare:
 #  # In another task, read data from the queue
 #  something = my_queue.get ()
 #  @endcode
+#
+#  @c put() and @c get() wait in a loop when the queue is full or empty,
+#  which in a cooperative scheduler stops every task. Tasks which can't be
+#  sure there's room or data should use @c try_put() and @c try_get(), which
+#  never wait, or wait by yielding to the scheduler:
+#  @code
+#  def consumer ():
+#      while True:
+#          something = yield from my_queue.wait_get (timeout = 100)
+#          if something is not None:
+#              do_something_with (something)
+#          yield 0
+#  @endcode
+#  Blocks of items can be moved with @c put_many() and @c get_into(), which
+#  copy them with slices while interrupts are disabled once.
 class Queue (BaseShare):
 
     ## A counter used to give serial numbers to queues for diagnostic use.
@@ -137,6 +154,7 @@ class Queue (BaseShare):
         except ValueError:
             self._buffer = None
             raise
+        self._view = memoryview (self._buffer)
 
         # Initialize pointers to be used for reading and writing data
         self.clear ()
@@ -242,6 +260,163 @@ class Queue (BaseShare):
         return (to_return)
 
 
+    ## Put an item into the queue if there's room for it.
+    #
+    #  This method never waits. If the queue is full, the item is put in
+    #  only if the @c overwrite constructor parameter was @c True.
+    #  @param item The item to be placed into the queue
+    #  @param in_ISR Set this to @c True if calling from within an ISR
+    #  @return @c True if the item was put into the queue
+    @micropython.native
+    def try_put (self, item, in_ISR = False):
+        if self.full () and not self._overwrite:
+            return False
+        self.put (item, in_ISR)
+        return True
+
+
+    ## Read an item from the queue if there is one.
+    #
+    #  This method never waits.
+    #  @param default The value to return if the queue is empty
+    #  @param in_ISR Set this to @c True if calling from within an ISR
+    #  @return The oldest item in the queue, or @c default if it's empty
+    @micropython.native
+    def try_get (self, default = None, in_ISR = False):
+        if self.empty ():
+            return default
+        return self.get (in_ISR)
+
+
+    ## Put a block of items into the queue.
+    #
+    #  The items are copied into the queue's buffer with at most two slice
+    #  copies while interrupts are disabled once. This method never waits:
+    #  if there isn't room for all of them, only the ones which fit are put
+    #  in, unless the @c overwrite constructor parameter was @c True, in
+    #  which case the oldest items in the queue are overwritten.
+    #  @param items An @c array of the queue's type holding the items
+    #  @param in_ISR Set this to @c True if calling from within an ISR
+    #  @return The number of items put into the queue
+    @micropython.native
+    def put_many (self, items, in_ISR = False):
+        source = memoryview (items)
+        count = len (source)
+        size = self._size
+
+        if self._thread_protect and not in_ISR:
+            irq_state = pyb.disable_irq ()
+
+        # Work out how many items to copy, skipping any which would be
+        # overwritten by later ones in the same block
+        skip = 0
+        if self._overwrite:
+            if count > size:
+                skip = count - size
+                count = size
+        elif count > size - self._num_items:
+            count = size - self._num_items
+
+        # Copy up to the end of the buffer, then any which wrap around
+        wr_idx = self._wr_idx
+        first = size - wr_idx
+        if first > count:
+            first = count
+        self._view[wr_idx:wr_idx + first] = source[skip:skip + first]
+        if count > first:
+            self._view[0:count - first] = source[skip + first:skip + count]
+
+        wr_idx += count
+        if wr_idx >= size:
+            wr_idx -= size
+        self._wr_idx = wr_idx
+        self._num_items += count
+        if self._num_items > size:               # Oldest items overwritten
+            self._rd_idx = wr_idx
+            self._num_items = size
+        if self._num_items > self._max_full:     # Record maximum fillage
+            self._max_full = self._num_items
+
+        if self._thread_protect and not in_ISR:
+            pyb.enable_irq (irq_state)
+
+        return count
+
+
+    ## Read a block of items from the queue.
+    #
+    #  As many items as are in the queue, up to the size of @c buffer, are
+    #  copied into the start of @c buffer with at most two slice copies while
+    #  interrupts are disabled once. This method never waits.
+    #  @param buffer An @c array of the queue's type into which the oldest
+    #         items are copied
+    #  @param in_ISR Set this to @c True if calling from within an ISR
+    #  @return The number of items read
+    @micropython.native
+    def get_into (self, buffer, in_ISR = False):
+        dest = memoryview (buffer)
+        size = self._size
+
+        if self._thread_protect and not in_ISR:
+            irq_state = pyb.disable_irq ()
+
+        count = len (dest)
+        if count > self._num_items:
+            count = self._num_items
+
+        rd_idx = self._rd_idx
+        first = size - rd_idx
+        if first > count:
+            first = count
+        dest[0:first] = self._view[rd_idx:rd_idx + first]
+        if count > first:
+            dest[first:count] = self._view[0:count - first]
+
+        rd_idx += count
+        if rd_idx >= size:
+            rd_idx -= size
+        self._rd_idx = rd_idx
+        self._num_items -= count
+
+        if self._thread_protect and not in_ISR:
+            pyb.enable_irq (irq_state)
+
+        return count
+
+
+    ## Wait by yielding to the scheduler until an item can be put in.
+    #
+    #  This is a generator to be run with @c yield @c from inside a task;
+    #  while the queue is full it yields 0, so the other tasks keep running.
+    #  @param item The item to be placed into the queue
+    #  @param timeout The longest time to wait in milliseconds, or @c None
+    #         to wait for as long as it takes
+    #  @return @c True if the item was put in, @c False if the wait timed out
+    def wait_put (self, item, timeout = None):
+        start = ticks_ms ()
+        while not self.try_put (item):
+            if timeout is not None and ticks_diff (ticks_ms (), start) >= timeout:
+                return False
+            yield 0
+        return True
+
+
+    ## Wait by yielding to the scheduler until an item can be read.
+    #
+    #  This is a generator to be run with @c yield @c from inside a task;
+    #  while the queue is empty it yields 0, so the other tasks keep running.
+    #  @param timeout The longest time to wait in milliseconds, or @c None
+    #         to wait for as long as it takes
+    #  @return The oldest item in the queue, or @c None if the wait timed out
+    def wait_get (self, timeout = None):
+        start = ticks_ms ()
+        while self.empty ():
+            if timeout is not None and ticks_diff (ticks_ms (), start) >= timeout:
+                return None
+            yield 0
+        return self.get ()
+
+
     ## Check if there are any items in the queue.
     # 
     #  Returns @c True if there are any items in the queue and @c False
@@ -410,3 +585,280 @@ class Share (BaseShare):
                 type_code_strings[self._type_code]))
 
 
+# ============================================================================
+
+## Several related items of data which are shared between tasks as one.
+#  Related values such as a wheel's position, velocity and the time they were
+#  measured can each be put in a @c Share, but then every value costs a call
+#  and an interrupt-disabled window of its own, and a reader can see some
+#  values from one update and some from the one before. A @c MultiShare keeps
+#  all of them in one @c array of a single type, and writes or reads all of
+#  them in one call with interrupts disabled once.
+#
+#  The values are written from a preallocated @c array of the same type and
+#  size which the writer reuses, and read into another, so neither transfer
+#  allocates memory. An interrupt may write the share as long as the type is
+#  an integer one and the values fit in a small int; reading a float item
+#  makes a new float object, which an interrupt can't do:
+#  @code
+#  import array, task_share
+#
+#  # Position (counts), delta (counts) and time (us) of a wheel
+#  wheel = task_share.MultiShare ('l', 3, name="Wheel")
+#  staged = array.array ('l', [0, 0, 0])
+#  latest = array.array ('l', [0, 0, 0])
+#
+#  # In the writing task or interrupt
+#  staged[0] = position
+#  staged[1] = delta
+#  staged[2] = now
+#  wheel.put (staged)
+#
+#  # In a reading task, all three values come from the same put()
+#  wheel.get_into (latest)
+#  @endcode
+class MultiShare (BaseShare):
+
+    ## A counter used to give serial numbers to shares for diagnostic use.
+    ser_num = 0
+
+    ## Create a shared set of data items used to transfer data between tasks.
+    #
+    #  This method allocates memory in which the shared data will be buffered.
+    #  The type code is one of those which a @c Share can hold.
+    #  @param type_code The type of each data item
+    #  @param size The number of data items
+    #  @param thread_protect True if mutual exclusion protection is used
+    #  @param name A short name for the share, default @c MultiShareN where
+    #         @c N is a serial number for the share
+    def __init__ (self, type_code, size, thread_protect = True, name = None):
+        # First call the parent class initializer
+        super ().__init__ (type_code, thread_protect, name)
+
+        self._size = size
+        self._buffer = array.array (type_code, [0] * size)
+
+        self._name = str (name) if name != None \
+            else 'MultiShare' + str (MultiShare.ser_num)
+        MultiShare.ser_num += 1
+
+
+    ## Write all the items of data into the share at once.
+    #
+    #  Interrupts are disabled once while all the items are written, so a
+    #  reader never sees a mixture of old and new items. The items are copied
+    #  one at a time by index, as slice assignment from a sequence may
+    #  allocate memory, which an interrupt can't do.
+    #  @param values An @c array of the share's type holding one value for
+    #         each item; it must be an @c array, not a list or tuple, when
+    #         called from an interrupt
+    #  @param in_ISR Set this to True if calling from within an ISR
+    @micropython.native
+    def put (self, values, in_ISR = False):
+        if len (values) != self._size:
+            raise ValueError ('MultiShare needs ' + str (self._size) + ' values')
+
+        if self._thread_protect and not in_ISR:
+            irq_state = pyb.disable_irq ()
+
+        buffer = self._buffer
+        for index in range (self._size):
+            buffer[index] = values[index]
+
+        if self._thread_protect and not in_ISR:
+            pyb.enable_irq (irq_state)
+
+
+    ## Read all the items of data from the share at once.
+    #
+    #  Interrupts are disabled once while all the items are read.
+    #  @param out An @c array of the share's type and size into which the
+    #         items are copied
+    #  @param in_ISR Set this to True if calling from within an ISR
+    #  @return The array @c out
+    @micropython.native
+    def get_into (self, out, in_ISR = False):
+        if self._thread_protect and not in_ISR:
+            irq_state = pyb.disable_irq ()
+
+        out[:] = self._buffer
+
+        if self._thread_protect and not in_ISR:
+            pyb.enable_irq (irq_state)
+
+        return out
+
+
+    ## Write one item of data into the share.
+    #  @param index The position of the item, from 0
+    #  @param data The data to be put into the item
+    #  @param in_ISR Set this to True if calling from within an ISR
+    @micropython.native
+    def put_item (self, index, data, in_ISR = False):
+        if self._thread_protect and not in_ISR:
+            irq_state = pyb.disable_irq ()
+
+        self._buffer[index] = data
+
+        if self._thread_protect and not in_ISR:
+            pyb.enable_irq (irq_state)
+
+
+    ## Read one item of data from the share.
+    #  @param index The position of the item, from 0
+    #  @param in_ISR Set this to True if calling from within an ISR
+    #  @return The item
+    @micropython.native
+    def get (self, index, in_ISR = False):
+        if self._thread_protect and not in_ISR:
+            irq_state = pyb.disable_irq ()
+
+        to_return = self._buffer[index]
+
+        if self._thread_protect and not in_ISR:
+            pyb.enable_irq (irq_state)
+
+        return (to_return)
+
+
+    ## Puts diagnostic information about the share into a string.
+    def __repr__ (self):
+        return ("{:<12s} MultiShare<{:s}>[{:d}]".format (self._name,
+                type_code_strings[self._type_code], self._size))
+
+
+# ============================================================================
+
+## A group of typed data items, laid out by a @c struct format, which is
+#  shared between tasks without disabling interrupts.
+#
+#  The items are packed into one preallocated buffer together with a
+#  sequence counter, and are read and written as a group, so a reader always
+#  gets every item from the same write. Instead of disabling interrupts the
+#  record works as a sequence lock: the writer makes the counter odd while
+#  it writes and even again when it's done, and a reader which finds the
+#  counter odd, or changed by the time it has finished copying, reads again.
+#
+#  Records must not be written from a hard interrupt handler, such as a
+#  timer callback: @c put() takes its values as a tuple and packs them,
+#  which allocates memory. They may be written from a task, or from a
+#  callback run by @c micropython.schedule(), which can allocate. For values
+#  written from a hard interrupt use a @c MultiShare.
+#
+#  Each record must have only one writer. A reader which interrupts the
+#  writer can't wait for it to finish, so a record written by a task must
+#  not be read from a scheduled callback. Records written by a scheduled
+#  callback can be read from any task.
+#
+#  An example of the creation and use of a record is as follows:
+#  @code
+#  import task_share
+#
+#  # Time in microseconds, then position and velocity of both wheels
+#  motors = task_share.Record ('<lffff', name="Motors")
+#
+#  # In the motor task
+#  motors.put (now, position_A, velocity_A, position_B, velocity_B)
+#
+#  # In another task, all five values come from the same put()
+#  now, position_A, velocity_A, position_B, velocity_B = motors.get ()
+#  @endcode
+class Record (BaseShare):
+
+    ## A counter used to give serial numbers to records for diagnostic use.
+    ser_num = 0
+
+    ## Create a record which holds items laid out by a @c struct format.
+    #
+    #  This method allocates the buffer in which the items will be stored.
+    #  Every item starts at zero.
+    #  @param fmt A @c struct format string describing the items
+    #  @param name A short name for the record, default @c RecordN where
+    #         @c N is a serial number for the record
+    def __init__ (self, fmt, name = None):
+        # First call the parent class initializer; the sequence lock does
+        # the job of thread protection
+        super ().__init__ (fmt, False, name)
+
+        self._fmt = fmt
+        self._buffer = bytearray (struct.calcsize (fmt))
+        self._seq = 0
+
+        self._name = str (name) if name != None \
+            else 'Record' + str (Record.ser_num)
+        Record.ser_num += 1
+
+
+    ## Write all the items into the record.
+    #
+    #  This doesn't wait for anything, but it allocates memory for the
+    #  values, so it must not be called from a hard interrupt handler.
+    #  @param values One value for each item in the format
+    @micropython.native
+    def put (self, *values):
+        self._seq += 1
+        struct.pack_into (self._fmt, self._buffer, 0, *values)
+        self._seq += 1
+
+
+    ## Read all the items from the record.
+    #
+    #  If the writer interrupts the read, the items are read again, so the
+    #  ones returned all come from one write.
+    #  @return A tuple holding the value of each item
+    @micropython.native
+    def get (self):
+        while True:
+            seq = self._seq
+            if not seq & 1:
+                values = struct.unpack_from (self._fmt, self._buffer, 0)
+                if self._seq == seq:
+                    return values
+
+
+    ## Count the writes made to the record.
+    #
+    #  A reader can compare this with the count at its last read to find
+    #  whether there's anything new.
+    #  @return The number of times @c put() has finished
+    @micropython.native
+    def sequence (self):
+        return self._seq >> 1
+
+
+    ## Copy the packed bytes of every item into another buffer.
+    #
+    #  This is a consistent read like @c get(), but the items are copied as
+    #  they are packed rather than unpacked, so nothing is allocated. It is
+    #  used to put records into binary frames.
+    #  @param buffer A @c bytearray or @c memoryview into which the bytes are
+    #         copied
+    #  @param offset The position in @c buffer of the first byte
+    #  @return The number of writes made to the record when it was copied
+    @micropython.native
+    def read_into (self, buffer, offset = 0):
+        size = len (self._buffer)
+        while True:
+            seq = self._seq
+            if not seq & 1:
+                buffer[offset:offset + size] = self._buffer
+                if self._seq == seq:
+                    return seq >> 1
+
+
+    ## Get the @c struct format of the record's items.
+    #  @return The format string given when the record was created
+    def format (self):
+        return self._fmt
+
+
+    ## Get the number of bytes the record's items take up when packed.
+    #  @return The size of the record in bytes
+    def size (self):
+        return len (self._buffer)
+
+
+    ## Puts diagnostic information about the record into a string.
+    def __repr__ (self):
+        return ("{:<12s} Record<{:s}> Writes {:d}".format (self._name,
+                self._fmt, self._seq >> 1))
@@ -0,0 +1,172 @@
+'''!@file     telemetry.py
+    @brief    Binary telemetry frames streamed over a UART.
+    @details  Printing a line of text takes milliseconds of formatting per
+              line, which limits logging to a few lines a second. The
+              Telemetry class in this file instead copies the packed bytes of
+              a task_share.Record into a fixed-size binary frame, adds a
+              sequence number and a CRC, and keeps the frames in a
+              preallocated ring buffer from which a few bytes at a time are
+              written to the UART. Nothing is formatted or allocated per
+              frame on the robot; telemetry_decode.py turns a captured
+              stream back into rows of values on a PC.
+
+              Each frame is laid out as follows, with numbers little-endian:
+              | Bytes | Contents |
+              |:------|:---------|
+              | 2     | @c SYNC, 0xA5 then 0x5A |
+              | 2     | Sequence number, counting up from 0 and wrapping at 65536 |
+              | 1     | Number of payload bytes |
+              | n     | Payload: the record's items, packed by its format |
+              | 2     | CRC-16/CCITT-FALSE of the sequence number, length and payload |
+'''
+import array
+import micropython
+
+## Bytes which start every frame
+SYNC = b'\xa5\x5a'
+
+## Bytes in a frame before the payload: sync, sequence number and length
+HEADER_SIZE = 5
+
+## Bytes of CRC at the end of each frame
+CRC_SIZE = 2
+
+## Format of the motor record published by the motor task: time in us, then
+#  the position (rad) and velocity (rad/s) of wheel A and of wheel B
+MOTOR_FORMAT = '<lffff'
+
+## Names of the items of MOTOR_FORMAT, used as column names when decoding
+MOTOR_FIELDS = ('time_us', 'position_A', 'velocity_A', 'position_B', 'velocity_B')
+
+def _crc_table():
+    '''!@brief    Makes the lookup table for the CCITT CRC, polynomial 0x1021.'''
+    table = array.array('H', [0] * 256)
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+        table[byte] = crc & 0xFFFF
+    return table
+
+## Lookup table for crc16(), one entry per byte value
+CRC_TABLE = _crc_table()
+
+@micropython.native
+def crc16(data, start, end, crc=0xFFFF):
+    '''!@brief    Finds the CRC-16/CCITT-FALSE of part of a buffer.
+        @details  One table lookup is made per byte.
+        @param    data   A bytes, bytearray or memoryview
+                  start  Index of the first byte
+                  end    Index after the last byte
+                  crc    Starting value, or the CRC so far to carry it on
+        @return   The CRC as an integer from 0 to 65535
+    '''
+    table = CRC_TABLE
+    for index in range(start, end):
+        crc = ((crc << 8) & 0xFF00) ^ table[((crc >> 8) ^ data[index]) & 0xFF]
+    return crc
+
+
+class Telemetry:
+    '''!@brief    Streams the contents of a record over a UART as binary frames.
+        @details  Each time sample() is called and the record has been written
+                  since the last frame, a frame is built in the next free
+                  slot of the ring buffer. send() writes at most @c chunk
+                  bytes from the oldest waiting frames, so the UART, which
+                  sends each byte before returning, never holds up the
+                  scheduler for longer than those bytes take at its baud
+                  rate. If the frames come faster than the UART can carry
+                  them the ring fills, and new frames are dropped and
+                  counted until there's room; the gap shows up in the
+                  sequence numbers.
+    '''
+    def __init__(self, uart, record, frames=32, chunk=64):
+        '''!@brief    Initializes a telemetry stream for a record.
+            @param    uart    The UART to write frames to
+                      record  The task_share.Record whose items are sent
+                      frames  Number of frames the ring buffer holds
+                      chunk   Most bytes written to the UART per send()
+        '''
+        self.uart = uart
+        self.record = record
+        self.payload_size = record.size()
+        self.frame_size = HEADER_SIZE + self.payload_size + CRC_SIZE
+        self.frames = frames
+        self.chunk = chunk
+        self.ring = bytearray(self.frame_size * frames)
+        self.view = memoryview(self.ring)
+        self.head = 0
+        self.waiting = 0
+        self.sent = 0
+        self.seq = 0
+        self.last = 0
+        self.dropped = 0
+
+    def sample(self):
+        '''!@brief    Builds a frame from the record if it has been written since
+                      the last frame.
+            @return   True if a frame was added to the ring buffer
+        '''
+        record = self.record
+        if record.sequence() == self.last:
+            return False
+        if self.waiting >= self.frames:
+            # Skip a sequence number so the decoder sees the gap
+            self.last = record.sequence()
+            self.seq = (self.seq + 1) & 0xFFFF
+            self.dropped += 1
+            return False
+
+        ring = self.ring
+        start = self.head * self.frame_size
+        ring[start] = 0xA5
+        ring[start + 1] = 0x5A
+        ring[start + 2] = self.seq & 0xFF
+        ring[start + 3] = self.seq >> 8
+        ring[start + 4] = self.payload_size
+        self.last = record.read_into(self.view, start + HEADER_SIZE)
+        end = start + HEADER_SIZE + self.payload_size
+        crc = crc16(ring, start + 2, end)
+        ring[end] = crc & 0xFF
+        ring[end + 1] = crc >> 8
+
+        self.seq = (self.seq + 1) & 0xFFFF
+        self.head += 1
+        if self.head >= self.frames:
+            self.head = 0
+        self.waiting += 1
+        return True
+
+    def send(self):
+        '''!@brief    Writes up to @c chunk bytes of the waiting frames to the UART.
+            @return   The number of bytes written
+        '''
+        total = 0
+        while self.waiting and total < self.chunk:
+            # Waiting bytes from the oldest frame up to the end of the ring
+            tail = self.head - self.waiting
+            if tail < 0:
+                tail += self.frames
+            start = tail * self.frame_size + self.sent
+            count = self.waiting * self.frame_size - self.sent
+            if count > len(self.ring) - start:
+                count = len(self.ring) - start
+            if count > self.chunk - total:
+                count = self.chunk - total
+
+            written = self.uart.write(self.view[start:start + count])
+            if not written:
+                break
+            total += written
+            self.sent += written
+            while self.sent >= self.frame_size:
+                self.sent -= self.frame_size
+                self.waiting -= 1
+        return total
+
+    def run(self):
+        '''!@brief    Generator which frames the record and sends once per run.'''
+        while True:
+            self.sample()
+            self.send()
+            yield 0
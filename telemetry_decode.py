@@ -0,0 +1,125 @@
+'''!@file     telemetry_decode.py
+    @brief    Turns a captured stream of telemetry frames into rows of values.
+    @details  Reads the bytes received from the robot's Bluetooth UART, as
+              saved by a terminal's binary session log, finds the frames
+              described in telemetry.py, checks each one's length and CRC,
+              and unpacks the payloads. Anything between frames, such as
+              text printed to the REPL, is skipped, and a damaged frame is
+              dropped without losing the ones after it. The rows can be
+              written to a CSV file or turned into a NumPy array.
+
+              This file runs on a PC, not on the robot.
+
+              @b Example:
+              @code
+                  python telemetry_decode.py capture.bin             # summary
+                  python telemetry_decode.py capture.bin motors.csv  # to CSV
+              @endcode
+              or from Python:
+              @code
+                  import telemetry_decode
+                  with open('capture.bin', 'rb') as file:
+                      rows, stats = telemetry_decode.decode(file.read())
+                  data = telemetry_decode.to_numpy(rows)
+                  print(data['velocity_A'].mean())
+              @endcode
+'''
+import csv
+import struct
+import sys
+import types
+
+try:
+    import micropython
+except ImportError:
+    # telemetry.py only uses micropython.native, which changes nothing on a PC
+    micropython = types.ModuleType('micropython')
+    micropython.native = lambda fun: fun
+    sys.modules['micropython'] = micropython
+
+import telemetry
+
+
+class Stats:
+    '''!@brief    Counts of what was found while decoding a stream.'''
+    def __init__(self):
+        self.frames = 0
+        self.bad_crc = 0
+        self.bad_length = 0
+        self.skipped_bytes = 0
+        self.lost_frames = 0
+
+    def __repr__(self):
+        return (f'{self.frames} frames, {self.lost_frames} lost, '
+                f'{self.bad_crc} bad CRC, {self.bad_length} bad length, '
+                f'{self.skipped_bytes} bytes skipped')
+
+
+def decode(data, fmt=telemetry.MOTOR_FORMAT):
+    '''!@brief    Finds and unpacks every good frame in a stream.
+        @param    data  The bytes received
+                  fmt   The struct format of the record which was sent
+        @return   A list with a tuple of values for each good frame, and a
+                  Stats object
+    '''
+    payload_size = struct.calcsize(fmt)
+    frame_size = telemetry.HEADER_SIZE + payload_size + telemetry.CRC_SIZE
+    rows = []
+    stats = Stats()
+    last_seq = None
+    index = 0
+    while True:
+        found = data.find(telemetry.SYNC, index)
+        if found < 0 or found + frame_size > len(data):
+            stats.skipped_bytes += len(data) - index
+            break
+        stats.skipped_bytes += found - index
+        if data[found + 4] != payload_size:
+            # Sync bytes which happen to be in text or a payload
+            stats.bad_length += 1
+            index = found + 1
+            continue
+        end = found + telemetry.HEADER_SIZE + payload_size
+        crc = data[end] | (data[end + 1] << 8)
+        if telemetry.crc16(data, found + 2, end) != crc:
+            stats.bad_crc += 1
+            index = found + 1
+            continue
+
+        seq = data[found + 2] | (data[found + 3] << 8)
+        if last_seq is not None:
+            stats.lost_frames += (seq - last_seq - 1) & 0xFFFF
+        last_seq = seq
+        rows.append(struct.unpack_from(fmt, data, found + telemetry.HEADER_SIZE))
+        stats.frames += 1
+        index = found + frame_size
+    return rows, stats
+
+def write_csv(rows, path, names=telemetry.MOTOR_FIELDS):
+    '''!@brief    Writes decoded rows to a CSV file with a header row.
+        @param    rows   The rows from decode()
+                  path   Name of the file to write
+                  names  A name for each item in a row
+    '''
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(names)
+        writer.writerows(rows)
+
+def to_numpy(rows, names=telemetry.MOTOR_FIELDS):
+    '''!@brief    Turns decoded rows into a NumPy structured array.
+        @param    rows   The rows from decode()
+                  names  A name for each item in a row
+        @return   An array with one record per row and a float field per name
+    '''
+    import numpy as np
+    dtype = [(name, 'f8') for name in names]
+    return np.array([tuple(row) for row in rows], dtype=dtype)
+
+if __name__ == '__main__':
+    with open(sys.argv[1], 'rb') as file:
+        rows, stats = decode(file.read())
+    print(stats)
+    if len(sys.argv) > 2:
+        write_csv(rows, sys.argv[2])
+        print(f'Wrote {len(rows)} rows to {sys.argv[2]}')
@@ -0,0 +1,105 @@
+'''!@file     bench_drive.py
+    @brief    Host benchmark of the fused and split motor control tasks.
+    @details  Runs the two-wheel velocity loop for the same stretch of
+              simulated time in two ways: as the single DiffDrive task used by
+              main.py, and as one task per wheel the way main.py used to do it.
+              Both run through cotask's priority scheduler at the 17.5 ms
+              motor period, with the same gains and setpoints. The host time
+              spent in the scheduler calls which ran a control task is divided
+              by the number of control periods, so the figures include the
+              cost of dispatching the tasks as well as running them.
+
+              This file runs on a PC, not on the robot.
+
+              @b Example:
+              @code
+                  python tests/bench_drive.py
+              @endcode
+'''
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import romi_sim
+
+romi_sim.install()
+
+from time import ticks_us, ticks_diff
+import cotask, drive_control
+from conftest import make_hardware
+
+## Motor control period used by main.py, in milliseconds
+PERIOD = 17.5
+
+def wheel_task(enc, mot, control, setpoint, position, velocity):
+    '''!@brief    Makes a task function which controls one wheel, as main.py did
+                  before the wheels were fused into one task.
+    '''
+    def task_fun():
+        mot.enable()
+        last_time = ticks_us()
+        actual_velocity = 0.0
+        while True:
+            current_time = ticks_us()
+            delta_time = ticks_diff(current_time, last_time) / 1000000
+            enc.update()
+            if delta_time > 0:
+                last_time = current_time
+                actual_velocity = (enc.get_delta() * 6.28) / (1440 * delta_time)
+            PWM = control.feedback(setpoint.get(), actual_velocity, current_time)
+            mot.set_duty(PWM)
+            position.put(enc.get_position_radians())
+            velocity.put(actual_velocity)
+            yield 0
+    return task_fun
+
+def measure(fused, seconds=20.0):
+    '''!@brief    Runs the control loop and times the scheduler calls.
+        @param    fused    True for the DiffDrive task, False for one task per wheel
+                  seconds  Simulated time to run for
+        @return   Tuple of host microseconds per control period, task runs per
+                  control period, and the final speed of each wheel in rad/s
+    '''
+    sim = romi_sim.install()
+    parts = make_hardware()
+    task_list = cotask.TaskList()
+    if fused:
+        drive = drive_control.DiffDrive(**parts)
+        task_list.append(cotask.Task(drive.run, 'Drive', period=PERIOD))
+    else:
+        for side in 'AB':
+            fun = wheel_task(*(parts[name + '_' + side] for name in
+                               ('enc', 'mot', 'control', 'setpoint',
+                                'position', 'velocity')))
+            task_list.append(cotask.Task(fun, 'Motor ' + side, period=PERIOD))
+    tasks = [task for pri in task_list.pri_list for task in pri[2:]]
+
+    total = 0.0
+    runs = 0
+    end = int(seconds * 1000000)
+    while sim.now_us < end:
+        # Jump straight to the next time a task is due, then time its run
+        wait = min(ticks_diff(task._next_run, sim.ticks_us()) for task in tasks)
+        if wait >= 0:
+            sim.advance(wait + 1)
+            continue
+        start = time.perf_counter()
+        task_list.pri_sched()
+        total += time.perf_counter() - start
+        runs += 1
+    periods = seconds * 1000 / PERIOD
+    return (total * 1e6 / periods, runs / periods,
+            (parts['velocity_A'].get(), parts['velocity_B'].get()))
+
+def report():
+    '''!@brief    Prints the comparison table.'''
+    print('TASKS        US/PERIOD  RUNS/PERIOD  FINAL SPEED A, B (rad/s)')
+    for fused, name in ((False, 'split (2)'), (True, 'fused (1)')):
+        per_period, runs, speeds = measure(fused)
+        print(f'{name:<12s}{per_period:10.2f}{runs:13.2f}'
+              f'      {speeds[0]:.3f}, {speeds[1]:.3f}')
+
+if __name__ == '__main__':
+    report()
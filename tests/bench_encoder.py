@@ -0,0 +1,80 @@
+'''!@file     bench_encoder.py
+    @brief    Host comparison of encoder velocity accuracy against wheel speed.
+    @details  Runs the simulated left wheel at a range of fixed PWMs and, once
+              it has settled, updates two encoders on it every 17.5 ms motor
+              period: one which finds velocity from the change in count alone,
+              and one which also times the edges of channel A with a 1 MHz
+              input capture timer, as main.py does. For each speed the worst
+              and RMS relative errors of both against the true wheel speed are
+              printed, along with which estimate the second encoder used.
+
+              This file runs on a PC, not on the robot.
+
+              @b Example:
+              @code
+                  python tests/bench_encoder.py
+              @endcode
+'''
+import math
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import romi_sim
+
+romi_sim.install()
+
+from pyb import Pin, Timer
+import encoder_driver, romi_driver
+
+## Motor control period used by main.py, in microseconds
+PERIOD_US = 17500
+
+## Number of motor periods compared at each speed
+SAMPLES = 200
+
+## PWM percents to run the wheel at
+PWMS = (2, 3, 5, 8, 12, 20, 30, 50, 75, 100)
+
+def measure(pwm):
+    '''!@brief    Runs the wheel at one PWM and compares both encoders.
+        @return   Tuple of the wheel speed in rad/s, then the worst and RMS
+                  relative errors of the count and edge timing encoders
+    '''
+    sim = romi_sim.install(romi_sim.Simulator(capture=True))
+    mot = romi_driver.Romi(Timer(1, freq=20000), Pin.cpu.B3, Pin.cpu.A7, Pin.cpu.A8)
+    mot.enable()
+    encoders = (encoder_driver.Encoder(Timer(3, period=65535, prescaler=0), Pin.cpu.B4, Pin.cpu.B5),
+                encoder_driver.Encoder(Timer(3, period=65535, prescaler=0), Pin.cpu.B4, Pin.cpu.B5,
+                                       Timer(15, period=65535, prescaler=79), 1, Pin.cpu.B14))
+    mot.set_duty(pwm)
+    sim.advance(1000000)
+    for _ in range(10):
+        for enc in encoders:
+            enc.update()
+        sim.advance(PERIOD_US)
+    worst = [0.0, 0.0]
+    squares = [0.0, 0.0]
+    for _ in range(SAMPLES):
+        sim.advance(PERIOD_US)
+        for i, enc in enumerate(encoders):
+            enc.update()
+            error = abs(enc.get_velocity() - sim.omega[0]) / sim.omega[0]
+            worst[i] = max(worst[i], error)
+            squares[i] += error * error
+    rms = [math.sqrt(total / SAMPLES) for total in squares]
+    return sim.omega[0], worst[0], rms[0], worst[1], rms[1]
+
+def report():
+    '''!@brief    Prints the accuracy table.'''
+    print('PWM  SPEED (rad/s)  COUNTS/PERIOD  COUNT WORST  COUNT RMS  EDGE WORST  EDGE RMS  USED')
+    for pwm in PWMS:
+        speed, count_worst, count_rms, edge_worst, edge_rms = measure(pwm)
+        per_period = speed * 1440 / (2 * math.pi) * PERIOD_US / 1000000
+        used = 'counts' if per_period >= encoder_driver.SWITCH_COUNTS else 'edges'
+        print(f'{pwm:3d}{speed:15.3f}{per_period:15.1f}{count_worst:12.2%}{count_rms:11.2%}'
+              f'{edge_worst:12.2%}{edge_rms:10.2%}  {used}')
+
+if __name__ == '__main__':
+    report()
@@ -0,0 +1,151 @@
+'''!@file     bench_imu.py
+    @brief    Host benchmark of the per-sample cost of an unwrapped IMU heading.
+    @details  Spins the simulated robot through several turns while keeping a
+              continuous heading three ways: from the Euler heading with the
+              jump at 360 degrees taken out, from the quaternion with
+              math.atan2() on every sample, and from the quaternion with the
+              driver's incremental unwrap. For each, the host time per sample
+              (including the simulated I2C read), the trig calls per sample,
+              the bytes read per sample and the worst error against the true
+              heading are printed.
+
+              It then boots the simulated IMU, which takes LIVE_CALIBRATION
+              seconds to calibrate itself, with no saved calibration profile,
+              with a good one and with a bad one, and prints the time each
+              took to become fully calibrated.
+
+              This file runs on a PC, not on the robot.
+
+              @b Example:
+              @code
+                  python tests/bench_imu.py
+              @endcode
+'''
+import math
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import romi_sim
+
+romi_sim.install()
+
+import IMU_driver
+
+## Number of samples in the run
+SAMPLES = 20000
+
+## Turn between samples in radians, about 3 rad/s at 100 samples per second
+STEP = -0.03
+
+## Time the simulated IMU takes to calibrate itself, in seconds
+LIVE_CALIBRATION = 8.0
+
+
+class CountingMath:
+    '''!@brief    Stand-in for the math module which counts trig calls.'''
+    def __init__(self):
+        self.calls = 0
+
+    def atan2(self, y, x):
+        self.calls += 1
+        return math.atan2(y, x)
+
+    def degrees(self, angle):
+        return math.degrees(angle)
+
+
+def euler_wrap(imu, state):
+    '''!@brief    Unwraps the Euler heading by taking out jumps of 360 degrees.'''
+    heading = imu.read_block(IMU_driver.EULER)[IMU_driver.HEADING]
+    if state[0] is None:
+        state[0] = heading
+        state[1] = heading
+    else:
+        state[1] += (heading - state[0] + 180) % 360 - 180
+        state[0] = heading
+    return state[1]
+
+def quat_atan2(imu, state):
+    '''!@brief    Finds the heading from each quaternion with atan2, then unwraps it.'''
+    w, x, y, z = imu.read_quaternion()
+    heading = -IMU_driver.math.degrees(2 * IMU_driver.math.atan2(z, w))
+    if state[0] is None:
+        state[0] = heading
+        state[1] = heading % 360
+    else:
+        state[1] += (heading - state[0] + 180) % 360 - 180
+        state[0] = heading
+    return state[1]
+
+def quat_incremental(imu, state):
+    '''!@brief    Uses the driver's incremental unwrap of the quaternion.'''
+    return imu.read_block(IMU_driver.QUAT)[IMU_driver.UNWRAPPED_HEADING]
+
+def measure(method):
+    '''!@brief    Runs one way of unwrapping the heading over the spinning run.
+        @return   Tuple of host microseconds per sample, trig calls per sample,
+                  bytes read per sample and worst error in degrees
+    '''
+    sim = romi_sim.install()
+    imu = IMU_driver.BNO055()
+    counter = CountingMath()
+    IMU_driver.math = counter
+    state = [None, 0.0]
+    worst = 0.0
+    total = 0.0
+    try:
+        for _ in range(SAMPLES):
+            sim.theta += STEP
+            start = time.perf_counter()
+            heading = method(imu, state)
+            total += time.perf_counter() - start
+            worst = max(worst, abs(heading + math.degrees(sim.theta)))
+    finally:
+        IMU_driver.math = math
+    return (total * 1e6 / SAMPLES, counter.calls / SAMPLES,
+            imu.i2c.bytes_read / SAMPLES, worst)
+
+def boot_time(profile, filename):
+    '''!@brief    Boots the simulated IMU, running the boot task every 20 ms.
+        @param    profile   Bytes to save as the calibration profile first, or
+                            None to start without one
+                  filename  Name of the calibration profile file
+        @return   The time taken to calibrate in milliseconds, and whether
+                  the saved profile was accepted
+    '''
+    sim = romi_sim.install()
+    sim.imu_calibration_us = int(LIVE_CALIBRATION * 1000000)
+    if os.path.exists(filename):
+        os.remove(filename)
+    if profile is not None:
+        with open(filename, 'wb') as file:
+            file.write(sim.imu_profile if profile is True else profile)
+    imu = IMU_driver.BNO055()
+    for _ in imu.boot(filename=filename):
+        sim.advance(20000)
+    for _ in imu.calibrate(filename=filename):
+        sim.advance(20000)
+    return imu.calibration_time, imu.profile_accepted
+
+def report():
+    '''!@brief    Prints the comparison tables.'''
+    print('METHOD             US/SAMPLE  TRIG/SAMPLE  BYTES/SAMPLE  WORST ERROR (deg)')
+    for name, method in (('euler + wrap', euler_wrap), ('quat + atan2', quat_atan2),
+                         ('quat incremental', quat_incremental)):
+        per_sample, trig, size, worst = measure(method)
+        print(f'{name:<17s}{per_sample:11.2f}{trig:13.4f}{size:14.1f}{worst:19.4f}')
+
+    print()
+    print('PROFILE        TIME TO CALIBRATED (ms)  PROFILE ACCEPTED')
+    filename = os.path.join(tempfile.mkdtemp(), 'imu_cal.bin')
+    for name, profile in (('none', None), ('saved', True),
+                          ('bad', bytes(IMU_driver.CALIBRATION_SIZE))):
+        elapsed, accepted = boot_time(profile, filename)
+        print(f'{name:<15s}{elapsed:24d}  {accepted}')
+
+if __name__ == '__main__':
+    report()
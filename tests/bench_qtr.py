@@ -0,0 +1,146 @@
+'''!@file     bench_qtr.py
+    @brief    Host benchmark of heap allocation and time per line sensor read.
+    @details  Compares the original list-based line sensor functions in
+              QTR_driver.py with QTRArray, both reading a fake ADC which returns
+              fixed levels with a line under the middle of the array.
+
+              CPython boxes every int, so its own allocation counters can't
+              show what MicroPython would allocate. Instead, each read is run
+              under a tracer which keeps every value the driver's code binds to
+              a local variable or returns, along with the contents of any list,
+              tuple or dict among them. Of those, the objects which MicroPython
+              puts on its heap are counted: floats, containers and instances,
+              and ints too big to be small ints. Objects which existed before
+              the read, such as the driver's preallocated arrays, module
+              constants and constants in the code, are not counted.
+
+              This file runs on a PC, not on the robot.
+
+              @b Example:
+              @code
+                  python tests/bench_qtr.py
+              @endcode
+'''
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import romi_sim
+
+romi_sim.install()
+
+import QTR_driver
+
+## Raw readings returned by the fake ADCs, with the line under sensors 2 and 3
+LEVELS = (260, 410, 3350, 2980, 330, 255)
+
+## Largest magnitude of a MicroPython small int on a 32-bit port
+SMALL_INT = 1 << 30
+
+## Number of reads timed for each pipeline
+READS = 20000
+
+
+class FakeADC:
+    '''!@brief    Stand-in for pyb.ADC which returns one fixed reading per pin.'''
+    def __init__(self, pin):
+        name = pin.name() if hasattr(pin, 'name') else str(pin)
+        self.level = LEVELS[romi_sim.QTR_PINS.index(name)]
+
+    def read(self):
+        return self.level
+
+
+def heap_objects(value, found):
+    '''!@brief    Adds a value, and the contents of a container, to a dictionary of
+                  objects which MicroPython would keep on its heap.
+    '''
+    if value is None or isinstance(value, (bool, str, type)) or callable(value):
+        return
+    if isinstance(value, int) and -SMALL_INT <= value < SMALL_INT:
+        return
+    if id(value) in found:
+        return
+    found[id(value)] = value
+    if isinstance(value, (list, tuple)):
+        for item in value:
+            heap_objects(item, found)
+    elif isinstance(value, dict):
+        for item in value.values():
+            heap_objects(item, found)
+
+def existing_objects(*roots):
+    '''!@brief    Finds the heap objects which already exist before a read.'''
+    found = {}
+    for root in roots:
+        heap_objects(root, found)
+        for value in getattr(root, '__dict__', {}).values():
+            heap_objects(value, found)
+    for value in vars(QTR_driver).values():
+        heap_objects(value, found)
+    return found
+
+def count_allocations(read, *roots):
+    '''!@brief    Counts the heap objects MicroPython would create in one read.
+        @param    read   A function which does one read and returns its result
+                  roots  Objects, such as a QTRArray, whose attributes existed
+                         before the read
+        @return   A list of the new objects
+    '''
+    existing = existing_objects(*roots)
+    found = {}
+
+    def tracer(frame, event, arg):
+        if frame.f_globals is not vars(QTR_driver):
+            return None
+        consts = {id(const) for const in frame.f_code.co_consts}
+        def local_tracer(frame, event, arg):
+            for value in frame.f_locals.values():
+                if id(value) not in consts:
+                    heap_objects(value, found)
+            if event == 'return' and id(arg) not in consts:
+                heap_objects(arg, found)
+            return local_tracer
+        return local_tracer
+
+    sys.settrace(tracer)
+    try:
+        result = read()
+    finally:
+        sys.settrace(None)
+    heap_objects(result, found)
+    return [value for key, value in found.items() if key not in existing]
+
+def old_pipeline():
+    '''!@brief    One read using the original functions, as main.py used them.'''
+    values = QTR_driver.read_and_normalize_data()
+    binary = QTR_driver.apply_threshold(values, 0.85)
+    return QTR_driver.compute_centroid(binary)
+
+def time_per_read(read):
+    '''!@brief    Times a read function, returning host microseconds per read.'''
+    start = time.perf_counter()
+    for _ in range(READS):
+        read()
+    return (time.perf_counter() - start) * 1e6 / READS
+
+def report():
+    '''!@brief    Prints the comparison table.'''
+    QTR_driver.ADC = FakeADC
+    qtr = QTR_driver.QTRArray()
+    pipelines = (('functions', old_pipeline, ()),
+                 ('QTRArray.read', qtr.read, (qtr,)),
+                 ('QTRArray.read_centroid', qtr.read_centroid, (qtr,)))
+    print('PIPELINE                 HEAP OBJECTS/READ  US/READ  CENTROID')
+    for name, read, roots in pipelines:
+        read()
+        new = count_allocations(read, *roots)
+        kinds = sorted({type(value).__name__ for value in new})
+        centroid = old_pipeline() if read is old_pipeline else qtr.read_centroid()
+        print(f'{name:<25s}{len(new):17d}{time_per_read(read):9.2f}'
+              f'{centroid:10.4f}   {", ".join(kinds)}')
+
+if __name__ == '__main__':
+    report()
@@ -0,0 +1,80 @@
+'''!@file     bench_share.py
+    @brief    Host benchmark of separate shares against one MultiShare.
+    @details  Publishes and reads a wheel's position, velocity and sample time
+              the way the motor task does, first as three thread-protected
+              Share objects with a put() and a get() each, then as one
+              MultiShare written from a staged array and read into another.
+              The table shows publish-and-read cycles per second, the share
+              calls and interrupt-disabled windows per cycle, and the
+              speed-up.
+
+              On the host the interrupt calls are Python lambdas, so the
+              figures show the call overhead saved; on the Nucleo each window
+              also costs two real calls into pyb.
+
+              This file runs on a PC, not on the robot.
+
+              @b Example:
+              @code
+                  python tests/bench_share.py
+              @endcode
+'''
+import array
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import romi_sim
+
+romi_sim.install()
+
+import task_share
+
+## Number of publish-and-read cycles timed for each way
+CYCLES = 200000
+
+def separate():
+    '''!@brief    Times three separate shares.
+        @return   Cycles per second
+    '''
+    position = task_share.Share('f', name="Position")
+    velocity = task_share.Share('f', name="Velocity")
+    stamp = task_share.Share('f', name="Time")
+    start = time.perf_counter()
+    for i in range(CYCLES):
+        position.put(i)
+        velocity.put(0.5)
+        stamp.put(i)
+        position.get()
+        velocity.get()
+        stamp.get()
+    return CYCLES / (time.perf_counter() - start)
+
+def packed():
+    '''!@brief    Times one MultiShare holding the same three values.
+        @return   Cycles per second
+    '''
+    wheel = task_share.MultiShare('f', 3, name="Wheel")
+    staged = array.array('f', [0.0] * 3)
+    latest = array.array('f', [0.0] * 3)
+    start = time.perf_counter()
+    for i in range(CYCLES):
+        staged[0] = i
+        staged[1] = 0.5
+        staged[2] = i
+        wheel.put(staged)
+        wheel.get_into(latest)
+    return CYCLES / (time.perf_counter() - start)
+
+def report():
+    '''!@brief    Prints the comparison table.'''
+    base = separate()
+    fast = packed()
+    print('WAY            CYCLES/S  CALLS/CYCLE  IRQ WINDOWS/CYCLE  SPEED-UP')
+    print(f'{"3 x Share":<12s}{base:11.0f}{6:13d}{6:19d}{1:10.2f}')
+    print(f'{"MultiShare":<12s}{fast:11.0f}{2:13d}{2:19d}{fast / base:10.2f}')
+
+if __name__ == '__main__':
+    report()
@@ -0,0 +1,72 @@
+'''!@file     bench_sim.py
+    @brief    Host benchmark of how much faster than real time main.py simulates.
+    @details  Runs every task in main.py for SECONDS of simulated time, once
+              as romi_sim.py runs it from a shell and once with the encoder
+              input capture interrupts modelled as well, and prints the
+              simulated seconds per host second of each. The simulator is
+              meant for overnight sweeps, so the plain run has to be at least
+              MIN_SPEED times real time; the script fails if it isn't.
+
+              This file runs on a PC, not on the robot.
+
+              @b Example:
+              @code
+                  python tests/bench_sim.py
+              @endcode
+'''
+import io
+import os
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import romi_sim
+
+romi_sim.install()
+
+import cotask
+
+## Simulated time main.py is run for, in seconds
+SECONDS = 30.0
+
+## Times each run is repeated, the fastest of which is reported
+REPEATS = 3
+
+## Slowest allowed speed of the plain run, in simulated seconds per host second
+MIN_SPEED = 100
+
+def measure(capture):
+    '''!@brief    Runs main.py in a new simulator and times it.
+        @param    capture  True to model the encoder input capture interrupts
+        @return   Simulated seconds per host second
+    '''
+    sim = romi_sim.install(romi_sim.Simulator(capture=capture))
+    cotask.task_list = cotask.TaskList()
+    sys.modules.pop('main', None)
+    with redirect_stdout(io.StringIO()):
+        import main
+        main.create_tasks()
+        start = time.perf_counter()
+        sim.run(SECONDS)
+        elapsed = time.perf_counter() - start
+    main.enc_sampler.stop()
+    return SECONDS / elapsed
+
+def report():
+    '''!@brief    Prints the speeds and checks the plain run against MIN_SPEED.'''
+    # Keep the calibration files main.py writes out of the way
+    os.chdir(tempfile.mkdtemp())
+    print('RUN              SPEED (x REAL TIME)')
+    speeds = {}
+    for capture, name in ((False, 'main.py'), (True, 'with capture')):
+        speeds[capture] = max(measure(capture) for _ in range(REPEATS))
+        print(f'{name:<17s}{speeds[capture]:9.0f}')
+    if speeds[False] < MIN_SPEED:
+        sys.exit(f'main.py simulated at {speeds[False]:.0f}x real time, '
+                 f'below {MIN_SPEED}x')
+
+if __name__ == '__main__':
+    report()
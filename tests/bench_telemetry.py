@@ -0,0 +1,114 @@
+'''!@file     bench_telemetry.py
+    @brief    Host benchmark of binary telemetry against the printed table.
+    @details  Runs main.py in the simulator for SECONDS with the binary motor
+              telemetry in place of task_printing, decodes what was written
+              to the Bluetooth UART, and prints the frame rate and the frames
+              lost or damaged. It then times, on the host, building and
+              sending one frame against formatting one line of the printed
+              table, and prints the share of a 115200 baud link which the
+              frames take at several rates. pyb's UART sends each byte before
+              write() returns, so on the Nucleo that share is also the share
+              of CPU time spent writing.
+
+              This file runs on a PC, not on the robot.
+
+              @b Example:
+              @code
+                  python tests/bench_telemetry.py
+              @endcode
+'''
+import io
+import os
+import sys
+import time
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import romi_sim
+
+sim = romi_sim.install()
+
+import task_share
+import telemetry
+import telemetry_decode
+from pyb import UART
+
+## Simulated time main.py is run for, in seconds
+SECONDS = 10.0
+
+## Number of frames and lines timed on the host
+REPEATS = 20000
+
+## Baud rate of the Bluetooth UART
+BAUD = 115200
+
+## Frame rates at which the link is checked, in frames per second
+RATES = (57, 100, 200, 400)
+
+def run_main():
+    '''!@brief    Streams telemetry from main.py running in the simulator.
+        @return   The decoded rows and the decoder's Stats
+    '''
+    with redirect_stdout(io.StringIO()):
+        import main
+        main.stream_telemetry = True
+        main.create_tasks()
+        sim.run(SECONDS)
+    try:
+        os.remove('imu_cal.bin')
+    except OSError:
+        pass
+    return telemetry_decode.decode(bytes(main.BT_ser.written))
+
+def time_frame():
+    '''!@brief    Times building and sending one frame on the host.
+        @return   Microseconds per frame and bytes per frame
+    '''
+    record = task_share.Record(telemetry.MOTOR_FORMAT)
+    link = telemetry.Telemetry(UART(1, BAUD), record, chunk=1 << 20)
+    start = time.perf_counter()
+    for i in range(REPEATS):
+        record.put(i, 1.0, 2.0, 3.0, 4.0)
+        link.sample()
+        link.send()
+    return (time.perf_counter() - start) * 1e6 / REPEATS, link.frame_size
+
+def time_line():
+    '''!@brief    Times formatting one line of task_printing's table on the host.
+        @return   Microseconds per line and bytes per line
+    '''
+    record = task_share.Record(telemetry.MOTOR_FORMAT)
+    out = io.StringIO()
+    start = time.perf_counter()
+    for i in range(REPEATS):
+        record.put(i, 1.0, 2.0, 3.0, 4.0)
+        _, _, velocity_A, _, velocity_B = record.get()
+        total = (velocity_A + velocity_B) * 1.42 / 2
+        print(f"{i / 1000:7.2f} | {velocity_A:17.4f} | {velocity_B:17.4f} | {total:23.4f}", file=out)
+    return (time.perf_counter() - start) * 1e6 / REPEATS, len(out.getvalue()) // REPEATS
+
+def report():
+    '''!@brief    Prints the results.'''
+    rows, stats = run_main()
+    times = [row[0] for row in rows]
+    span = (times[-1] - times[0]) / 1e6 if len(times) > 1 else 0
+    print(f'main.py for {SECONDS:.0f} s: {stats}')
+    if span:
+        print(f'  {(len(rows) - 1) / span:.1f} frames/s of motor data')
+    print()
+
+    frame_us, frame_bytes = time_frame()
+    line_us, line_bytes = time_line()
+    print('WAY          HOST US  BYTES')
+    print(f'{"frame":<11s}{frame_us:9.2f}{frame_bytes:7d}')
+    print(f'{"text line":<11s}{line_us:9.2f}{line_bytes:7d}')
+    print()
+
+    print(f'RATE (Hz)  BYTES/S  LINK USE AT {BAUD} BAUD')
+    for rate in RATES:
+        per_second = rate * frame_bytes
+        print(f'{rate:9d}{per_second:9d}{per_second * 10 / BAUD:10.1%}')
+
+if __name__ == '__main__':
+    report()
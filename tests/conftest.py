@@ -0,0 +1,59 @@
+'''!@file     conftest.py
+    @brief    Shared setup for the host tests.
+    @details  The robot's modules import @c pyb, @c utime and @c micropython,
+              so the fakes from romi_sim.py are installed before any test
+              module is imported. Each test which needs the clock or the
+              robot model asks for the @c sim fixture, which starts it over
+              with a fresh simulator.
+
+              make_hardware() builds the drive objects main.py gives the
+              motor task. The @c hardware fixture hands it to tests, and the
+              benchmarks in this folder import it directly.
+'''
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import romi_sim
+
+romi_sim.install()
+
+from pyb import Pin, Timer
+import closed_loop_driver, encoder_driver, romi_driver, task_share
+
+## Wheel speed setpoint given to both wheels by make_hardware(), in rad/s
+SETPOINT = 4.4
+
+def make_hardware():
+    '''!@brief    Makes the encoders, motors, controllers and shares for both wheels.
+        @return   A dictionary of the objects, keyed by their names in main.py
+    '''
+    parts = {
+        'enc_A': encoder_driver.Encoder(Timer(3, period=65535, prescaler=0), Pin.cpu.B4, Pin.cpu.B5),
+        'enc_B': encoder_driver.Encoder(Timer(2, period=65535, prescaler=0), Pin.cpu.A0, Pin.cpu.A1),
+        'mot_A': romi_driver.Romi(Timer(1, freq=20000), Pin.cpu.B3, Pin.cpu.A7, Pin.cpu.A8),
+        'mot_B': romi_driver.Romi(Timer(4, freq=20000), Pin.cpu.C7, Pin.cpu.B10, Pin.cpu.B6),
+        'control_A': closed_loop_driver.ClosedLoop(3.50, 2.75, 0.00),
+        'control_B': closed_loop_driver.ClosedLoop(3.50, 2.75, 0.00),
+    }
+    for name in ('setpoint_A', 'setpoint_B', 'position_A', 'velocity_A',
+                 'position_B', 'velocity_B'):
+        parts[name] = task_share.Share('f', thread_protect=False, name=name)
+    parts['setpoint_A'].put(SETPOINT)
+    parts['setpoint_B'].put(SETPOINT)
+    return parts
+
+@pytest.fixture
+def sim():
+    '''!@brief    A new simulator with the robot at the origin of an oval track.'''
+    return romi_sim.install()
+
+@pytest.fixture(scope='session')
+def hardware():
+    '''!@brief    make_hardware(), for tests which build the drive objects
+                  after installing their own simulator.
+    '''
+    return make_hardware
@@ -0,0 +1,98 @@
+'''!@file     test_closed_loop.py
+    @brief    Host tests of the fixed-point PID controller against ClosedLoop.
+    @details  A trace of wheel velocity setpoints and measurements is recorded
+              from the simulated robot running its velocity loop, with the
+              task period jittered and noise added to the measurements. The
+              trace is then replayed through ClosedLoop and FixedClosedLoop
+              with the same gains, and their outputs are compared step by step.
+
+              FixedClosedLoop takes velocities in steps of 1/SCALE rad/s, and
+              the derivative term magnifies that step by the control rate. The
+              arithmetic is checked on a trace rounded to those steps, and the
+              whole controller, input rounding included, on the raw trace.
+'''
+import random
+
+import pytest
+
+import closed_loop_driver
+import drive_control
+import romi_sim
+
+## Largest allowed difference between the two controllers' outputs, in PWM
+#  percent, when given velocities which FixedClosedLoop can represent exactly
+TOLERANCE = 0.05
+
+## Largest allowed difference in PWM percent when given the raw velocities
+RAW_TOLERANCE = 0.25
+
+## The gains compared: the motor gains in main.py with and without a small
+#  derivative gain, a derivative-heavy set and an integral-heavy set
+GAINS = [(3.50, 2.75, 0.00), (3.50, 2.75, 0.05), (2.65, 0.0, 0.76),
+         (1.3, 5.1, 0.013)]
+
+
+def record(hardware, steps=3000, seed=3):
+    '''!@brief    Records (time, setpoint, measured velocity) samples from a run.'''
+    sim = romi_sim.install()
+    parts = hardware()
+    drive = drive_control.DiffDrive(**parts)
+    run = drive.run()
+    rng = random.Random(seed)
+    samples = []
+    for step in range(steps):
+        # Step the setpoint around every couple of seconds
+        setpoint = (4.4, -2.0, 6.0, 0.0, 1.5)[step // 120 % 5]
+        parts['setpoint_A'].put(setpoint)
+        next(run)
+        measured = parts['velocity_A'].get() + rng.gauss(0, 0.3)
+        samples.append((sim.ticks_us(), setpoint, measured))
+        sim.advance(17500 + rng.randint(-3000, 6000))
+    return samples
+
+@pytest.fixture(scope='module')
+def trace(hardware):
+    '''!@brief    A trace recorded once for all the tests in this file.'''
+    return record(hardware)
+
+@pytest.fixture(scope='module')
+def rounded(trace):
+    '''!@brief    The trace with velocities rounded to steps of 1/SCALE rad/s.'''
+    scale = closed_loop_driver.SCALE
+    return [(time, round(setpoint * scale) / scale, round(measured * scale) / scale)
+            for time, setpoint, measured in trace]
+
+def replay(control, samples):
+    '''!@brief    Runs a controller over a trace and returns its outputs.'''
+    control.last_time = samples[0][0]
+    return [control.feedback(setpoint, measured, time)
+            for time, setpoint, measured in samples]
+
+def worst_difference(gains, samples):
+    '''!@brief    Largest difference between the two controllers over a trace.'''
+    expected = replay(closed_loop_driver.ClosedLoop(*gains), samples)
+    actual = replay(closed_loop_driver.FixedClosedLoop(*gains), samples)
+    return max(abs(a - e) for a, e in zip(actual, expected))
+
+@pytest.mark.parametrize('gains', GAINS)
+def test_fixed_matches_float(rounded, gains):
+    assert worst_difference(gains, rounded) < TOLERANCE
+
+@pytest.mark.parametrize('gains', GAINS)
+def test_fixed_matches_float_on_raw_velocities(trace, gains):
+    assert worst_difference(gains, trace) < RAW_TOLERANCE
+
+def test_gains_are_rounded():
+    control = closed_loop_driver.FixedClosedLoop(2.65, 0.05, 0.05)
+    scale = 1 << closed_loop_driver.GAIN_BITS
+    for gain, real in ((control.kp, 2.65), (control.ki, 0.05), (control.kd, 0.05)):
+        assert abs(gain / scale - real) <= 0.5 / scale
+
+def test_state_stays_a_small_int(trace):
+    control = closed_loop_driver.FixedClosedLoop(3.50, 2.75, 0.05)
+    control.last_time = trace[0][0]
+    for time, setpoint, measured in trace:
+        control.feedback(setpoint, measured, time)
+        assert abs(control.integral) < 1 << 30
+        assert abs(control.kp * control.last_error) < 1 << 30
+        assert abs(control.ki * (control.integral >> closed_loop_driver.GAIN_BITS)) < 1 << 30
@@ -0,0 +1,106 @@
+'''!@file     test_cotask.py
+    @brief    Host tests of the cotask schedulers and overrun policies.
+'''
+import cotask
+import romi_sim
+
+
+def counter(counts, key):
+    '''!@brief    Makes a task function which counts its runs in a dictionary.'''
+    def task_fun():
+        while True:
+            counts[key] = counts.get(key, 0) + 1
+            yield 0
+    return task_fun
+
+def make_list(counts, periods):
+    '''!@brief    Makes a task list with one counting task per given period.'''
+    task_list = cotask.TaskList()
+    tasks = []
+    for n, period in enumerate(periods):
+        task = cotask.Task(counter(counts, n), name=f'T{n}', period=period)
+        task_list.append(task)
+        tasks.append(task)
+    return task_list, tasks
+
+def dispatch(sim, sched, calls, step_us=100):
+    '''!@brief    Calls a scheduler repeatedly, advancing the clock between calls.'''
+    for _ in range(calls):
+        sched()
+        sim.advance(step_us)
+
+
+def test_edf_runs_each_task_at_its_period(sim):
+    counts = {}
+    task_list, _ = make_list(counts, (2, 5, 10))
+    dispatch(sim, task_list.edf_sched, 10000)      # One simulated second
+    assert abs(counts[0] - 500) <= 2
+    assert abs(counts[1] - 200) <= 2
+    assert abs(counts[2] - 100) <= 2
+
+def test_edf_matches_pri_sched(sim):
+    periods = (1, 3, 7, 7, 20, 50)
+    edf_counts = {}
+    edf_list, _ = make_list(edf_counts, periods)
+    dispatch(sim, edf_list.edf_sched, 5000)
+    sim = romi_sim.install()
+    pri_counts = {}
+    pri_list, _ = make_list(pri_counts, periods)
+    dispatch(sim, pri_list.pri_sched, 5000)
+    assert edf_counts == pri_counts
+
+def test_untimed_task_leaves_the_heap(sim):
+    counts = {}
+    task_list, tasks = make_list(counts, (1, 5))
+    dispatch(sim, task_list.edf_sched, 20)
+    tasks[0].set_period(None)
+    assert tasks[0] not in task_list.heap
+    assert tasks[0] in task_list.untimed
+    before = dict(counts)
+    dispatch(sim, task_list.edf_sched, 2000)
+    assert counts[0] == before[0]
+    assert counts[1] - before.get(1, 0) >= 39
+
+    tasks[0].go()
+    dispatch(sim, task_list.edf_sched, 1)
+    assert counts[0] == before[0] + 1
+
+def test_untimed_task_joins_the_heap(sim):
+    counts = {}
+    task_list = cotask.TaskList()
+    task = cotask.Task(counter(counts, 0), period=None)
+    task_list.append(task)
+    dispatch(sim, task_list.edf_sched, 100)
+    assert counts.get(0, 0) == 0
+    task.set_period(2)
+    assert task in task_list.heap
+    dispatch(sim, task_list.edf_sched, 1000)
+    assert abs(counts[0] - 50) <= 1
+
+def test_go_runs_a_timed_task_early(sim):
+    counts = {}
+    task_list, tasks = make_list(counts, (1000, 1))
+    dispatch(sim, task_list.edf_sched, 50)
+    assert counts.get(0, 0) == 0
+    tasks[0].go()
+    dispatch(sim, task_list.edf_sched, 1)
+    assert counts[0] == 1
+    assert not tasks[0].go_flag
+
+def test_overrun_policies(sim):
+    counts = {}
+    task_list = cotask.TaskList()
+    policies = (cotask.CATCH_UP, cotask.SKIP, cotask.REPHASE)
+    tasks = [cotask.Task(counter(counts, n), period=10, overrun=policy)
+             for n, policy in enumerate(policies)]
+    for task in tasks:
+        task_list.append(task)
+    sim.advance(55000)          # A stall of five and a half periods
+    dispatch(sim, task_list.pri_sched, 100, step_us=10)
+    assert counts[0] == 5       # Every missed period is made up
+    assert counts[1] == 1       # The missed periods are skipped
+    assert counts[2] == 1
+    assert tasks[1]._skipped == 4 and tasks[2]._skipped == 4
+    # SKIP stays in phase with the original schedule; REPHASE restarts it
+    assert tasks[1]._next_run == 60000
+    assert tasks[2]._next_run > 60000
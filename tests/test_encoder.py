@@ -0,0 +1,175 @@
+'''!@file     test_encoder.py
+    @brief    Host tests of encoder velocity from counts and from edge timing.
+'''
+import math
+
+import pytest
+
+import encoder_driver
+import romi_driver
+from pyb import Pin, Timer
+
+## Motor control period used by main.py, in microseconds
+PERIOD_US = 17500
+
+
+class Wheel:
+    '''!@brief    The simulated left wheel with a plain encoder and one which
+                  also times its edges, as main.py sets them up.
+    '''
+    def __init__(self, sim, capture_pin=Pin.cpu.B14):
+        self.sim = sim
+        sim.capture = True
+        self.mot = romi_driver.Romi(Timer(1, freq=20000), Pin.cpu.B3, Pin.cpu.A7, Pin.cpu.A8)
+        self.mot.enable()
+        self.counts = encoder_driver.Encoder(Timer(3, period=65535, prescaler=0),
+                                             Pin.cpu.B4, Pin.cpu.B5)
+        self.edges = encoder_driver.Encoder(Timer(3, period=65535, prescaler=0),
+                                            Pin.cpu.B4, Pin.cpu.B5,
+                                            Timer(15, period=65535, prescaler=79), 1,
+                                            capture_pin)
+
+    def run(self, pwm, settle=0.6, samples=40):
+        '''!@brief    Runs the wheel at a PWM, then compares both encoders'
+                      velocities with the true wheel speed.
+            @return   The worst relative error of the plain encoder and of the
+                      edge timing one
+        '''
+        self.mot.set_duty(pwm)
+        self.sim.advance(int(settle * 1000000))
+        # Edge timing needs an edge, then a period, before it takes over
+        for _ in range(8):
+            for enc in (self.counts, self.edges):
+                enc.update()
+            self.sim.advance(PERIOD_US)
+        worst = [0.0, 0.0]
+        for _ in range(samples):
+            self.sim.advance(PERIOD_US)
+            true = self.sim.omega[0]
+            for i, enc in enumerate((self.counts, self.edges)):
+                enc.update()
+                worst[i] = max(worst[i], abs(enc.get_velocity() - true) / abs(true))
+        return worst
+
+
+@pytest.mark.parametrize('pwm', [3, 6, 10, -6])
+def test_edge_timing_is_accurate_at_low_speed(sim, pwm):
+    counts, edges = Wheel(sim).run(pwm)
+    assert counts > 0.1
+    # 6.28 rad per revolution in the driver is itself 0.05% short of 2 pi
+    assert edges < 0.005
+
+@pytest.mark.parametrize('pwm', [3, 10, 30, 60, 100])
+def test_never_worse_than_counts(sim, pwm):
+    counts, edges = Wheel(sim).run(pwm)
+    assert edges <= counts + 1e-9
+
+def test_counts_used_at_speed(sim):
+    wheel = Wheel(sim)
+    wheel.run(60, samples=1)
+    assert abs(wheel.edges.get_delta()) >= encoder_driver.SWITCH_COUNTS
+    assert wheel.edges.get_velocity() == wheel.counts.get_velocity()
+
+def test_slowing_and_stopping(sim):
+    wheel = Wheel(sim)
+    wheel.run(10)
+    wheel.mot.set_duty(0)
+    speeds = []
+    for _ in range(60):
+        sim.advance(PERIOD_US)
+        wheel.edges.update()
+        speeds.append(wheel.edges.get_velocity())
+    assert all(new <= old for old, new in zip(speeds, speeds[1:]))
+    assert speeds[-1] == 0.0
+    # Starting off again falls back on counts until an edge period is measured
+    counts, edges = wheel.run(6)
+    assert edges < 0.005
+
+def test_no_capture_wiring_falls_back_to_counts(sim):
+    wheel = Wheel(sim, capture_pin=Pin.cpu.C0)
+    wheel.run(6, samples=5)
+    assert wheel.edges.get_velocity() == wheel.counts.get_velocity()
+
+def test_position_unchanged_by_capture(sim):
+    wheel = Wheel(sim)
+    wheel.run(20)
+    assert wheel.edges.get_position_radians() == wheel.counts.get_position_radians()
+
+
+def stall(sim, seconds, counts_per_second):
+    '''!@brief    Turns the left wheel faster than the motors can, as a
+                  higher resolution encoder would count, while no task runs.
+    '''
+    for _ in range(int(seconds * 1000)):
+        sim.counts[0] += counts_per_second / 1000
+        sim.advance(1000)
+
+def test_sampler_keeps_counts_through_stall(sim):
+    plain = encoder_driver.Encoder(Timer(3, period=65535, prescaler=0), Pin.cpu.B4, Pin.cpu.B5)
+    sampled = encoder_driver.Encoder(Timer(3, period=65535, prescaler=0), Pin.cpu.B4, Pin.cpu.B5)
+    sampler = encoder_driver.EncoderSampler((sampled,), timer=16, freq=200)
+    sampler.start()
+    plain.update()
+    sampled.update()
+    stall(sim, 5.0, 10000)
+    plain.update()
+    sampled.update()
+    assert sampled.position == 50000
+    assert sampled.get_delta() == 50000
+    # Without the sampler the counter wrapped the wrong way
+    assert plain.position == 50000 - 65536
+    assert sampler.snapshot()[1] == 50000
+
+def test_snapshot_is_consistent(sim):
+    encoders = (encoder_driver.Encoder(Timer(3, period=65535, prescaler=0), Pin.cpu.B4, Pin.cpu.B5),
+                encoder_driver.Encoder(Timer(2, period=65535, prescaler=0), Pin.cpu.A0, Pin.cpu.A1))
+    sampler = encoder_driver.EncoderSampler(encoders, timer=16, freq=200)
+    sampler.start()
+    sim.counts[1] -= 40
+    times = []
+    for _ in range(4):
+        sim.counts[0] += 25
+        sim.advance(5000)
+        values = sampler.snapshot()
+        times.append(values[0])
+        assert values[1] == math.floor(sim.counts[0])
+    assert [b - a for a, b in zip(times, times[1:])] == [5000, 5000, 5000]
+    assert list(values[1:]) == [100, 25, -40, 0]
+    assert values is sampler.snapshot()
+
+def test_sampled_velocity_uses_sample_times(sim):
+    wheel = Wheel(sim)
+    sampler = encoder_driver.EncoderSampler((wheel.counts,), timer=16, freq=200)
+    sampler.start()
+    wheel.mot.set_duty(50)
+    sim.advance(600000)
+    wheel.counts.update()
+    # Late task runs don't change the velocity, only which samples it spans
+    for late in (0, 3000, 1000, 4500):
+        sim.advance(PERIOD_US + late)
+        wheel.counts.update()
+        assert wheel.counts.get_velocity() == pytest.approx(sim.omega[0], rel=0.03)
+
+def test_stop_hands_back_counter(sim):
+    enc = encoder_driver.Encoder(Timer(3, period=65535, prescaler=0), Pin.cpu.B4, Pin.cpu.B5)
+    sampler = encoder_driver.EncoderSampler((enc,), timer=16, freq=200)
+    sampler.start()
+    sim.counts[0] += 30
+    sim.advance(10000)
+    sampler.stop()
+    sim.counts[0] += 30
+    sim.advance(10000)
+    enc.update()
+    assert enc.position == 60
+
+def test_zero_during_sampling(sim):
+    enc = encoder_driver.Encoder(Timer(3, period=65535, prescaler=0), Pin.cpu.B4, Pin.cpu.B5)
+    encoder_driver.EncoderSampler((enc,), timer=16, freq=200).start()
+    sim.counts[0] += 30
+    sim.advance(10000)
+    enc.update()
+    enc.zero()
+    sim.counts[0] += 10
+    sim.advance(10000)
+    enc.update()
+    assert (enc.position, enc.get_delta()) == (10, 10)
@@ -0,0 +1,39 @@
+'''!@file     test_gain_sweep.py
+    @brief    Host tests of the batch gain sweep's step response metrics.
+'''
+import warnings
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+import gain_sweep
+
+
+def test_example_grid_reaches_setpoint():
+    kp, ki, kd = gain_sweep.grid(np.linspace(0.5, 8, 20),
+                                 np.linspace(0, 30, 20), [0.0])
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        results = gain_sweep.sweep(kp, ki, kd, setpoint=4.4)
+    assert np.isfinite(results['rise_time']).mean() > 0.9
+
+def test_negative_step_matches_positive_step():
+    kp, ki, kd = gain_sweep.grid([2.0, 6.0], [5.0, 20.0], [0.0])
+    up = gain_sweep.sweep(kp, ki, kd, setpoint=4.4, counts_per_rev=None)
+    down = gain_sweep.sweep(kp, ki, kd, setpoint=-4.4, counts_per_rev=None)
+    assert np.all(down['rise_time'] > 0)
+    assert np.allclose(up['rise_time'], down['rise_time'])
+    assert np.allclose(up['overshoot'], down['overshoot'])
+
+def test_step_down_to_zero():
+    trace = np.concatenate((np.full(300, 4.4), np.zeros(300)))
+    results = gain_sweep.sweep([8.0], [20.0], [0.0], setpoint=trace)
+    assert np.isfinite(results['rise_time']).all()
+    assert np.isfinite(results['overshoot']).all()
+
+def test_no_step():
+    results = gain_sweep.sweep([3.5], [2.75], [0.0], setpoint=0.0)
+    assert np.isnan(results['rise_time']).all()
+    assert np.isnan(results['overshoot']).all()
+    assert results['ss_error'][0] == 0.0
@@ -0,0 +1,276 @@
+'''!@file     test_imu.py
+    @brief    Host tests of the BNO055 driver against the simulated IMU.
+'''
+import math
+from array import array
+
+import pytest
+
+import IMU_driver
+import romi_sim
+
+
+@pytest.fixture
+def imu(sim):
+    '''!@brief    A BNO055 driver on the simulated bus, with the robot turning.'''
+    sim.theta = 0.6
+    sim.omega = [1.0, 3.0]
+    return IMU_driver.BNO055()
+
+def test_block_matches_single_reads(sim, imu):
+    data = imu.read_block(IMU_driver.GYRO | IMU_driver.EULER | IMU_driver.QUAT)
+    assert data[IMU_driver.YAW_RATE] == pytest.approx(imu.read_yaw())
+    assert data[IMU_driver.HEADING] == pytest.approx(imu.read_heading())
+    assert data[IMU_driver.QUAT_W] == pytest.approx(math.cos(0.3), abs=1e-4)
+    assert data[IMU_driver.QUAT_Z] == pytest.approx(math.sin(0.3), abs=1e-4)
+
+def test_one_transaction_instead_of_two(imu):
+    bus = imu.i2c
+    imu.read_yaw()
+    imu.read_heading()
+    separate = (bus.transactions, bus.bytes_read)
+
+    bus.transactions = bus.bytes_read = 0
+    imu.read_block(IMU_driver.GYRO | IMU_driver.EULER)
+    assert (bus.transactions, bus.bytes_read) == (1, 12)
+    assert separate == (2, 4)
+
+def test_reads_only_the_span_needed(imu):
+    bus = imu.i2c
+    for fields, size in ((IMU_driver.EULER, 6), (IMU_driver.QUAT, 8),
+                         (IMU_driver.EULER | IMU_driver.QUAT, 14),
+                         (IMU_driver.GYRO | IMU_driver.LIA, 26)):
+        bus.bytes_read = 0
+        imu.read_block(fields)
+        assert bus.bytes_read == size
+
+def test_reuses_its_buffers(imu):
+    first = imu.read_block()
+    spans = dict(imu.spans)
+    assert imu.read_block() is first
+    assert imu.spans == spans
+
+def test_other_fields_left_alone(sim, imu):
+    heading = imu.read_block(IMU_driver.EULER)[IMU_driver.HEADING]
+    sim.theta = -1.0
+    data = imu.read_block(IMU_driver.GYRO)
+    assert data[IMU_driver.HEADING] == heading
+
+def test_timed_samples_are_evenly_spaced(sim, imu):
+    imu.start_sampling(freq=100, size=128)
+    sim.advance(1000000)
+    out = array('f', [0.0] * IMU_driver.NUM_VALUES)
+    stamps = []
+    while True:
+        stamp = imu.get_sample(out)
+        if stamp is None:
+            break
+        stamps.append(stamp)
+    assert len(stamps) == 100
+    assert all(b - a == 10000 for a, b in zip(stamps, stamps[1:]))
+    assert imu.overflows == 0 and imu.missed == 0
+
+def test_data_is_freshest_sample(sim, imu):
+    imu.start_sampling(freq=100)
+    sim.advance(50000)
+    assert imu.sample_time == 50000
+    assert imu.data[IMU_driver.YAW_RATE] == pytest.approx(sim.yaw_rate(), abs=0.002)
+
+def test_full_ring_keeps_newest(sim, imu):
+    imu.start_sampling(freq=100, size=8)
+    sim.advance(200000)
+    assert imu.available() == 8
+    assert imu.overflows == 12
+    out = array('f', [0.0] * IMU_driver.NUM_VALUES)
+    stamps = [imu.get_sample(out) for _ in range(9)]
+    assert stamps[:8] == [130000 + 10000 * n for n in range(8)]
+    assert stamps[8] is None
+
+def test_reads_waiting_to_run_are_not_doubled(sim, imu, monkeypatch):
+    queued = []
+    monkeypatch.setattr(IMU_driver.micropython, 'schedule',
+                        lambda fun, arg: queued.append((fun, arg)))
+    imu.start_sampling(freq=100)
+    sim.advance(45000)
+    assert len(queued) == 1
+    assert imu.missed == 3
+    fun, arg = queued.pop()
+    fun(arg)
+    sim.advance(10000)
+    assert len(queued) == 1
+    assert imu.available() == 1
+
+def test_latest_is_newest_whole_sample(sim, imu):
+    out = array('f', [0.0] * IMU_driver.NUM_VALUES)
+    imu.start_sampling(freq=100, size=4)
+    assert imu.latest(out) is None
+    sim.advance(70000)
+    assert imu.latest(out) == 70000
+    assert list(out) == list(imu.data)
+    assert imu.available() == 4
+
+def test_latest_copies_again_if_overwritten(sim, imu):
+    out = array('f', [0.0] * IMU_driver.NUM_VALUES)
+    imu.start_sampling(freq=100, size=4)
+    sim.advance(10000)
+    samples = imu.samples
+
+    class Interrupted(array):
+        '''!@brief    Ring storage which has the whole ring written over while
+                      the first value is being copied.
+        '''
+        def __getitem__(self, index):
+            if sim.now_us < 60000:
+                sim.advance(50000)
+            return array.__getitem__(self, index)
+
+    imu.samples = Interrupted('f', samples)
+    assert imu.latest(out) == 60000
+    assert list(out) == list(imu.data)
+
+def test_stop_sampling(sim, imu):
+    imu.start_sampling(freq=100)
+    sim.advance(30000)
+    imu.stop_sampling()
+    sim.advance(30000)
+    assert imu.available() == 3
+
+def test_read_quaternion(sim, imu):
+    w, x, y, z = imu.read_quaternion()
+    assert (w, z) == (pytest.approx(math.cos(0.3), abs=1e-4),
+                      pytest.approx(math.sin(0.3), abs=1e-4))
+    assert x == y == 0.0
+
+def test_unwrapped_heading_follows_turns(sim, imu):
+    # Spin two and a half times clockwise, then back counterclockwise
+    sim.theta = 0.0
+    turns = [-0.04] * 400 + [0.03] * 200
+    for step in turns:
+        sim.theta += step
+        data = imu.read_block(IMU_driver.QUAT)
+        assert data[IMU_driver.UNWRAPPED_HEADING] == pytest.approx(
+            -math.degrees(sim.theta), abs=0.05)
+    assert data[IMU_driver.UNWRAPPED_HEADING] > 360
+
+def test_unwrapped_heading_starts_at_euler_heading(sim, imu):
+    sim.theta = -2.0
+    data = imu.read_block(IMU_driver.EULER | IMU_driver.QUAT)
+    assert data[IMU_driver.UNWRAPPED_HEADING] == pytest.approx(data[IMU_driver.HEADING], abs=0.1)
+
+def test_big_turn_between_readings(sim, imu):
+    sim.theta = 0.0
+    imu.read_block(IMU_driver.QUAT)
+    sim.theta = 2.5
+    data = imu.read_block(IMU_driver.QUAT)
+    assert data[IMU_driver.UNWRAPPED_HEADING] == pytest.approx(-math.degrees(2.5), abs=0.05)
+
+def step(sim, gen):
+    '''!@brief    Runs a generator every 20 ms until it finishes.
+        @return   Its return value
+    '''
+    while True:
+        try:
+            next(gen)
+        except StopIteration as done:
+            return done.value
+        sim.advance(20000)
+        assert sim.now_us < 120000000
+
+def boot(sim, imu, filename, **kwargs):
+    '''!@brief    Boots the IMU, then follows its calibration until it finishes.
+        @return   The time taken to calibrate in milliseconds
+    '''
+    step(sim, imu.boot(filename=filename))
+    return step(sim, imu.calibrate(filename=filename, **kwargs))
+
+@pytest.fixture
+def profile(tmp_path):
+    '''!@brief    Name of a calibration profile file which doesn't exist yet.'''
+    return str(tmp_path / 'imu_cal.bin')
+
+def test_boot_without_profile_calibrates_live_and_saves(sim, profile):
+    sim.imu_calibration_us = 8000000
+    imu = IMU_driver.BNO055()
+    elapsed = boot(sim, imu, filename=profile)
+    assert 8000 <= elapsed < 8100
+    assert not imu.profile_accepted
+    assert imu.mode == IMU_driver.NDOF_MODE
+    with open(profile, 'rb') as file:
+        assert file.read() == sim.imu_profile
+
+def test_boot_with_saved_profile_is_fast(sim, profile):
+    with open(profile, 'wb') as file:
+        file.write(sim.imu_profile)
+    sim.imu_calibration_us = 8000000
+    imu = IMU_driver.BNO055()
+    elapsed = boot(sim, imu, filename=profile)
+    assert elapsed < 250
+    assert imu.profile_accepted
+    assert imu.calibrated()
+
+def test_rejected_profile_falls_back_to_live(sim, profile):
+    with open(profile, 'wb') as file:
+        file.write(bytes(IMU_driver.CALIBRATION_SIZE))
+    sim.imu_calibration_us = 3000000
+    imu = IMU_driver.BNO055()
+    elapsed = boot(sim, imu, filename=profile, timeout=1000)
+    assert not imu.profile_accepted
+    # Timeout, reset and then a full live calibration
+    assert 1000 + 3000 + romi_sim.IMU_RESET_US // 1000 <= elapsed < 5000
+    with open(profile, 'rb') as file:
+        assert file.read() == sim.imu_profile
+
+def test_short_profile_is_ignored(sim, profile):
+    with open(profile, 'wb') as file:
+        file.write(sim.imu_profile[:10])
+    imu = IMU_driver.BNO055()
+    assert not imu.load_calibration(profile)
+    assert imu.mode == IMU_driver.NDOF_MODE
+
+def test_boot_and_calibrate_never_sleep(sim, profile, monkeypatch):
+    def sleep_ms(ms):
+        raise AssertionError('slept in a generator')
+    monkeypatch.setattr(IMU_driver, 'sleep_ms', sleep_ms)
+    with open(profile, 'wb') as file:
+        file.write(bytes(IMU_driver.CALIBRATION_SIZE))
+    sim.imu_calibration_us = 2000000
+    imu = IMU_driver.BNO055()
+    assert boot(sim, imu, filename=profile) is not None
+
+def test_live_calibration_wait_is_bounded(sim, profile):
+    sim.imu_calibration_us = math.inf
+    imu = IMU_driver.BNO055()
+    assert boot(sim, imu, filename=profile, limit=5000) is None
+    assert imu.calibration_time is None
+    assert 5000000 <= sim.now_us < 5200000
+    with pytest.raises(OSError):
+        open(profile, 'rb')
+
+def test_readings_go_on_while_calibrating(sim, profile):
+    with open(profile, 'wb') as file:
+        file.write(bytes(IMU_driver.CALIBRATION_SIZE))
+    sim.imu_calibration_us = 3000000
+    imu = IMU_driver.BNO055()
+    step(sim, imu.boot(filename=profile))
+    imu.start_sampling(freq=100, size=1024)
+    booted = sim.now_us
+    resets = []
+    write = imu.i2c.mem_write
+    def mem_write(data, addr, memaddr):
+        if memaddr == 0x3F:
+            resets.append(sim.now_us)
+        write(data, addr, memaddr)
+    imu.i2c.mem_write = mem_write
+    step(sim, imu.calibrate(filename=profile))
+    imu.stop_sampling()
+
+    out = array('f', [0.0] * IMU_driver.NUM_VALUES)
+    stamps = []
+    while imu.available():
+        stamps.append(imu.get_sample(out))
+    assert stamps[0] == booted + 10000
+    # Reads only stop while the IMU restarts, and the new profile is saved last
+    gaps = [b - a for a, b in zip(stamps, stamps[1:]) if b - a > 10000]
+    assert len(gaps) == 1
+    assert gaps[0] < (IMU_driver.RESET_MS + 3 * IMU_driver.MODE_SWITCH_MS) * 1000
+    assert not any(resets[0] < stamp < resets[0] + IMU_driver.RESET_MS * 1000 for stamp in stamps)
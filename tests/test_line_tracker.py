@@ -0,0 +1,136 @@
+'''!@file     test_line_tracker.py
+    @brief    Host replay tests of the line tracker on runs over a dashed line.
+    @details  Runs are recorded from the simulated robot weaving along a
+              straight dashed line: every line task period the centroid, the
+              wheel speed and the yaw rate the tasks would see are saved,
+              along with where the line really was under the sensor. The
+              tracker is then replayed over each run and its estimate in the
+              gaps between dashes compared with the truth.
+'''
+import math
+import random
+
+import pytest
+
+import line_tracker
+import romi_driver
+import romi_sim
+import QTR_driver
+from pyb import Pin, Timer
+
+## Period of the line following task in microseconds
+PERIOD_US = 30000
+
+## Length of each dash and of each gap between dashes, in inches
+DASH = 3.0
+GAP = 2.0
+
+
+def dashed_line(length=150.0):
+    '''!@brief    Makes a straight dashed line along +x starting under the sensor.'''
+    line = romi_sim.LineMap([(-10.0, 0.0), (length, 0.0)], closed=False)
+    line.segments = []
+    x = -10.0
+    while x < length:
+        end = min(x + DASH, length)
+        line.segments.append((x, 0.0, end - x, 0.0, 1.0 / (end - x) ** 2))
+        x = end + GAP
+    return line
+
+def record(weave=0.25, seconds=12.0, seed=1):
+    '''!@brief    Records a run of the simulated robot weaving along a dashed line.
+        @param    weave    Amplitude of the steering wobble, in rad/s of yaw rate
+                  seconds  Length of the run
+                  seed     Seed for the sensor and IMU noise
+        @return   A list of (dt, centroid, speed, yaw rate, true position) rows
+    '''
+    sim = romi_sim.install(romi_sim.Simulator(line=dashed_line(), seed=seed))
+    sim.y = 0.2
+    rng = random.Random(seed)
+    mot_A = romi_driver.Romi(Timer(1, freq=20000), Pin.cpu.B3, Pin.cpu.A7, Pin.cpu.A8)
+    mot_B = romi_driver.Romi(Timer(4, freq=20000), Pin.cpu.C7, Pin.cpu.B10, Pin.cpu.B6)
+    mot_A.enable()
+    mot_B.enable()
+    qtr = QTR_driver.QTRArray()
+    qtr.set_calibration([romi_sim.ADC_WHITE] * 6, [romi_sim.ADC_BLACK] * 6)
+    rows = []
+    while sim.now_us < seconds * 1000000:
+        centroid = qtr.read_centroid()
+        speed = romi_sim.WHEEL_RADIUS * sum(sim.omega) / 2 + rng.gauss(0, 0.05)
+        yaw_rate = round(sim.yaw_rate() * 900) / 900 + rng.gauss(0, 0.005)
+        sensor_y = sim.y + romi_sim.SENSOR_OFFSET * math.sin(sim.theta)
+        rows.append((PERIOD_US / 1000000, centroid, speed, yaw_rate,
+                     -sensor_y / math.cos(sim.theta)))
+
+        # Steer back towards the line, with a wobble so the robot doesn't
+        # settle onto it, using the true position so that the run doesn't
+        # depend on the tracker being tested
+        wobble = weave * math.sin(sim.now_us / 700000)
+        turn = 25 * (0.6 * rows[-1][4] - 0.3 * math.sin(sim.theta)) + 15 * wobble
+        mot_A.set_duty(25 - turn)
+        mot_B.set_duty(25 + turn)
+        sim.advance(PERIOD_US + rng.randint(-2000, 2000))
+    return rows
+
+def replay(tracker, rows):
+    '''!@brief    Runs a tracker over a recorded run.
+        @return   A list of (estimate, lost, centroid, true position) rows
+    '''
+    results = []
+    for dt, centroid, speed, yaw_rate, truth in rows:
+        estimate = tracker.update(centroid, speed, yaw_rate, dt)
+        results.append((estimate, tracker.lost(), centroid, truth))
+    return results
+
+def gap_errors(results):
+    '''!@brief    Finds errors in the gaps of the tracker and of holding the last reading.'''
+    tracked = []
+    held = []
+    last = None
+    for estimate, lost, centroid, truth in results:
+        if centroid is not None:
+            last = centroid
+        elif last is not None:
+            tracked.append(abs(estimate - truth))
+            held.append(abs(last - truth))
+    return tracked, held
+
+@pytest.fixture(scope='module', params=[0.3, 0.6])
+def run(request):
+    '''!@brief    A recorded run for each amount of weaving.'''
+    return record(weave=request.param)
+
+
+def test_run_has_gaps(run):
+    missing = sum(1 for row in run if row[1] is None)
+    assert 0.15 * len(run) < missing < 0.6 * len(run)
+
+def test_tracks_through_gaps(run):
+    tracked, held = gap_errors(replay(line_tracker.LineTracker(), run))
+    rms = math.sqrt(sum(e * e for e in tracked) / len(tracked))
+    held_rms = math.sqrt(sum(e * e for e in held) / len(held))
+    assert rms < 0.1
+    assert rms < 0.8 * held_rms
+
+def test_not_lost_in_short_gaps(run):
+    # The first gap comes while the robot is still speeding up and the
+    # tracker hasn't yet learned the line's direction, so skip past it
+    results = replay(line_tracker.LineTracker(), run)
+    assert not any(lost for _, lost, _, _ in results[20:])
+
+def test_lost_without_readings():
+    tracker = line_tracker.LineTracker()
+    tracker.reset(0.1)
+    for _ in range(100):
+        tracker.update(None, 5.0, 0.3, 0.03)
+    assert tracker.lost()
+    tracker.update(-0.2, 5.0, 0.0, 0.03)
+    assert not tracker.lost()
+    assert tracker.position == pytest.approx(-0.2, abs=0.01)
+
+def test_covariance_stays_positive(run):
+    tracker = line_tracker.LineTracker()
+    for dt, centroid, speed, yaw_rate, truth in run:
+        tracker.update(centroid, speed, yaw_rate, dt)
+        assert tracker.p_pp > 0 and tracker.p_aa > 0
+        assert tracker.p_pa * tracker.p_pa <= tracker.p_pp * tracker.p_aa
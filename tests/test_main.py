@@ -0,0 +1,59 @@
+'''!@file     test_main.py
+    @brief    Host tests of main.py's objects and tasks run together.
+    @details  main.py makes its hardware objects when it's imported, so each
+              test imports it afresh against a new simulator, with its tasks
+              added to a new task list.
+'''
+import math
+import sys
+
+import pytest
+
+import cotask
+import romi_sim
+
+
+@pytest.fixture
+def robot(sim, tmp_path, monkeypatch):
+    '''!@brief    A function which sets up main.py and returns the module.
+        @details  Calibration files are kept in a temporary folder. Changes
+                  to the simulator made before calling it, such as the
+                  robot's starting heading, are seen by main.py's objects.
+    '''
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(cotask, 'task_list', cotask.TaskList())
+    monkeypatch.delitem(sys.modules, 'main', raising=False)
+
+    def setup():
+        import main
+        main.create_tasks()
+        return main
+    yield setup
+    main = sys.modules.get('main')
+    if main is not None:
+        main.enc_sampler.stop()
+    sys.modules.pop('main', None)
+
+def test_odometry_heading_starts_from_robot_heading(sim, robot):
+    sim.theta = 2.0
+    main = robot()
+    sim.run(5.0)
+    assert main.imu_ready
+    turned = sim.theta - 2.0
+    assert abs(turned) > 0.3
+    assert main.share_theta.get() == pytest.approx(turned, abs=0.05)
+    distance = math.hypot(sim.x, sim.y)
+    assert math.hypot(main.share_x.get(), main.share_y.get()) == pytest.approx(distance, rel=0.05)
+
+def test_object_graph_shares_no_busy_timer(sim, robot):
+    main = robot()
+    sim.run(3.0)
+    # Every timer-paced part is still running at its own rate
+    assert main.enc_sampler.snapshot()[0] > sim.ticks_us() - 5000
+    rates = {timer.id: timer.freq() for timer in sim.timer_callbacks}
+    assert rates == {main.encoder_sample_timer: 200, main.imu_sample_timer: 100}
+    assert main.share_heading.get() == pytest.approx(sim.heading(), abs=1.0)
+    # Calibrating the line sensor from the REPL mid-run is safe too
+    main.calibrate_line_sensor(duration=100)
+    sim.run(0.5)
+    assert main.enc_sampler.snapshot()[0] > sim.ticks_us() - 5000
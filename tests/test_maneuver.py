@@ -0,0 +1,197 @@
+'''!@file     test_maneuver.py
+    @brief    Host tests of the non-blocking maneuver executor.
+'''
+import math
+
+import pytest
+
+import encoder_driver
+import maneuver
+import romi_driver
+import task_share
+from main import BUMP_MANEUVER
+from pyb import Pin, Timer
+
+## Time between runs of the maneuver task in the tests, in microseconds
+PERIOD_US = 10000
+
+
+@pytest.fixture
+def nav(sim):
+    '''!@brief    A maneuver executor driving the simulated motors.'''
+    mot_A = romi_driver.Romi(Timer(1, freq=20000), Pin.cpu.B3, Pin.cpu.A7, Pin.cpu.A8)
+    mot_B = romi_driver.Romi(Timer(4, freq=20000), Pin.cpu.C7, Pin.cpu.B10, Pin.cpu.B6)
+    mot_A.enable()
+    mot_B.enable()
+    progress = task_share.Share('h', thread_protect=False, name='Progress')
+    heading = task_share.Share('f', thread_protect=False, name='Heading')
+    heading.put(0.0)
+    return maneuver.Maneuver(mot_A, mot_B, progress, heading)
+
+@pytest.fixture
+def closed(sim, nav):
+    '''!@brief    The maneuver executor with encoders feeding its position shares.'''
+    nav.position_A = task_share.Share('f', thread_protect=False, name='Position_A')
+    nav.position_B = task_share.Share('f', thread_protect=False, name='Position_B')
+    nav.encoders = (encoder_driver.Encoder(Timer(3, period=65535, prescaler=0), Pin.cpu.B4, Pin.cpu.B5),
+                    encoder_driver.Encoder(Timer(2, period=65535, prescaler=0), Pin.cpu.A0, Pin.cpu.A1))
+    return nav
+
+def sense(sim, nav):
+    '''!@brief    Updates the heading and position shares from the simulated robot,
+                  as the IMU and motor tasks would.
+    '''
+    nav.heading.put(-math.degrees(sim.theta))
+    for enc, share in zip(nav.encoders, (nav.position_A, nav.position_B)):
+        enc.update()
+        share.put(enc.get_position_radians())
+
+def run_closed(sim, nav, limit_us=20000000):
+    '''!@brief    Runs the maneuver task with its sensors until it finishes.'''
+    gen = nav.run()
+    while nav.busy():
+        sense(sim, nav)
+        next(gen)
+        sim.advance(PERIOD_US)
+        assert sim.now_us < limit_us
+    # Let the robot coast to a stop
+    sim.advance(500000)
+
+def step(sim, gen, count=1):
+    '''!@brief    Runs the maneuver task a number of times, one period apart.'''
+    for _ in range(count):
+        next(gen)
+        sim.advance(PERIOD_US)
+
+def duties(sim):
+    '''!@brief    Returns the signed PWM applied to each simulated motor.'''
+    return (sim._effort(0), sim._effort(1))
+
+
+def test_idle_until_started(sim, nav):
+    gen = nav.run()
+    step(sim, gen, 5)
+    assert not nav.busy()
+    assert nav.progress.get() == maneuver.IDLE
+    assert duties(sim) == (0, 0)
+
+def test_timed_segments_run_in_order(sim, nav):
+    gen = nav.run()
+    nav.start(((20, 22, 100), (-20, 22, 250)))
+    assert nav.busy() and nav.progress.get() == 0
+
+    seen = []
+    while nav.busy():
+        next(gen)
+        seen.append((sim.now_us // 1000, nav.progress.get(), duties(sim)))
+        sim.advance(PERIOD_US)
+        assert sim.now_us < 1000000
+
+    assert seen[0] == (0, 0, (20, 22))
+    switch = next(t for t, index, _ in seen if index == 1)
+    end = next(t for t, index, _ in seen if index == maneuver.IDLE)
+    assert switch == 100
+    assert (-20, 22) in [d for _, index, d in seen if index == 1]
+    assert end == 350
+    assert nav.progress.get() == maneuver.IDLE
+    assert duties(sim) == (0, 0)
+
+def test_timed_segments_do_not_accumulate_lateness(sim, nav):
+    gen = nav.run()
+    nav.start(((20, 20, 25),) * 8)
+    end = None
+    while nav.busy():
+        next(gen)
+        if not nav.busy():
+            end = sim.now_us // 1000
+        sim.advance(PERIOD_US)
+    # Each 25 ms segment is noticed up to 10 ms late, but the next one
+    # starts from the scheduled end, so the whole maneuver still ends on time
+    assert end == 200
+
+def test_heading_segment_ends_at_heading(sim, nav):
+    gen = nav.run()
+    nav.start(((-20, 20, 5000, 90.0, 5.0), (20, 20, 50)))
+    step(sim, gen, 10)
+    assert nav.progress.get() == 0
+    nav.heading.put(80.0)
+    step(sim, gen, 3)
+    assert nav.progress.get() == 0
+    nav.heading.put(87.0)
+    step(sim, gen)
+    assert nav.progress.get() == 1
+    assert duties(sim) == (20, 20)
+
+def test_heading_segment_wraps_around(sim, nav):
+    gen = nav.run()
+    nav.heading.put(350.0)
+    nav.start(((20, -20, 5000, 2.0, 5.0),))
+    step(sim, gen, 2)
+    assert nav.busy()
+    nav.heading.put(359.0)
+    step(sim, gen)
+    assert not nav.busy()
+
+def test_heading_segment_times_out(sim, nav):
+    gen = nav.run()
+    nav.start(((-20, 20, 300, 90.0, 5.0),))
+    step(sim, gen, 29)
+    assert nav.busy()
+    step(sim, gen, 3)
+    assert not nav.busy()
+
+def test_stop_abandons_maneuver(sim, nav):
+    gen = nav.run()
+    nav.start(((20, 20, 1000),))
+    step(sim, gen, 3)
+    assert duties(sim) == (20, 20)
+    nav.stop()
+    step(sim, gen, 3)
+    assert not nav.busy()
+    assert nav.progress.get() == maneuver.IDLE
+    assert duties(sim) == (0, 0)
+
+def test_turn_reaches_heading(sim, closed):
+    closed.start((maneuver.turn(90),))
+    run_closed(sim, closed)
+    (index, elapsed, error), = closed.results
+    assert abs(error) <= 2.0
+    assert 0 < elapsed < 3000
+    assert -math.degrees(sim.theta) == pytest.approx(90, abs=4)
+
+def test_turns_do_not_build_up_error(sim, closed):
+    closed.start((maneuver.turn(-90),) * 8)
+    run_closed(sim, closed)
+    assert len(closed.results) == 8
+    assert -math.degrees(sim.theta) == pytest.approx(-720, abs=4)
+
+def test_drive_reaches_distance_and_holds_heading(sim, closed):
+    sim.theta = 0.1
+    closed.heading.put(-math.degrees(sim.theta))
+    closed.start((maneuver.drive(12.0),))
+    run_closed(sim, closed)
+    (index, elapsed, error), = closed.results
+    assert abs(error) <= 0.25
+    assert math.hypot(sim.x, sim.y) == pytest.approx(12.0, abs=0.5)
+    assert sim.theta == pytest.approx(0.1, abs=math.radians(3))
+
+def test_reverse(sim, closed):
+    closed.start((maneuver.drive(-2.0),))
+    run_closed(sim, closed)
+    assert sim.x == pytest.approx(-2.0, abs=0.3)
+
+def test_timed_out_segment_reports_error(sim, closed):
+    closed.start((maneuver.drive(50.0, timeout=500), (20, 20, 100)))
+    run_closed(sim, closed)
+    (index, elapsed, error), = closed.results
+    assert elapsed == 500
+    assert error > 40
+
+def test_bump_maneuver_comes_back_to_line(sim, closed):
+    closed.start(BUMP_MANEUVER)
+    run_closed(sim, closed)
+    assert len(closed.results) == len(BUMP_MANEUVER)
+    # Around the obstacle and back onto the line, facing the same way
+    assert sim.y == pytest.approx(0.0, abs=0.75)
+    assert sim.x > 5.0
+    assert math.degrees(sim.theta) == pytest.approx(0.0, abs=4)
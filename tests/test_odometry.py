@@ -0,0 +1,139 @@
+'''!@file     test_odometry.py
+    @brief    Host tests of dead reckoning against the simulated robot's true pose.
+'''
+import math
+
+import pytest
+
+import encoder_driver
+import maneuver
+import odometry
+import romi_driver
+import task_share
+from pyb import Pin, Timer
+
+## Period of the motor task, which the odometry task runs at, in microseconds
+PERIOD_US = 17500
+
+
+class Robot:
+    '''!@brief    The simulated robot's motors and encoders, and the shares the
+                  motor and IMU tasks would publish from them.
+    '''
+    def __init__(self, sim, alpha=0.98, ready=None):
+        self.sim = sim
+        self.mot_A = romi_driver.Romi(Timer(1, freq=20000), Pin.cpu.B3, Pin.cpu.A7, Pin.cpu.A8)
+        self.mot_B = romi_driver.Romi(Timer(4, freq=20000), Pin.cpu.C7, Pin.cpu.B10, Pin.cpu.B6)
+        self.mot_A.enable()
+        self.mot_B.enable()
+        self.enc_A = encoder_driver.Encoder(Timer(3, period=65535, prescaler=0), Pin.cpu.B4, Pin.cpu.B5)
+        self.enc_B = encoder_driver.Encoder(Timer(2, period=65535, prescaler=0), Pin.cpu.A0, Pin.cpu.A1)
+        names = ('position_A', 'position_B', 'heading', 'x', 'y', 'theta', 'progress')
+        for name in names:
+            setattr(self, name, task_share.Share('h' if name == 'progress' else 'f',
+                                                 thread_protect=False, name=name))
+        # The IMU heading doesn't start at zero
+        self.imu_offset = 237.0
+        self.slip = 0.0
+        self.sense()
+        self.odo = odometry.Odometry(self.position_A, self.position_B, self.heading,
+                                     self.x, self.y, self.theta, alpha=alpha, ready=ready)
+        self.nav = maneuver.Maneuver(self.mot_A, self.mot_B, self.progress, self.heading,
+                                     self.position_A, self.position_B)
+
+    def sense(self):
+        '''!@brief    Publishes the wheel positions and IMU heading.'''
+        self.enc_A.update()
+        self.enc_B.update()
+        self.position_A.put(self.enc_A.get_position_radians() + self.slip)
+        self.position_B.put(self.enc_B.get_position_radians())
+        self.heading.put(self.imu_offset - math.degrees(self.sim.theta))
+
+    def drive(self, left, right, seconds):
+        '''!@brief    Drives with fixed PWM, updating the odometry every period.'''
+        self.mot_A.set_duty(left)
+        self.mot_B.set_duty(right)
+        end = self.sim.now_us + int(seconds * 1000000)
+        while self.sim.now_us < end:
+            self.step()
+
+    def step(self):
+        '''!@brief    Moves on a period, then runs the sensors and the odometry.'''
+        self.sim.advance(PERIOD_US)
+        self.sense()
+        self.odo.update()
+
+    def error(self):
+        '''!@brief    Returns the position error in inches and heading error in radians.'''
+        return (math.hypot(self.x.get() - self.sim.x, self.y.get() - self.sim.y),
+                abs(self.theta.get() - self.sim.theta))
+
+
+def test_follows_a_winding_path(sim):
+    robot = Robot(sim)
+    for left, right in ((25, 25), (15, 30), (30, 30), (30, 12), (-20, 20), (25, 25)):
+        robot.drive(left, right, 1.5)
+        position, heading = robot.error()
+        assert position < 0.3
+        assert heading < math.radians(1)
+
+def test_imu_corrects_wheel_slip(sim):
+    # One wheel's encoder reads 10% more than it turned
+    robots = {}
+    for alpha in (1.0, 0.98):
+        sim = __import__('romi_sim').install()
+        robot = Robot(sim, alpha=alpha)
+        robot.mot_A.set_duty(25)
+        robot.mot_B.set_duty(25)
+        for _ in range(200):
+            robot.slip = 0.1 * robot.enc_A.get_position_radians()
+            robot.step()
+        robots[alpha] = robot.error()
+    assert robots[0.98][1] < 0.3 * robots[1.0][1]
+    assert robots[0.98][0] < 0.5 * robots[1.0][0]
+
+def test_waits_for_imu(sim):
+    state = {'ready': False}
+    robot = Robot(sim, ready=lambda: state['ready'])
+    robot.heading.put(0.0)
+    robot.drive(15, 30, 1.0)
+    before = robot.theta.get()
+    state['ready'] = True
+    robot.step()
+    assert robot.theta.get() == pytest.approx(before, abs=0.02)
+    robot.drive(15, 30, 1.0)
+    assert robot.error()[1] < math.radians(1)
+
+def test_publishes_every_update(sim):
+    robot = Robot(sim)
+    robot.odo.reset()
+    assert (robot.x.get(), robot.y.get(), robot.theta.get()) == (0.0, 0.0, 0.0)
+    robot.drive(25, 25, 0.5)
+    assert robot.x.get() == pytest.approx(sim.x, abs=0.1)
+
+def test_return_to_start_by_pose(sim):
+    import main
+    robot = Robot(sim)
+    robot.drive(25, 25, 2.0)
+    robot.drive(10, 30, 1.0)
+    robot.drive(25, 25, 1.5)
+    robot.mot_A.set_duty(0)
+    robot.mot_B.set_duty(0)
+    for _ in range(30):
+        robot.step()
+    assert math.hypot(sim.x, sim.y) > 10
+
+    # The return segments are worked out from main's pose shares
+    for name in ('x', 'y', 'theta'):
+        getattr(main, 'share_' + name).put(getattr(robot, name).get())
+    robot.nav.start(main.return_maneuver())
+    gen = robot.nav.run()
+    while robot.nav.busy():
+        robot.sense()
+        robot.odo.update()
+        next(gen)
+        sim.advance(PERIOD_US)
+        assert sim.now_us < 30000000
+    assert math.hypot(sim.x, sim.y) < 1.0
+    assert math.degrees(sim.theta) % 360 == pytest.approx(0, abs=4) or \
+        math.degrees(sim.theta) % 360 == pytest.approx(360, abs=4)
@@ -0,0 +1,33 @@
+'''!@file     test_romi_sim.py
+    @brief    Host tests of the simulator's stand-ins for the hardware.
+'''
+import pytest
+
+import QTR_driver
+import encoder_driver
+from pyb import Pin, Timer
+
+
+def test_timer_in_use_by_a_callback_cannot_be_set_up_again(sim):
+    enc = encoder_driver.Encoder(Timer(3, period=65535, prescaler=0), Pin.cpu.B4, Pin.cpu.B5)
+    encoder_driver.EncoderSampler((enc,), timer=6, freq=200).start()
+    with pytest.raises(ValueError):
+        QTR_driver.QTRArray(oversample=4, timer=6)
+    with pytest.raises(ValueError):
+        Timer(6, freq=200).callback(lambda tim: None)
+    # The same settings, and other timers, are fine
+    Timer(6, freq=200)
+    QTR_driver.QTRArray(oversample=4, timer=8)
+
+def test_timed_read_on_a_timer_set_up_again(sim):
+    qtr = QTR_driver.QTRArray(oversample=4, timer=6)
+    qtr.read()
+    Timer(6, freq=200)
+    with pytest.raises(ValueError):
+        qtr.read()
+
+def test_timer_can_be_reused_once_its_callback_stops(sim):
+    timer = Timer(6, freq=200)
+    timer.callback(lambda tim: None)
+    timer.callback(None)
+    Timer(6, freq=20000).callback(lambda tim: None)
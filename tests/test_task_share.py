@@ -0,0 +1,231 @@
+'''!@file     test_task_share.py
+    @brief    Host tests of the shares and queues in task_share.py.
+'''
+import array
+
+import pytest
+
+import task_share
+
+
+class CountingIRQ:
+    '''!@brief    Stand-in for pyb's interrupt control which counts the
+                  windows with interrupts disabled.
+    '''
+    def __init__(self, monkeypatch):
+        self.windows = 0
+        self.disabled = False
+        monkeypatch.setattr(task_share.pyb, 'disable_irq', self.disable_irq)
+        monkeypatch.setattr(task_share.pyb, 'enable_irq', self.enable_irq)
+
+    def disable_irq(self):
+        assert not self.disabled
+        self.disabled = True
+        self.windows += 1
+        return True
+
+    def enable_irq(self, state=True):
+        self.disabled = False
+
+
+@pytest.fixture
+def irq(monkeypatch):
+    return CountingIRQ(monkeypatch)
+
+
+def test_multishare_round_trip(irq):
+    share = task_share.MultiShare('f', 3, name="Wheel")
+    share.put(array.array('f', [1.5, -2.25, 3.0]))
+    out = array.array('f', [0.0] * 3)
+    assert share.get_into(out) is out
+    assert list(out) == [1.5, -2.25, 3.0]
+    assert irq.windows == 2
+
+def test_multishare_items(irq):
+    share = task_share.MultiShare('l', 4)
+    share.put_item(2, 70000)
+    assert [share.get(i) for i in range(4)] == [0, 0, 70000, 0]
+    assert irq.windows == 5
+
+def test_multishare_in_isr_leaves_interrupts_alone(irq):
+    share = task_share.MultiShare('h', 2)
+    share.put(array.array('h', [3, 4]), True)
+    assert share.get(1, True) == 4
+    assert irq.windows == 0
+
+def test_multishare_unprotected(irq):
+    share = task_share.MultiShare('h', 2, thread_protect=False)
+    share.put(array.array('h', [5, 6]))
+    assert list(share.get_into(array.array('h', [0, 0]))) == [5, 6]
+    assert irq.windows == 0
+
+def test_multishare_put_needs_matching_array():
+    share = task_share.MultiShare('l', 3)
+    with pytest.raises(ValueError):
+        share.put(array.array('l', [1, 2]))
+    assert list(share._buffer) == [0, 0, 0]
+
+def test_multishare_repr():
+    share = task_share.MultiShare('l', 5, name="Samples")
+    assert 'MultiShare<int32>[5]' in repr(share)
+    assert share in task_share.share_list
+
+def test_record_round_trip(irq):
+    record = task_share.Record('<lffff', name="Motors")
+    assert record.get() == (0, 0.0, 0.0, 0.0, 0.0)
+    record.put(123456, 1.5, -2.0, 3.25, 0.5)
+    assert record.get() == (123456, 1.5, -2.0, 3.25, 0.5)
+    assert record.sequence() == 1
+    # The sequence lock stands in for disabling interrupts
+    assert irq.windows == 0
+
+def test_record_rereads_when_written_during_read(monkeypatch):
+    record = task_share.Record('<hh')
+    record.put(1, 1)
+    reads = []
+    unpack_from = task_share.struct.unpack_from
+
+    def interrupted(fmt, buffer, offset):
+        values = unpack_from(fmt, buffer, offset)
+        if not reads:
+            # A scheduled callback writes while the first read is copying
+            record.put(2, 2)
+        reads.append(values)
+        return values
+
+    monkeypatch.setattr(task_share.struct, 'unpack_from', interrupted)
+    assert record.get() == (2, 2)
+    assert len(reads) == 2
+
+def test_record_waits_out_a_write_in_progress(monkeypatch):
+    record = task_share.Record('<f')
+    seen = []
+    pack_into = task_share.struct.pack_into
+
+    def slow_write(fmt, buffer, offset, *values):
+        # A reader which runs halfway through the write sees an odd count
+        seen.append(record._seq & 1)
+        pack_into(fmt, buffer, offset, *values)
+
+    monkeypatch.setattr(task_share.struct, 'pack_into', slow_write)
+    record.put(4.0)
+    assert seen == [1]
+    assert record.get() == (4.0,)
+
+def test_record_repr():
+    record = task_share.Record('<ll', name="Pair")
+    record.put(1, 2)
+    assert 'Record<<ll> Writes 1' in repr(record)
+
+def contents(queue):
+    '''!@brief    Empties a queue one item at a time.'''
+    items = []
+    while queue.any():
+        items.append(queue.get())
+    return items
+
+def test_try_put_and_try_get():
+    queue = task_share.Queue('h', 2)
+    assert queue.try_get() is None
+    assert queue.try_get(default=-1) == -1
+    assert queue.try_put(1) and queue.try_put(2)
+    assert not queue.try_put(3)
+    assert queue.try_get() == 1
+    assert contents(queue) == [2]
+
+def test_put_many_wraps_around(irq):
+    queue = task_share.Queue('l', 5, thread_protect=True)
+    queue.put_many(array.array('l', [1, 2, 3]))
+    assert queue.get() == 1 and queue.get() == 2
+    assert queue.put_many(array.array('l', [4, 5, 6, 7])) == 4
+    assert irq.windows == 4
+    assert contents(queue) == [3, 4, 5, 6, 7]
+
+def test_put_many_stops_when_full():
+    queue = task_share.Queue('l', 4)
+    queue.put(0)
+    assert queue.put_many(array.array('l', range(1, 10))) == 3
+    assert contents(queue) == [0, 1, 2, 3]
+
+def test_put_many_overwrites_oldest():
+    queue = task_share.Queue('l', 4, overwrite=True)
+    queue.put_many(array.array('l', [1, 2, 3]))
+    assert queue.put_many(array.array('l', [4, 5])) == 2
+    assert contents(queue) == [2, 3, 4, 5]
+    assert queue.put_many(array.array('l', range(10, 20))) == 4
+    assert contents(queue) == [16, 17, 18, 19]
+
+def test_get_into_wraps_around(irq):
+    queue = task_share.Queue('f', 4, thread_protect=True)
+    queue.put_many(array.array('f', [1, 2, 3]))
+    queue.get()
+    queue.put_many(array.array('f', [4, 5]))
+    out = array.array('f', [0] * 6)
+    assert queue.get_into(out) == 4
+    assert list(out) == [2, 3, 4, 5, 0, 0]
+    assert queue.empty()
+    assert queue.get_into(out) == 0
+    # One window for each call, including the get()
+    assert irq.windows == 5
+
+def test_get_into_partial():
+    queue = task_share.Queue('h', 8)
+    queue.put_many(array.array('h', range(6)))
+    out = array.array('h', [0, 0, 0, 0])
+    assert queue.get_into(out) == 4
+    assert list(out) == [0, 1, 2, 3]
+    assert contents(queue) == [4, 5]
+
+def test_wait_get_yields_until_item(sim):
+    queue = task_share.Queue('h', 4)
+    waiting = queue.wait_get()
+    assert next(waiting) == 0
+    sim.advance(5000)
+    assert next(waiting) == 0
+    queue.put(7)
+    with pytest.raises(StopIteration) as stop:
+        next(waiting)
+    assert stop.value.value == 7
+
+def test_wait_get_times_out(sim):
+    queue = task_share.Queue('h', 4)
+    waiting = queue.wait_get(timeout=20)
+    yields = 0
+    with pytest.raises(StopIteration) as stop:
+        while True:
+            next(waiting)
+            yields += 1
+            sim.advance(5000)
+    assert stop.value.value is None
+    assert yields == 4
+
+def test_wait_put_in_a_task(sim):
+    queue = task_share.Queue('h', 1)
+    queue.put(1)
+    results = []
+
+    def producer():
+        results.append((yield from queue.wait_put(2, timeout=100)))
+        results.append((yield from queue.wait_put(3, timeout=10)))
+        while True:
+            yield 0
+
+    task = producer()
+    next(task)
+    sim.advance(1000)
+    assert queue.get() == 1
+    next(task)
+    for _ in range(3):
+        sim.advance(5000)
+        next(task)
+    assert results == [True, False]
+    assert contents(queue) == [2]
+
+def test_record_read_into():
+    record = task_share.Record('<hf')
+    record.put(-3, 2.5)
+    record.put(-4, 1.5)
+    frame = bytearray(2 + record.size())
+    assert record.read_into(memoryview(frame), 2) == 2
+    assert record.format() == '<hf' and record.size() == 6
+    assert task_share.struct.unpack_from('<hf', frame, 2) == (-4, 1.5)
@@ -0,0 +1,121 @@
+'''!@file     test_telemetry.py
+    @brief    Host tests of the binary telemetry frames and their decoder.
+'''
+import os
+import subprocess
+import sys
+
+import pytest
+
+import task_share
+import telemetry
+import telemetry_decode
+from pyb import UART
+
+
+@pytest.fixture
+def link(sim):
+    '''!@brief    A motor record streamed to a simulated UART.'''
+    record = task_share.Record(telemetry.MOTOR_FORMAT, name="Motors")
+    return record, telemetry.Telemetry(UART(1, 115200), record, frames=8, chunk=64)
+
+def stream(record, link, rows):
+    '''!@brief    Writes each row to the record and runs the link once per row,
+                  then sends whatever is left.
+    '''
+    for row in rows:
+        record.put(*row)
+        link.sample()
+        link.send()
+    while link.send():
+        pass
+    return bytes(link.uart.written)
+
+def rows(count):
+    return [(1000 * i, 0.5 * i, 1.25, -0.5 * i, -1.25) for i in range(count)]
+
+
+def test_crc_check_value():
+    assert telemetry.crc16(b'123456789', 0, 9) == 0x29B1
+
+def test_frame_layout(link):
+    record, tx = link
+    data = stream(record, tx, rows(1))
+    assert len(data) == tx.frame_size == 27
+    assert data[:2] == telemetry.SYNC
+    assert data[2:5] == bytes([0, 0, 20])
+    assert telemetry.crc16(data, 2, 25) == data[25] | (data[26] << 8)
+
+def test_round_trip(link):
+    record, tx = link
+    decoded, stats = telemetry_decode.decode(stream(record, tx, rows(50)))
+    assert decoded == rows(50)
+    assert (stats.frames, stats.lost_frames, stats.bad_crc, stats.skipped_bytes) == (50, 0, 0, 0)
+
+def test_only_new_records_are_framed(link):
+    record, tx = link
+    assert not tx.sample()
+    record.put(*rows(1)[0])
+    assert tx.sample()
+    assert not tx.sample()
+
+def test_send_is_limited_to_a_chunk(link):
+    record, tx = link
+    for row in rows(5):
+        record.put(*row)
+        tx.sample()
+    assert tx.send() == 64
+    assert tx.waiting == 3
+    assert tx.send() == 64
+    assert tx.send() == 5 * 27 - 128
+    assert tx.send() == 0
+
+def test_full_ring_drops_and_decoder_counts_gap(link):
+    record, tx = link
+    for row in rows(12):
+        record.put(*row)
+        tx.sample()
+    assert tx.dropped == 4
+    decoded, stats = telemetry_decode.decode(stream(record, tx, rows(14)[12:]))
+    # The ring was still full when the first of the later rows came
+    assert tx.dropped == 5
+    assert decoded == rows(8) + rows(14)[13:]
+    assert stats.lost_frames == 5
+
+def test_decoder_skips_text_and_damaged_frames(link):
+    record, tx = link
+    data = bytearray(stream(record, tx, rows(6)))
+    data[2 * 27 + 10] ^= 0xFF
+    data = b'IMU calibrated\r\n' + bytes(data[:3 * 27]) + b'\xa5Z\r\n' + bytes(data[3 * 27:])
+    decoded, stats = telemetry_decode.decode(data)
+    assert decoded == rows(2) + rows(6)[3:]
+    assert stats.bad_crc == 1
+    assert stats.lost_frames == 1
+
+def test_uart_which_takes_nothing(link):
+    record, tx = link
+    tx.uart.write = lambda buf: None
+    record.put(*rows(1)[0])
+    tx.sample()
+    assert tx.send() == 0
+    assert tx.waiting == 1
+
+def test_csv_and_numpy(link, tmp_path):
+    record, tx = link
+    decoded, _ = telemetry_decode.decode(stream(record, tx, rows(4)))
+    path = tmp_path / 'motors.csv'
+    telemetry_decode.write_csv(decoded, path)
+    lines = path.read_text().splitlines()
+    assert lines[0] == ','.join(telemetry.MOTOR_FIELDS)
+    assert lines[2] == '1000,0.5,1.25,-0.5,-1.25'
+    np = pytest.importorskip('numpy')
+    data = telemetry_decode.to_numpy(decoded)
+    assert np.allclose(data['position_B'], [0, -0.5, -1.0, -1.5])
+
+def test_decoder_leaves_host_modules_alone():
+    # Run in a new interpreter, where no simulator has been installed
+    check = ("import sys, time, telemetry_decode; "
+             "assert 'pyb' not in sys.modules and 'utime' not in sys.modules; "
+             "assert not hasattr(time, 'ticks_ms')")
+    folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run([sys.executable, '-c', check], cwd=folder, check=True)